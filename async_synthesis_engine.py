@@ -0,0 +1,170 @@
+"""
+非同步語音合成引擎模組
+以 client.aio.models.generate_content 為基礎，在專屬的事件迴圈執行緒中
+以號誌限制並行數並為每個工作設定逾時；預覽生成器、背景生成與命令列
+都可以將工作提交到同一個引擎
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+
+import tts_synthesis
+
+# 預設並行數與單一工作逾時（秒），可由環境變數覆寫
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("GEMINI_TTS_MAX_CONCURRENCY", "8"))
+DEFAULT_TIMEOUT = float(os.getenv("GEMINI_TTS_TIMEOUT", "120"))
+
+
+@dataclass
+class SynthesisJob:
+    """單一合成工作"""
+    model: str
+    contents: Any
+    config: Any
+    key: Any = None
+    timeout: Optional[float] = None
+    use_cache: bool = True
+
+
+@dataclass
+class JobResult:
+    """合成工作結果"""
+    job: SynthesisJob
+    audio_data: Optional[bytes] = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.audio_data is not None
+
+
+class AsyncSynthesisEngine:
+    """在背景事件迴圈中執行合成工作的引擎
+
+    同步程式碼透過 submit / run_jobs 提交工作；事件迴圈在引擎的生命週期內
+    持續存在，因此共用客戶端的非同步連線可以跨批次重複使用。
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="tts-synthesis-engine",
+            daemon=True
+        )
+        self._thread.start()
+        self._semaphore = self._call_in_loop(
+            self._make_semaphore(max_concurrency)
+        )
+
+    @staticmethod
+    async def _make_semaphore(value: int) -> asyncio.Semaphore:
+        return asyncio.Semaphore(value)
+
+    def _call_in_loop(self, coro) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def synthesize(self, client: Any, job: SynthesisJob) -> bytes:
+        """在並行限制與逾時下合成單一工作（須在引擎事件迴圈中呼叫）"""
+        timeout = job.timeout if job.timeout is not None else self.timeout
+        async with self._semaphore:
+            return await asyncio.wait_for(
+                tts_synthesis.synthesize_async(
+                    client, job.model, job.contents, job.config,
+                    use_cache=job.use_cache
+                ),
+                timeout
+            )
+
+    async def _run_job(self, client: Any, job: SynthesisJob,
+                       limit: Optional[asyncio.Semaphore] = None) -> JobResult:
+        start_time = time.perf_counter()
+        try:
+            if limit is not None:
+                async with limit:
+                    audio_data = await self.synthesize(client, job)
+            else:
+                audio_data = await self.synthesize(client, job)
+            return JobResult(job, audio_data=audio_data,
+                             elapsed=time.perf_counter() - start_time)
+        except asyncio.TimeoutError:
+            error = TimeoutError(f"合成逾時（{job.timeout or self.timeout} 秒）")
+            return JobResult(job, error=error,
+                             elapsed=time.perf_counter() - start_time)
+        except Exception as e:
+            return JobResult(job, error=e,
+                             elapsed=time.perf_counter() - start_time)
+
+    def submit(self, client: Any, job: SynthesisJob,
+               limit: Optional[asyncio.Semaphore] = None) -> "Future[JobResult]":
+        """提交單一工作，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(
+            self._run_job(client, job, limit), self._loop
+        )
+
+    def run_jobs(
+        self,
+        client: Any,
+        jobs: Iterable[SynthesisJob],
+        on_result: Optional[Callable[[JobResult], None]] = None,
+        max_concurrency: Optional[int] = None
+    ) -> List[JobResult]:
+        """同步執行一批工作並等待全部完成
+
+        Args:
+            client: Gemini 客戶端
+            jobs: 合成工作
+            on_result: 每個工作完成時的回呼，在呼叫端執行緒中執行
+            max_concurrency: 本批次額外的並行上限（仍受引擎上限約束）
+
+        Returns:
+            與 jobs 順序相同的結果列表
+        """
+        jobs = list(jobs)
+        limit = None
+        if max_concurrency is not None:
+            limit = self._call_in_loop(
+                self._make_semaphore(max(1, max_concurrency))
+            )
+
+        futures = {self.submit(client, job, limit): i
+                   for i, job in enumerate(jobs)}
+        results: List[Optional[JobResult]] = [None] * len(jobs)
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if on_result:
+                    on_result(result)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return results
+
+    def close(self) -> None:
+        """停止事件迴圈"""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+_engine: Optional[AsyncSynthesisEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> AsyncSynthesisEngine:
+    """取得行程共用的合成引擎"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncSynthesisEngine()
+        return _engine
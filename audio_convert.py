@@ -0,0 +1,154 @@
+"""
+音訊格式轉換模組
+將 API 返回的 16-bit PCM 實際轉換為輸出設定的取樣率與聲道數，
+而不只是改寫 WAV 標頭（只改標頭會讓音訊變速或變調）。
+取樣率轉換使用 Kaiser 視窗 sinc 濾波器的多相（polyphase）實作：
+每個相位的輸出是輸入的等間隔滑動視窗與固定係數的內積，
+以 NumPy 分段計算，一小時長的音訊也能在合成後立即轉換
+"""
+
+import functools
+import math
+from typing import Tuple
+
+import numpy as np
+
+import audio_postprocess
+
+# 濾波器每側的零交越點數與 Kaiser 視窗參數（阻帶衰減約 80 dB）
+_ZERO_CROSSINGS = 16
+_KAISER_BETA = 8.0
+# 截止頻率相對於較低奈奎斯特頻率的比例（保留過渡帶）
+_ROLLOFF = 0.94
+# 每個區塊中每個相位計算的輸出樣本數（限制暫存陣列的大小）
+_BLOCK_ROWS = 1 << 15
+
+_FULL_SCALE = 32768.0
+
+
+@functools.lru_cache(maxsize=16)
+def _polyphase_filters(up: int, down: int) -> Tuple[np.ndarray, np.ndarray]:
+    """設計 up/down 有理數轉換的多相濾波器
+
+    Returns:
+        (各相位的係數矩陣 [up, taps], 各相位第一個輸入樣本的偏移)
+    """
+    factor = max(up, down)
+    half = _ZERO_CROSSINGS * factor
+    t = np.arange(-half, half + 1)
+    # 在升取樣後的時間軸上設計低通濾波器，增益 up 補償插入的零
+    cutoff = 0.5 / factor * _ROLLOFF
+    prototype = (2 * cutoff * up * np.sinc(2 * cutoff * t)
+                 * np.kaiser(2 * half + 1, _KAISER_BETA))
+
+    taps = 2 * half // up + 2
+    filters = np.zeros((up, taps), dtype=np.float32)
+    offsets = np.empty(up, dtype=np.int64)
+    for phase in range(up):
+        # 輸出 n 對應升取樣時間 n·down，第 k 個係數乘上輸入 first + k
+        position = phase * down
+        first = -((half - position) // up)
+        offsets[phase] = first
+        index = position - (first + np.arange(taps)) * up + half
+        valid = (index >= 0) & (index <= 2 * half)
+        filters[phase, valid] = prototype[index[valid]]
+    return filters, offsets
+
+
+def resample(samples: np.ndarray, rate: int, target_rate: int) -> np.ndarray:
+    """將 int16 單聲道樣本轉換為 target_rate（升取樣與降取樣皆可），返回 int16 陣列
+
+    取樣率相同時直接返回輸入陣列（不複製）。
+    """
+    if rate == target_rate:
+        return samples
+    if rate <= 0 or target_rate <= 0:
+        raise ValueError(f"無效的取樣率：{rate} → {target_rate}")
+
+    g = math.gcd(rate, target_rate)
+    up, down = target_rate // g, rate // g
+    filters, offsets = _polyphase_filters(up, down)
+    taps = filters.shape[1]
+
+    n_out = -(-len(samples) * up // down)
+    out = np.empty(n_out, dtype="<i2")
+    # 每個區塊的輸出數為 up 的倍數，各區塊的相位排列相同
+    block = up * _BLOCK_ROWS
+    for start in range(0, n_out, block):
+        count = min(block, n_out - start)
+        # 此區塊對應的輸入範圍（含濾波器兩側），超出邊界的部分補零
+        base = start // up * down
+        lo = base + int(offsets.min())
+        hi = base + (count // up + 1) * down + int(offsets.max()) + taps
+        chunk = np.zeros(hi - lo, dtype=np.float32)
+        src_lo, src_hi = max(lo, 0), min(hi, len(samples))
+        if src_hi > src_lo:
+            chunk[src_lo - lo:src_hi - lo] = samples[src_lo:src_hi]
+        windows = np.lib.stride_tricks.sliding_window_view(chunk, taps)
+        result = np.empty(count, dtype=np.float32)
+        for phase in range(min(up, count)):
+            first = base + int(offsets[phase]) - lo
+            n_phase = len(range(phase, count, up))
+            # einsum 直接在跨步視圖上計算內積，不像 @ 會先複製成連續陣列
+            result[phase::up] = np.einsum(
+                "ij,j->i", windows[first:first + n_phase * down:down],
+                filters[phase]
+            )
+        np.clip(result, -_FULL_SCALE, _FULL_SCALE - 1, out=result)
+        np.rint(result, out=result)
+        out[start:start + count] = result
+    return out
+
+
+def map_channels(frames: np.ndarray, target_channels: int) -> np.ndarray:
+    """轉換聲道數：多聲道轉單聲道取平均，單聲道轉多聲道複製到每個聲道
+
+    Args:
+        frames: 形狀為 [音框數, 聲道數] 的 int16 陣列
+
+    Returns:
+        形狀為 [音框數, target_channels] 的 int16 陣列
+
+    Raises:
+        ValueError: 不支援的聲道轉換（例如 2 → 3）
+    """
+    channels = frames.shape[1]
+    if channels == target_channels:
+        return frames
+    if target_channels == 1:
+        mixed = frames.mean(axis=1, dtype=np.float32)
+        return np.rint(mixed).astype("<i2")[:, None]
+    if channels == 1:
+        return np.repeat(frames, target_channels, axis=1)
+    raise ValueError(f"不支援的聲道轉換：{channels} → {target_channels}")
+
+
+def convert(pcm: bytes, rate: int, target_rate: int, channels: int = 1,
+            target_channels: int = 1) -> bytes:
+    """將 16-bit PCM 轉換為指定的取樣率與聲道數
+
+    先降混再轉換取樣率（降為單聲道時只需處理一個聲道），
+    複製聲道則在轉換取樣率之後進行。格式相同時直接返回原資料。
+
+    Args:
+        pcm: 交錯排列的 16-bit PCM 資料
+        rate: 原始取樣率
+        target_rate: 目標取樣率
+        channels: 原始聲道數
+        target_channels: 目標聲道數
+
+    Returns:
+        轉換後的 PCM 資料
+    """
+    if rate == target_rate and channels == target_channels:
+        return pcm
+    samples = audio_postprocess.pcm_view(pcm)
+    frames = samples[:len(samples) // channels * channels].reshape(-1, channels)
+    if target_channels == 1:
+        frames = map_channels(frames, 1)
+    converted = np.stack(
+        [resample(frames[:, c], rate, target_rate)
+         for c in range(frames.shape[1])],
+        axis=1
+    )
+    return map_channels(converted, target_channels).tobytes()
@@ -0,0 +1,430 @@
+"""
+音訊編碼模組
+以可插拔的串流編碼器輸出 WAV、PCM 與壓縮格式（FLAC、Opus、MP3）：
+PCM 資料一到就送進編碼器寫入檔案，不需在記憶體中保留完整音訊，
+並記錄編碼耗時與壓縮率。壓縮格式依已安裝的選用後端決定是否可用：
+- soundfile（libsndfile）：FLAC、Opus（Ogg 容器）、MP3（libsndfile 1.1 以上）
+- lameenc：MP3
+- ffmpeg 執行檔：FLAC、Opus、MP3
+後端依註冊順序優先使用，可用 register_backend 加入新的後端
+"""
+
+import functools
+import os
+import shutil
+import subprocess
+import time
+from dataclasses import asdict, dataclass
+from typing import BinaryIO, Dict, FrozenSet, List, Optional, Tuple, Type
+
+import numpy as np
+
+import wav_writer
+
+try:
+    import soundfile
+except (ImportError, OSError):
+    # 未安裝 soundfile 或找不到 libsndfile 時不提供此後端
+    soundfile = None
+
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+
+# 一次性編碼完整 PCM 時每次送進編碼器的大小（約 20 秒的 24kHz 單聲道音訊）
+_FEED_BYTES = 1 << 20
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """輸出格式"""
+    name: str
+    label: str
+    extension: str
+    mime_type: str
+    # 有損格式的預設位元率（kbps，語音用途）；無損格式為 None
+    bitrate_kbps: Optional[int] = None
+
+
+FORMATS: Dict[str, OutputFormat] = {
+    "wav": OutputFormat("wav", "WAV", ".wav", "audio/wav"),
+    "pcm": OutputFormat("pcm", "PCM", ".pcm", "audio/pcm"),
+    "flac": OutputFormat("flac", "FLAC", ".flac", "audio/flac"),
+    "opus": OutputFormat("opus", "Opus", ".opus", "audio/ogg", bitrate_kbps=32),
+    "mp3": OutputFormat("mp3", "MP3", ".mp3", "audio/mpeg", bitrate_kbps=64),
+}
+
+# 其他常見副檔名對應的格式
+_EXTENSION_ALIASES = {".ogg": "opus", ".raw": "pcm"}
+
+
+class EncoderUnavailableError(RuntimeError):
+    """沒有可用的後端可以編碼指定的格式"""
+
+
+@dataclass
+class EncodeStats:
+    """編碼統計資料"""
+    format: str
+    backend: str
+    rate: int
+    channels: int
+    bytes_in: int = 0
+    bytes_out: int = 0
+    encode_seconds: float = 0.0
+
+    @property
+    def audio_seconds(self) -> float:
+        return self.bytes_in / (self.rate * self.channels * 2)
+
+    @property
+    def realtime_factor(self) -> float:
+        """每秒編碼耗時可處理的音訊秒數"""
+        if not self.encode_seconds:
+            return 0.0
+        return self.audio_seconds / self.encode_seconds
+
+    @property
+    def compression_ratio(self) -> float:
+        """原始 PCM 大小與輸出檔案大小的比值"""
+        return self.bytes_in / self.bytes_out if self.bytes_out else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        summary = asdict(self)
+        summary.update(
+            audio_seconds=self.audio_seconds,
+            realtime_factor=self.realtime_factor,
+            compression_ratio=self.compression_ratio,
+        )
+        return summary
+
+
+class AudioEncoder:
+    """串流編碼器基底類別
+
+    子類別實作 _encode（編碼一段完整音框的 PCM）與 _finish（寫入結尾並關閉檔案），
+    並以 supports 表示是否能在目前的環境中編碼指定格式。
+
+    使用方式：
+        with open_encoder("out.flac") as encoder:
+            for chunk in chunks:
+                encoder.write(chunk)
+        print(encoder.stats.realtime_factor)
+    """
+
+    name = ""
+
+    def __init__(self, path: str, output_format: OutputFormat,
+                 rate: int = 24000, channels: int = 1,
+                 bitrate_kbps: Optional[int] = None):
+        """
+        Args:
+            path: 輸出檔案路徑
+            output_format: 輸出格式
+            rate: 採樣率
+            channels: 聲道數
+            bitrate_kbps: 有損格式的位元率（None 表示使用格式的預設值）
+        """
+        self.path = path
+        self.format = output_format
+        self.rate = rate
+        self.channels = channels
+        self.bitrate_kbps = bitrate_kbps or output_format.bitrate_kbps
+        self.block_align = channels * 2
+        self.stats = EncodeStats(output_format.name, self.name, rate, channels)
+        self._pending = b""
+        self._closed = False
+
+    @classmethod
+    def supports(cls, output_format: OutputFormat) -> bool:
+        raise NotImplementedError
+
+    def _encode(self, pcm: bytes) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        raise NotImplementedError
+
+    def write(self, pcm: bytes) -> None:
+        """送入 16-bit PCM；不足一個音框的尾端會保留到下一次寫入"""
+        if self._closed:
+            raise ValueError("編碼器已關閉")
+        if self._pending:
+            pcm = self._pending + pcm
+        usable = len(pcm) - len(pcm) % self.block_align
+        self._pending = pcm[usable:]
+        if not usable:
+            return
+        start = time.perf_counter()
+        self._encode(pcm[:usable] if self._pending else pcm)
+        self.stats.encode_seconds += time.perf_counter() - start
+        self.stats.bytes_in += usable
+
+    def close(self) -> None:
+        """寫入結尾並關閉檔案（不足一個音框的尾端會被捨棄）"""
+        if self._closed:
+            return
+        self._closed = True
+        start = time.perf_counter()
+        self._finish()
+        self.stats.encode_seconds += time.perf_counter() - start
+        self.stats.bytes_out = os.path.getsize(self.path)
+
+    def __enter__(self) -> "AudioEncoder":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+_BACKENDS: List[Type[AudioEncoder]] = []
+
+
+def register_backend(cls: Type[AudioEncoder]) -> Type[AudioEncoder]:
+    """註冊編碼器後端（先註冊的優先使用）"""
+    _BACKENDS.append(cls)
+    return cls
+
+
+@register_backend
+class WavEncoder(AudioEncoder):
+    """以 WavWriter 逐段附加音框的 WAV 輸出"""
+
+    name = "wav_writer"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._writer = wav_writer.WavWriter(self.path, self.channels, self.rate)
+
+    @classmethod
+    def supports(cls, output_format: OutputFormat) -> bool:
+        return output_format.name == "wav"
+
+    def _encode(self, pcm: bytes) -> None:
+        self._writer.append_frames(pcm)
+
+    def _finish(self) -> None:
+        self._writer.close()
+
+
+@register_backend
+class PcmEncoder(AudioEncoder):
+    """原始 PCM 輸出（不含標頭）"""
+
+    name = "raw"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file: BinaryIO = open(self.path, "wb")
+
+    @classmethod
+    def supports(cls, output_format: OutputFormat) -> bool:
+        return output_format.name == "pcm"
+
+    def _encode(self, pcm: bytes) -> None:
+        self._file.write(pcm)
+
+    def _finish(self) -> None:
+        self._file.close()
+
+
+@register_backend
+class LameEncoder(AudioEncoder):
+    """以 lameenc 編碼 MP3"""
+
+    name = "lameenc"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encoder = lameenc.Encoder()
+        self._encoder.set_bit_rate(self.bitrate_kbps)
+        self._encoder.set_in_sample_rate(self.rate)
+        self._encoder.set_channels(self.channels)
+        self._encoder.set_quality(2)
+        self._file: BinaryIO = open(self.path, "wb")
+
+    @classmethod
+    def supports(cls, output_format: OutputFormat) -> bool:
+        return lameenc is not None and output_format.name == "mp3"
+
+    def _encode(self, pcm: bytes) -> None:
+        self._file.write(self._encoder.encode(pcm))
+
+    def _finish(self) -> None:
+        try:
+            self._file.write(self._encoder.flush())
+        finally:
+            self._file.close()
+
+
+@register_backend
+class SoundFileEncoder(AudioEncoder):
+    """以 soundfile（libsndfile）編碼 FLAC、Opus 與 MP3（使用 libsndfile 的預設品質）"""
+
+    name = "soundfile"
+
+    # 格式 → (libsndfile 主要格式, 子格式)
+    _FORMATS = {
+        "flac": ("FLAC", "PCM_16"),
+        "opus": ("OGG", "OPUS"),
+        "mp3": ("MP3", "MPEG_LAYER_III"),
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        major, subtype = self._FORMATS[self.format.name]
+        self._file = soundfile.SoundFile(
+            self.path, "w", samplerate=self.rate, channels=self.channels,
+            format=major, subtype=subtype
+        )
+
+    @classmethod
+    def supports(cls, output_format: OutputFormat) -> bool:
+        if soundfile is None or output_format.name not in cls._FORMATS:
+            return False
+        major, subtype = cls._FORMATS[output_format.name]
+        return subtype in soundfile.available_subtypes(major)
+
+    def _encode(self, pcm: bytes) -> None:
+        frames = np.frombuffer(pcm, dtype="<i2").reshape(-1, self.channels)
+        self._file.write(frames)
+
+    def _finish(self) -> None:
+        self._file.close()
+
+
+@register_backend
+class FfmpegEncoder(AudioEncoder):
+    """將 PCM 經由管線送進 ffmpeg 子行程編碼"""
+
+    name = "ffmpeg"
+
+    _CODECS = {"flac": "flac", "opus": "libopus", "mp3": "libmp3lame"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        command = [
+            shutil.which("ffmpeg"), "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "s16le", "-ar", str(self.rate), "-ac", str(self.channels),
+            "-i", "pipe:0", "-c:a", self._CODECS[self.format.name],
+        ]
+        if self.bitrate_kbps:
+            command += ["-b:a", f"{self.bitrate_kbps}k"]
+        if self.format.name == "opus":
+            command += ["-f", "ogg"]
+        self._process = subprocess.Popen(
+            command + [self.path], stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+
+    @classmethod
+    def supports(cls, output_format: OutputFormat) -> bool:
+        # 精簡版的 ffmpeg 可能沒有編譯 libopus 或 libmp3lame
+        return (output_format.name in cls._CODECS
+                and cls._CODECS[output_format.name] in _ffmpeg_encoders())
+
+    def _encode(self, pcm: bytes) -> None:
+        self._process.stdin.write(pcm)
+
+    def _finish(self) -> None:
+        _, stderr = self._process.communicate()
+        if self._process.returncode:
+            raise RuntimeError(
+                f"ffmpeg 編碼失敗：{stderr.decode(errors='replace').strip()}"
+            )
+
+
+@functools.lru_cache(maxsize=1)
+def _ffmpeg_encoders() -> FrozenSet[str]:
+    """已安裝的 ffmpeg 支援的音訊編碼器名稱（只執行一次 ffmpeg -encoders）
+
+    沒有 ffmpeg 或無法執行時返回空集合
+    """
+    executable = shutil.which("ffmpeg")
+    if executable is None:
+        return frozenset()
+    try:
+        output = subprocess.run(
+            [executable, "-hide_banner", "-encoders"], capture_output=True,
+            text=True, timeout=10, check=True
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return frozenset()
+    # 分隔線之後每行為「旗標 名稱 說明」，旗標以 A 開頭的是音訊編碼器
+    _, _, listing = output.partition("------")
+    encoders = set()
+    for line in listing.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[0].startswith("A"):
+            encoders.add(fields[1])
+    return frozenset(encoders)
+
+
+def get_backend(name: str) -> Optional[Type[AudioEncoder]]:
+    """依優先順序取得第一個可以編碼指定格式的後端，沒有時返回 None"""
+    output_format = FORMATS[name]
+    for backend in _BACKENDS:
+        if backend.supports(output_format):
+            return backend
+    return None
+
+
+def available_formats() -> List[str]:
+    """目前環境中可以輸出的格式名稱（依 FORMATS 的順序）"""
+    return [name for name in FORMATS if get_backend(name) is not None]
+
+
+def format_for_path(path: str, default: str = "wav") -> str:
+    """依副檔名判斷輸出格式，無法判斷時返回 default"""
+    extension = os.path.splitext(path)[1].lower()
+    for name, output_format in FORMATS.items():
+        if output_format.extension == extension:
+            return name
+    return _EXTENSION_ALIASES.get(extension, default)
+
+
+def resolve(path: str, name: Optional[str] = None
+            ) -> Tuple[OutputFormat, Type[AudioEncoder]]:
+    """決定輸出格式與後端（name 為 None 時依副檔名判斷）
+
+    Raises:
+        ValueError: 不支援的格式名稱
+        EncoderUnavailableError: 沒有可用的後端
+    """
+    name = (name or format_for_path(path)).lower()
+    if name not in FORMATS:
+        raise ValueError(f"不支援的輸出格式：{name}")
+    backend = get_backend(name)
+    if backend is None:
+        raise EncoderUnavailableError(
+            f"無法輸出 {FORMATS[name].label}：請安裝 soundfile、lameenc 或 ffmpeg"
+        )
+    return FORMATS[name], backend
+
+
+def open_encoder(path: str, name: Optional[str] = None, rate: int = 24000,
+                 channels: int = 1,
+                 bitrate_kbps: Optional[int] = None) -> AudioEncoder:
+    """開啟串流編碼器
+
+    Args:
+        path: 輸出檔案路徑
+        name: 格式名稱（None 表示依副檔名判斷）
+        rate: 採樣率
+        channels: 聲道數
+        bitrate_kbps: 有損格式的位元率（None 表示使用格式的預設值）
+    """
+    output_format, backend = resolve(path, name)
+    return backend(path, output_format, rate, channels, bitrate_kbps)
+
+
+def encode_file(path: str, pcm: bytes, name: Optional[str] = None,
+                rate: int = 24000, channels: int = 1,
+                bitrate_kbps: Optional[int] = None) -> EncodeStats:
+    """將完整的 PCM 資料編碼寫入檔案（分段送進編碼器，限制後端的暫存記憶體）"""
+    with open_encoder(path, name, rate, channels, bitrate_kbps) as encoder:
+        view = memoryview(pcm)
+        for start in range(0, len(pcm), _FEED_BYTES):
+            encoder.write(bytes(view[start:start + _FEED_BYTES]))
+    return encoder.stats
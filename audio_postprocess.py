@@ -0,0 +1,317 @@
+"""
+音訊後處理模組
+在合成與寫檔之間以 NumPy 向量化處理 16-bit 單聲道 PCM：
+去除頭尾靜音、響度標準化（ITU-R BS.1770 風格的 LUFS 或 RMS）與短淡入淡出，
+讓不同語音、不同分段的輸出音量一致。輸入以 np.frombuffer 建立零複製的視圖，
+去除靜音只取切片，長音訊以固定大小的區段處理，沒有逐樣本的 Python 迴圈
+"""
+
+import functools
+import math
+import os
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+NORMALIZE_MODES = ("lufs", "rms", "off")
+
+# 響度計算的區塊長度與間隔（BS.1770：400 ms 區塊、75% 重疊）
+_BLOCK_SECONDS = 0.4
+_BLOCK_STEP_SECONDS = 0.1
+# 絕對閘門與相對閘門（LU）
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+# 偵測靜音的音框長度（毫秒）
+_FRAME_MS = 10.0
+
+_FULL_SCALE = 32768.0
+# 分段處理長音訊時每段的樣本數（限制暫存陣列的大小）
+_CHUNK_SAMPLES = 1 << 20
+
+
+@dataclass
+class PostProcessConfig:
+    """後處理設定"""
+    normalize: str = "lufs"          # lufs / rms / off
+    target_level: float = -16.0      # 目標響度（lufs 為 LUFS，rms 為 dBFS）
+    peak_ceiling: float = -1.0       # 增益後的峰值上限（dBFS）
+    trim: bool = True                # 是否去除頭尾靜音
+    silence_threshold: float = -50.0  # 音框 RMS 低於此值（dBFS）視為靜音
+    keep_silence_ms: float = 100.0   # 去除靜音後頭尾保留的長度
+    fade_ms: float = 10.0            # 淡入淡出長度（0 表示不淡入淡出）
+
+    @classmethod
+    def from_env(cls) -> "PostProcessConfig":
+        """由環境變數建立設定
+
+        GEMINI_TTS_NORMALIZE: 響度標準化方式（lufs / rms / off）
+        GEMINI_TTS_TARGET_LEVEL: 目標響度
+        GEMINI_TTS_TRIM_SILENCE: 是否去除頭尾靜音（0 / 1）
+        GEMINI_TTS_SILENCE_THRESHOLD: 靜音門檻（dBFS）
+        GEMINI_TTS_FADE_MS: 淡入淡出長度（毫秒）
+        """
+        normalize = os.getenv("GEMINI_TTS_NORMALIZE", "lufs").lower()
+        if normalize not in NORMALIZE_MODES:
+            raise ValueError(f"不支援的響度標準化方式：{normalize}")
+        return cls(
+            normalize=normalize,
+            target_level=float(os.getenv("GEMINI_TTS_TARGET_LEVEL", "-16")),
+            trim=os.getenv("GEMINI_TTS_TRIM_SILENCE", "1") != "0",
+            silence_threshold=float(
+                os.getenv("GEMINI_TTS_SILENCE_THRESHOLD", "-50")
+            ),
+            fade_ms=float(os.getenv("GEMINI_TTS_FADE_MS", "10")),
+        )
+
+
+def pcm_view(pcm: bytes) -> np.ndarray:
+    """將 16-bit PCM 轉為 int16 陣列視圖（不複製資料，忽略不完整的尾端位元組）"""
+    return np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+
+
+def _biquad_response(b: Tuple[float, float, float],
+                     a: Tuple[float, float, float],
+                     z: np.ndarray) -> np.ndarray:
+    """二階濾波器在 z = e^{-jω} 上的頻率響應"""
+    return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+
+@functools.lru_cache(maxsize=16)
+def k_weighting_power(n_fft: int, rate: int) -> np.ndarray:
+    """BS.1770 K 加權濾波器（高架濾波 + 高通濾波）在 rfft 頻率點上的功率響應
+
+    已乘上 Parseval 定理的權重（除直流與奈奎斯特頻率外計兩次）與 1/n_fft，
+    與 |rfft(x)|² 相乘後加總即為濾波後訊號的能量
+    """
+    z = np.exp(-2j * np.pi * np.arange(n_fft // 2 + 1) / n_fft)
+
+    # 第一級：約 1.5 kHz 的 +4 dB 高架濾波，模擬頭部的聲學效應
+    gain, q, fc = 4.0, 1 / math.sqrt(2), 1500.0
+    a_gain = 10 ** (gain / 40)
+    w0 = 2 * math.pi * fc / rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    sqrt_alpha = 2 * math.sqrt(a_gain) * alpha
+    shelf = _biquad_response(
+        (a_gain * ((a_gain + 1) + (a_gain - 1) * cos_w0 + sqrt_alpha),
+         -2 * a_gain * ((a_gain - 1) + (a_gain + 1) * cos_w0),
+         a_gain * ((a_gain + 1) + (a_gain - 1) * cos_w0 - sqrt_alpha)),
+        ((a_gain + 1) - (a_gain - 1) * cos_w0 + sqrt_alpha,
+         2 * ((a_gain - 1) - (a_gain + 1) * cos_w0),
+         (a_gain + 1) - (a_gain - 1) * cos_w0 - sqrt_alpha),
+        z
+    )
+
+    # 第二級：約 38 Hz 的高通濾波
+    q, fc = 0.5, 38.0
+    w0 = 2 * math.pi * fc / rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    highpass = _biquad_response(
+        ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2),
+        (1 + alpha, -2 * cos_w0, 1 - alpha),
+        z
+    )
+
+    power = np.abs(shelf * highpass) ** 2
+    power[1:(n_fft + 1) // 2] *= 2
+    return (power / n_fft).astype(np.float32)
+
+
+def _spans(length: int, size: int) -> Iterator[Tuple[int, int]]:
+    """將 [0, length) 切成長度 size 的區間，限制長音訊的暫存陣列大小"""
+    for start in range(0, length, size):
+        yield start, min(length, start + size)
+
+
+def _segment_energies(samples: np.ndarray, rate: int) -> np.ndarray:
+    """每 100 ms 片段經 K 加權後的能量
+
+    以批次 rfft 計算各片段的頻譜，依 Parseval 定理在頻域套用 K 加權，
+    不需要在時域逐樣本執行 IIR 濾波器
+    """
+    segment = max(1, int(_BLOCK_STEP_SECONDS * rate))
+    weights = k_weighting_power(segment, rate)
+    per_chunk = max(1, _CHUNK_SAMPLES // segment)
+    energies = []
+    for start, end in _spans(-(-len(samples) // segment), per_chunk):
+        chunk = samples[start * segment:end * segment].astype(np.float32)
+        if len(chunk) % segment:
+            # 最後不足一個片段的部分補零
+            chunk = np.pad(chunk, (0, segment - len(chunk) % segment))
+        chunk /= _FULL_SCALE
+        spectrum = np.fft.rfft(chunk.reshape(-1, segment), axis=1)
+        energies.append((spectrum.real ** 2 + spectrum.imag ** 2) @ weights)
+    return np.concatenate(energies).astype(np.float64)
+
+
+def loudness_lufs(samples: np.ndarray, rate: int) -> Optional[float]:
+    """計算整合響度（LUFS），全部低於絕對閘門時返回 None
+
+    400 ms 區塊（75% 重疊）的均方值由 100 ms 片段能量的滑動和求得，
+    再依絕對與相對閘門篩選
+    """
+    n = len(samples)
+    if not n:
+        return None
+    energies = _segment_energies(samples, rate)
+    per_block = int(round(_BLOCK_SECONDS / _BLOCK_STEP_SECONDS))
+    segment = max(1, int(_BLOCK_STEP_SECONDS * rate))
+    if len(energies) < per_block:
+        power = np.array([energies.sum() / n])
+    else:
+        cumulative = np.concatenate(([0.0], np.cumsum(energies)))
+        power = ((cumulative[per_block:] - cumulative[:-per_block])
+                 / (per_block * segment))
+
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(power)
+    gated = power[block_loudness > _ABSOLUTE_GATE]
+    if not len(gated):
+        return None
+    relative_gate = -0.691 + 10 * math.log10(gated.mean()) + _RELATIVE_GATE
+    gated = power[(block_loudness > _ABSOLUTE_GATE)
+                  & (block_loudness > relative_gate)]
+    return -0.691 + 10 * math.log10(gated.mean())
+
+
+def rms_dbfs(samples: np.ndarray) -> Optional[float]:
+    """計算 RMS 位準（dBFS），完全靜音時返回 None"""
+    if not len(samples):
+        return None
+    total = 0.0
+    for start, end in _spans(len(samples), _CHUNK_SAMPLES):
+        chunk = samples[start:end].astype(np.float32)
+        total += float(np.dot(chunk, chunk))
+    if total <= 0:
+        return None
+    return 10 * math.log10(total / len(samples) / _FULL_SCALE ** 2)
+
+
+def _voiced_frames(samples: np.ndarray, frame: int,
+                   threshold: float) -> np.ndarray:
+    """返回能量高於門檻的音框索引"""
+    n_frames = len(samples) // frame
+    frames = samples[:n_frames * frame].reshape(n_frames, frame).astype(np.float32)
+    power = np.einsum("ij,ij->i", frames, frames) / frame
+    return np.flatnonzero(power > _FULL_SCALE ** 2 * 10 ** (threshold / 10))
+
+
+def trim_silence(samples: np.ndarray, rate: int,
+                 threshold: float = -50.0,
+                 keep_ms: float = 100.0,
+                 head: bool = True,
+                 tail: bool = True) -> np.ndarray:
+    """去除頭尾靜音，返回原陣列的切片（不複製資料）
+
+    以 10 ms 音框的 RMS 判斷，頭尾各保留 keep_ms 的原始音訊；
+    整段都低於門檻時原樣返回。從頭尾分段向內尋找，長音訊不需要掃描整段。
+    head / tail 為 False 時保留該端的靜音（用於長文本中間的段落）
+    """
+    frame = max(1, int(rate * _FRAME_MS / 1000))
+    n_frames = len(samples) // frame
+    if not n_frames or not (head or tail):
+        return samples
+    span = max(1, _CHUNK_SAMPLES // frame)
+
+    first = None
+    for start, end in _spans(n_frames, span):
+        voiced = _voiced_frames(samples[start * frame:end * frame], frame,
+                                threshold)
+        if len(voiced):
+            first = start + voiced[0]
+            break
+    if first is None:
+        return samples
+
+    last = first
+    for start, end in _spans(n_frames - first, span):
+        # 從尾端向前
+        lo, hi = n_frames - end, n_frames - start
+        voiced = _voiced_frames(samples[lo * frame:hi * frame], frame,
+                                threshold)
+        if len(voiced):
+            last = lo + voiced[-1]
+            break
+
+    keep = int(rate * keep_ms / 1000)
+    start = max(0, first * frame - keep) if head else 0
+    end = min(len(samples), (last + 1) * frame + keep) if tail else len(samples)
+    return samples[start:end]
+
+
+def normalization_gain(samples: np.ndarray, rate: int,
+                       config: PostProcessConfig) -> float:
+    """計算響度標準化的線性增益（受峰值上限限制）"""
+    if config.normalize == "lufs":
+        level = loudness_lufs(samples, rate)
+    elif config.normalize == "rms":
+        level = rms_dbfs(samples)
+    else:
+        level = None
+    if level is None or not len(samples):
+        return 1.0
+
+    gain = 10 ** ((config.target_level - level) / 20)
+    peak = max(int(samples.max()), -int(samples.min())) / _FULL_SCALE
+    ceiling = 10 ** (config.peak_ceiling / 20)
+    if peak * gain > ceiling:
+        gain = ceiling / peak
+    return gain
+
+
+def process_samples(samples: np.ndarray, rate: int,
+                    config: Optional[PostProcessConfig] = None,
+                    head: bool = True, tail: bool = True) -> np.ndarray:
+    """對 int16 單聲道樣本套用後處理，返回新的 int16 陣列
+
+    head / tail 表示樣本是否位於整段音訊的開頭 / 結尾；去除靜音與淡入淡出
+    只套用在這兩端，長文本中間的段落只做響度標準化，接縫處不會失去停頓或出現音量凹陷
+    """
+    config = config or PostProcessConfig.from_env()
+    if config.trim:
+        samples = trim_silence(samples, rate, config.silence_threshold,
+                               config.keep_silence_ms, head, tail)
+    n = len(samples)
+    out = np.empty(n, dtype="<i2")
+    if not n:
+        return out
+
+    gain = np.float32(normalization_gain(samples, rate, config))
+    fade = min(n // 2, int(rate * config.fade_ms / 1000))
+    fade_in = fade if head else 0
+    fade_out = fade if tail else 0
+    ramp = np.linspace(0.0, 1.0, fade, endpoint=False, dtype=np.float32)
+    for start, end in _spans(n, _CHUNK_SAMPLES):
+        # 增益、淡入淡出與截斷在同一個 float32 暫存陣列上原地計算
+        chunk = samples[start:end].astype(np.float32)
+        chunk *= gain
+        if start < fade_in:
+            stop = min(end, fade_in)
+            chunk[:stop - start] *= ramp[start:stop]
+        if end > n - fade_out:
+            lo = max(start, n - fade_out)
+            chunk[lo - start:] *= ramp[::-1][lo - (n - fade_out):end - (n - fade_out)]
+        np.clip(chunk, -_FULL_SCALE, _FULL_SCALE - 1, out=chunk)
+        np.rint(chunk, out=chunk)
+        out[start:end] = chunk
+    return out
+
+
+def process(pcm: bytes, rate: int = 24000,
+            config: Optional[PostProcessConfig] = None,
+            head: bool = True, tail: bool = True) -> bytes:
+    """對 16-bit 單聲道 PCM 套用後處理（去除靜音、響度標準化、淡入淡出）
+
+    Args:
+        pcm: API 返回的 PCM 資料
+        rate: 取樣率
+        config: 後處理設定（None 表示依環境變數設定）
+        head: 是否為整段音訊的開頭（去除開頭靜音並淡入）
+        tail: 是否為整段音訊的結尾（去除結尾靜音並淡出）
+
+    Returns:
+        處理後的 PCM 資料
+    """
+    return process_samples(pcm_view(pcm), rate, config, head, tail).tobytes()
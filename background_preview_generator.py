@@ -1,90 +1,444 @@
 """
 背景預覽生成器模組
-在應用程式啟動時自動生成所有語音預覽
+伺服器共用的預覽生成服務：以有限的工作執行緒處理 語音 × 語言 的預覽矩陣，
+跨工作階段去除重複的工作，以原子方式寫入預覽目錄，並優先生成使用者剛選擇的語言；
+使用者剛選擇的語音與其相鄰語音會被預先提取（插隊），前景有生成請求時暫停開始新的工作；
+失敗的預覽依 API 金鑰記錄，並在退避時間後重新嘗試
 """
 
 import streamlit as st
-import os
-from typing import List, Dict, Callable
+import contextlib
 import threading
 import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import gemini_client_pool
+import async_synthesis_engine
+import preview_texts
+import preview_index
+import wav_writer
 
+# 背景生成預覽的並行數上限（保留部分額度給前景的生成請求）
+BACKGROUND_CONCURRENCY = 4
 
-def start_background_generation(
-    voice_options: List[str],
-    api_key: str,
-    language: str,
-    model_name: str,
-    generate_preview_func: Callable,
-    save_wave_func: Callable
-):
+# 預先提取（插隊）的預覽數上限，超過時較早的預覽改回一般順序
+PREFETCH_LIMIT = 16
+
+# 估計剩餘時間時，每個預覽耗時的指數移動平均權重
+_DURATION_SMOOTHING = 0.2
+
+# 狀態中保留的最近失敗數
+_MAX_RECENT_FAILURES = 20
+
+# 失敗後重新嘗試前的等待秒數（每次連續失敗加倍，最多 FAILURE_BACKOFF_MAX 秒）
+FAILURE_BACKOFF = 30.0
+FAILURE_BACKOFF_MAX = 3600.0
+
+
+class GenerationStatus:
+    """預覽生成進度（由生成服務發布事件更新的記憶體狀態）
+
+    計數器隨每個事件增量更新，查詢不需要逐一檢查語音或存取檔案系統，
+    因此每次重新執行的成本與語音、語言數量無關。
     """
-    在背景執行緒中生成所有語音預覽
-    
-    Args:
-        voice_options: 語音選項列表
-        api_key: Gemini API 金鑰
-        language: 語言代碼
-        model_name: TTS 模型名稱
-        generate_preview_func: 生成預覽的函數
-        save_wave_func: 儲存音訊的函數
+
+    def __init__(self, max_workers: int = BACKGROUND_CONCURRENCY):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._languages: Dict[str, Dict[str, int]] = {}
+        self._totals = {'pending': 0, 'in_flight': 0, 'generated': 0,
+                        'failed': 0}
+        self._current: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._failures: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._failed_keys: set = set()
+        self._average_duration: Optional[float] = None
+        self.updated_at = time.time()
+
+    def _language(self, language: str) -> Dict[str, int]:
+        return self._languages.setdefault(language, {
+            'total': 0, 'completed': 0, 'pending': 0, 'in_flight': 0,
+            'failed': 0,
+        })
+
+    def register_language(self, language: str, total: int,
+                          completed: int) -> None:
+        """登記語言的預覽總數與已存在的數量（每個語言只登記一次）"""
+        with self._lock:
+            if language in self._languages:
+                return
+            counts = self._language(language)
+            counts['total'] = total
+            counts['completed'] = completed
+
+    def is_registered(self, language: str) -> bool:
+        with self._lock:
+            return language in self._languages
+
+    def queued(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            counts = self._language(key[1])
+            counts['pending'] += 1
+            self._totals['pending'] += 1
+            # 重新嘗試先前失敗的預覽時不再計為失敗
+            if key in self._failed_keys:
+                self._failed_keys.discard(key)
+                counts['failed'] -= 1
+                self._totals['failed'] -= 1
+            self.updated_at = time.time()
+
+    def started(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            counts = self._language(key[1])
+            counts['pending'] -= 1
+            counts['in_flight'] += 1
+            self._totals['pending'] -= 1
+            self._totals['in_flight'] += 1
+            self._current[key] = time.time()
+            self.updated_at = time.time()
+
+    def finished(self, key: Tuple[str, str], elapsed: float) -> None:
+        with self._lock:
+            counts = self._language(key[1])
+            counts['in_flight'] -= 1
+            counts['completed'] += 1
+            self._totals['in_flight'] -= 1
+            self._totals['generated'] += 1
+            self._current.pop(key, None)
+            if self._average_duration is None:
+                self._average_duration = elapsed
+            else:
+                self._average_duration += _DURATION_SMOOTHING * (
+                    elapsed - self._average_duration
+                )
+            self.updated_at = time.time()
+
+    def failed(self, key: Tuple[str, str], error: str) -> None:
+        with self._lock:
+            counts = self._language(key[1])
+            counts['in_flight'] -= 1
+            self._totals['in_flight'] -= 1
+            if key not in self._failed_keys:
+                self._failed_keys.add(key)
+                counts['failed'] += 1
+                self._totals['failed'] += 1
+            self._current.pop(key, None)
+            self._failures[key] = error
+            while len(self._failures) > _MAX_RECENT_FAILURES:
+                self._failures.popitem(last=False)
+            self.updated_at = time.time()
+
+    def _eta(self, remaining: int) -> Optional[float]:
+        if not remaining:
+            return 0.0
+        if self._average_duration is None:
+            return None
+        return remaining * self._average_duration / self.max_workers
+
+    def snapshot(self, language: Optional[str] = None) -> Dict[str, Any]:
+        """取得目前狀態
+
+        Args:
+            language: 要一併返回進度的語言
+
+        Returns:
+            整體計數、目前生成中的預覽、預估剩餘秒數、最近的失敗，
+            以及指定語言的 total / completed / percentage
+        """
+        with self._lock:
+            remaining = self._totals['pending'] + self._totals['in_flight']
+            current = next(reversed(self._current), None)
+            snapshot = dict(
+                self._totals,
+                current=current,
+                eta_seconds=self._eta(remaining),
+                average_seconds=self._average_duration,
+                recent_failures=[
+                    {'voice': voice, 'language': lang, 'error': error}
+                    for (voice, lang), error in self._failures.items()
+                ],
+                updated_at=self.updated_at,
+            )
+            if language is not None:
+                counts = dict(self._languages.get(language) or {
+                    'total': 0, 'completed': 0, 'pending': 0,
+                    'in_flight': 0, 'failed': 0,
+                })
+                counts['percentage'] = (
+                    int(counts['completed'] / counts['total'] * 100)
+                    if counts['total'] else 0
+                )
+                counts['eta_seconds'] = self._eta(
+                    counts['pending'] + counts['in_flight']
+                )
+                snapshot['language'] = counts
+            return snapshot
+
+
+class PreviewGenerator:
+    """伺服器共用的背景預覽生成服務
+
+    所有工作階段透過 request() 提交 (語音, 語言)；已存在、排隊中或生成中的預覽
+    不會重複提交，而是把提交者加入該工作的請求者。每個工作使用最近一位請求者的
+    API 金鑰生成；使用某個金鑰失敗時改用其他請求者的金鑰，同一金鑰則在退避時間
+    （FAILURE_BACKOFF，連續失敗時加倍）過後才會再次嘗試，因此一個工作階段的
+    無效金鑰或暫時的速率限制錯誤不會讓其他工作階段無法生成預覽。
+    工作執行緒依序取出最近預先提取的預覽、目前優先語言的預覽，最後是其餘預覽；
+    預先提取只會讓提交者本身也請求的工作插隊，並改用提交者的金鑰生成。
+    前景有生成請求（foreground()）時不開始新的工作，避免與使用者等待中的請求
+    競爭速率限制額度。
+    生成結果先寫入暫存檔再改名為預覽目錄中的正式檔名，並加入預覽索引。
+    進度以事件的方式發布到 self.progress（GenerationStatus）。
     """
-    def generate_all_previews():
-        """在背景執行緒中生成預覽"""
-        for voice in voice_options:
-            preview_filename = f"preview_{voice}_{language}.wav"
-            
-            # 檢查是否已存在
-            if not os.path.exists(preview_filename):
-                try:
-                    # 生成預覽
-                    preview_audio = generate_preview_func(
-                        api_key,
-                        voice,
-                        language,
-                        model_name
-                    )
-                    if preview_audio:
-                        # 儲存檔案
-                        save_wave_func(preview_filename, preview_audio)
-                        
-                        # 移除對 st.session_state 的直接存取
-                        # 這會在背景執行緒中造成警告
-                        
-                        # 短暫延遲，避免過度使用 API
-                        time.sleep(0.5)
-                        
-                except Exception as e:
-                    print(f"生成 {voice} 預覽時發生錯誤：{e}")
-    
-    # 啟動背景執行緒
-    thread = threading.Thread(target=generate_all_previews, daemon=True)
-    thread.start()
-    
-    return thread
+
+    def __init__(self, index: preview_index.PreviewIndex,
+                 max_workers: int = BACKGROUND_CONCURRENCY):
+        """
+        Args:
+            index: 預覽索引（判斷哪些預覽已存在，並登記新生成的預覽）
+            max_workers: 同時生成的預覽數上限
+        """
+        self.index = index
+        self.max_workers = max_workers
+        self.priority_language: Optional[str] = None
+        self.progress = GenerationStatus(max_workers)
+        # (語音, 語言, API 金鑰) → (可重新嘗試的時間, 連續失敗次數, 錯誤訊息)
+        self.failed: Dict[Tuple[str, str, str], Tuple[float, int, str]] = {}
+        # 每個工作的請求者：API 金鑰 → (模型名稱, 儲存函數)，最後一位用於生成
+        self._pending: "OrderedDict[Tuple[str, str], OrderedDict[str, Tuple[str, Callable]]]" = OrderedDict()
+        # 預先提取的預覽（最後加入的最先生成）
+        self._hot: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        self._foreground = 0
+        self.prefetched = 0
+        # 生成中的工作與其請求者（生成失敗時由其餘請求者接手）
+        self._in_flight: "Dict[Tuple[str, str], OrderedDict[str, Tuple[str, Callable]]]" = {}
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._unpacked = 0
+
+    def request(self, voices: Iterable[str], languages: Iterable[str],
+                api_key: str, model_name: str,
+                save_func: Callable = wav_writer.write_wav_file,
+                priority_language: Optional[str] = None,
+                prefetch: Iterable[Tuple[str, str]] = ()) -> int:
+        """提交預覽生成工作
+
+        Args:
+            voices: 語音名稱
+            languages: 語言代碼
+            api_key: Gemini API 金鑰
+            model_name: TTS 模型名稱
+            save_func: 儲存 PCM 為 WAV 檔案的函數
+            priority_language: 優先生成的語言（None 表示維持目前設定）
+            prefetch: 最可能被點擊的 (語音, 語言)，依可能性由高到低排列，
+                      排在所有工作之前（只保留最近的 PREFETCH_LIMIT 個）
+
+        Returns:
+            新加入佇列的工作數
+        """
+        voices = list(voices)
+        prefetch = list(prefetch)
+        added = 0
+        with self._condition:
+            if priority_language is not None:
+                self.priority_language = priority_language
+            now = time.time()
+            for language in languages:
+                missing = self.index.missing(voices, language)
+                self.progress.register_language(
+                    language, len(voices), len(voices) - len(missing)
+                )
+                for voice in missing:
+                    key = (voice, language)
+                    failure = self.failed.get((voice, language, api_key))
+                    if failure is not None and failure[0] > now:
+                        continue
+                    requesters = (self._in_flight.get(key)
+                                  or self._pending.get(key))
+                    if requesters is None:
+                        requesters = self._pending[key] = OrderedDict()
+                        self.progress.queued(key)
+                        added += 1
+                    requesters.setdefault(api_key, (model_name, save_func))
+            # 最後加入的最先生成，因此由可能性低的開始加入；
+            # 只讓提交者也請求的工作插隊，並改由提交者的金鑰生成
+            for key in reversed(prefetch):
+                requesters = self._pending.get(key)
+                if requesters is not None and api_key in requesters:
+                    requesters.move_to_end(api_key)
+                    self._hot.pop(key, None)
+                    self._hot[key] = None
+            while len(self._hot) > PREFETCH_LIMIT:
+                self._hot.popitem(last=False)
+            if added:
+                self._start_workers()
+                self._condition.notify_all()
+        return added
+
+    def prioritize(self, language: str) -> None:
+        """之後優先生成指定語言的預覽"""
+        with self._condition:
+            self.priority_language = language
+
+    @contextlib.contextmanager
+    def foreground(self) -> Iterator[None]:
+        """標記前景生成請求進行中；期間工作執行緒不開始新的工作
+
+        已開始的背景工作會繼續完成（前景請求若與其相同會直接共用結果）。
+        """
+        with self._condition:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._foreground -= 1
+                self._condition.notify_all()
+
+    def _start_workers(self) -> None:
+        while len(self._workers) < self.max_workers:
+            thread = threading.Thread(target=self._worker, daemon=True,
+                                      name=f"preview-generator-{len(self._workers)}")
+            self._workers.append(thread)
+            thread.start()
+
+    def _next_job(self) -> Optional[Tuple[Tuple[str, str], Tuple[str, str, Callable]]]:
+        """取出下一個工作（預先提取、優先語言，其餘依提交順序）；佇列為空時返回 None"""
+        with self._condition:
+            # 前景有生成請求時等待，不與其競爭速率限制額度
+            while self._foreground and self._pending:
+                self._condition.wait()
+            if not self._pending:
+                # 在鎖內登記結束，request() 才能正確判斷是否需要啟動新的執行緒
+                self._workers.remove(threading.current_thread())
+                return None
+            if self._hot:
+                key, _ = self._hot.popitem()
+                self.prefetched += 1
+            else:
+                key = next(
+                    (k for k in self._pending if k[1] == self.priority_language),
+                    next(iter(self._pending))
+                )
+            requesters = self._pending.pop(key)
+            api_key = next(reversed(requesters))
+            model_name, save_func = requesters[api_key]
+            self._in_flight[key] = requesters
+            self.progress.started(key)
+            return key, (api_key, model_name, save_func)
+
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._finish_batch()
+                return
+            key, request = job
+            start_time = time.time()
+            try:
+                self._generate(key, *request)
+            except Exception as e:
+                print(f"生成 {key[0]} ({key[1]}) 預覽時發生錯誤：{e}")
+                self._record_failure(key, request[0], str(e))
+                continue
+            with self._condition:
+                self._in_flight.pop(key, None)
+                self.failed = {k: v for k, v in self.failed.items()
+                               if k[:2] != key}
+            self.progress.finished(key, time.time() - start_time)
+
+    def _record_failure(self, key: Tuple[str, str], api_key: str,
+                        error: str) -> None:
+        """記錄使用某個金鑰生成失敗；還有其他請求者時改用其金鑰重新排入佇列"""
+        with self._condition:
+            failure_key = (key[0], key[1], api_key)
+            attempts = self.failed.get(failure_key, (0.0, 0, ""))[1] + 1
+            backoff = min(FAILURE_BACKOFF * 2 ** (attempts - 1),
+                          FAILURE_BACKOFF_MAX)
+            self.failed[failure_key] = (time.time() + backoff, attempts, error)
+            requesters = self._in_flight.pop(key)
+            requesters.pop(api_key, None)
+            self.progress.failed(key, error)
+            if requesters:
+                # 其他工作階段也請求了這個預覽，改用下一位請求者的金鑰生成
+                self._pending[key] = requesters
+                self.progress.queued(key)
+            else:
+                self._hot.pop(key, None)
+
+    def _generate(self, key: Tuple[str, str], api_key: str, model_name: str,
+                  save_func: Callable) -> None:
+        voice, language = key
+
+        def synthesize() -> bytes:
+            client = gemini_client_pool.get_client(api_key)
+            result = async_synthesis_engine.get_engine().submit(
+                client, preview_texts.build_preview_job(voice, language, model_name)
+            ).result()
+            if not result.ok:
+                raise result.error or RuntimeError("沒有音訊資料")
+            return result.audio_data
+
+        # 與網頁上的點擊或 generate_all_voice_previews.py 同時生成同一個預覽時只生成一次
+        entry = preview_index.generate_preview(
+            self.index, voice, language, synthesize, save_func,
+            pregenerated=True
+        )
+        # 已在封裝檔中的預覽不需要重新打包
+        if entry is not None and entry.pregenerated and entry.offset is None:
+            with self._condition:
+                self._unpacked += 1
+
+    def _finish_batch(self) -> None:
+        """佇列清空後由最後一個結束的工作執行緒重新打包預覽封裝檔"""
+        with self._condition:
+            if self._pending or self._in_flight or not self._unpacked:
+                return
+            self._unpacked = 0
+        try:
+            preview_index.rebuild_archive(self.index.preview_dir,
+                                          self.index.archive_path)
+            self.index.scan()
+        except OSError as e:
+            print(f"重新打包預覽封裝檔失敗：{e}")
+
+
+@st.cache_resource(show_spinner=False)
+def get_preview_generator() -> PreviewGenerator:
+    """取得伺服器共用的背景預覽生成服務"""
+    return PreviewGenerator(preview_index.get_preview_index())
 
 
 def check_generation_status(voice_options: List[str],
-                            language: str) -> Dict[str, int]:
+                            language: str) -> Dict[str, Any]:
     """
     檢查預覽生成狀態
-    
+
+    讀取生成服務發布的進度，不存取檔案系統；
+    只有在該語言第一次查詢時才從預覽索引計算已存在的數量。
+
     Args:
         voice_options: 語音選項列表
         language: 語言代碼
-    
+
     Returns:
-        包含 'total' 和 'completed' 的字典
+        包含 'total'、'completed'、'percentage'、'pending'、'in_flight'、
+        'failed' 與 'eta_seconds' 的字典
     """
-    total = len(voice_options)
-    completed = sum(1 for voice in voice_options
-                    if os.path.exists(f"preview_{voice}_{language}.wav"))
-    
-    return {
-        'total': total,
-        'completed': completed,
-        'percentage': int((completed / total) * 100) if total > 0 else 0
-    }
+    progress = get_preview_generator().progress
+    if not progress.is_registered(language):
+        missing = preview_index.get_preview_index().missing(voice_options,
+                                                            language)
+        progress.register_language(language, len(voice_options),
+                                   len(voice_options) - len(missing))
+    return progress.snapshot(language)['language']
+
+
+def _format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "估算中"
+    if seconds < 60:
+        return f"約 {seconds:.0f} 秒"
+    return f"約 {seconds / 60:.0f} 分鐘"
 
 
 def ensure_all_previews_ready(
@@ -92,52 +446,58 @@ def ensure_all_previews_ready(
     api_key: str,
     language: str,
     model_name: str,
-    generate_preview_func: Callable,
     save_wave_func: Callable,
-    show_ui: bool = True
+    show_ui: bool = True,
+    languages: Optional[List[str]] = None
 ) -> bool:
     """
     確保所有預覽都已準備就緒
-    
+
     Args:
         voice_options: 語音選項列表
         api_key: Gemini API 金鑰
-        language: 語言代碼
+        language: 目前選擇的語言代碼（優先生成）
         model_name: TTS 模型名稱
-        generate_preview_func: 生成預覽的函數
         save_wave_func: 儲存音訊的函數
         show_ui: 是否顯示 UI 元素
-    
+        languages: 要在背景生成的所有語言（None 表示只生成目前的語言）
+
     Returns:
-        是否所有預覽都已準備就緒
+        目前語言的所有預覽是否都已準備就緒
     """
     if not api_key:
         return False
-    
-    # 檢查當前狀態
-    status = check_generation_status(voice_options, language)
-    
-    if status['completed'] == status['total']:
-        return True
-    
-    # 如果尚未開始生成，啟動背景生成
-    if 'preview_generation_thread' not in st.session_state:
-        st.session_state.preview_generation_thread = \
-            start_background_generation(
-                voice_options,
-                api_key,
-                language,
-                model_name,
-                generate_preview_func,
-                save_wave_func
-            )
-    
+
+    generator = get_preview_generator()
+
+    # 每個工作階段在第一次執行與切換語言時才提交工作，之後的重新執行不需要檢查
+    if st.session_state.get('preview_generation_language') != language:
+        st.session_state.preview_generation_language = language
+        generator.request(
+            voice_options,
+            [language] + [other for other in (languages or [])
+                          if other != language],
+            api_key, model_name, save_wave_func,
+            priority_language=language
+        )
+
+    # 讀取生成服務發布的進度（成本與語音、語言數量無關）
+    snapshot = generator.progress.snapshot(language)
+    status = snapshot['language']
+    remaining = status['pending'] + status['in_flight']
+
     # 顯示進度（如果需要）
-    if show_ui and status['completed'] < status['total']:
+    if show_ui and remaining:
         with st.sidebar:
             st.markdown("---")
             st.markdown("### 🎵 語音預覽")
             st.progress(status['percentage'] / 100)
-            st.info(f"正在背景生成預覽... ({status['completed']}/{status['total']})")
-    
-    return status['completed'] == status['total'] 
\ No newline at end of file
+            st.info(f"正在背景生成預覽... ({status['completed']}/{status['total']})，"
+                    f"剩餘時間{_format_eta(status['eta_seconds'])}")
+            if snapshot['current']:
+                voice, current_language = snapshot['current']
+                st.caption(f"目前生成：{voice}（{current_language}）")
+            if status['failed']:
+                st.caption(f"⚠️ {status['failed']} 個預覽生成失敗，點擊播放時會重新生成")
+
+    return status['completed'] == status['total']
@@ -0,0 +1,244 @@
+"""
+批次合成模組
+讀取 JSONL 清單檔，每一行是一個單一講者或多講者的合成工作，
+透過非同步合成引擎並行執行，並將完成的工作記錄在檢查點檔案中，
+中斷後重新執行時會跳過已完成的工作
+"""
+
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import async_synthesis_engine
+import tts_synthesis
+
+
+def load_manifest(manifest_path: str) -> List[Dict[str, Any]]:
+    """讀取清單檔
+
+    每一行為一個 JSON 物件，例如：
+        {"id": "ch1", "text": "第一章...", "voice": "Kore", "style": "平靜的", "output": "out/ch1.wav"}
+        {"id": "ep1", "mode": "multi", "speakers": [{"name": "主持人", "voice": "Kore"},
+         {"name": "嘉賓", "voice": "Puck"}], "content": "主持人：...", "output": "out/ep1.wav"}
+        {"id": "ep2", "mode": "multi", "dialogue": "dialogue.json", "output": "out/ep2.wav"}
+
+    未指定 id 時以輸出路徑作為工作 id。
+
+    Raises:
+        ValueError: 清單格式錯誤
+    """
+    entries = []
+    seen_ids = set()
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"清單第 {line_no} 行不是有效的 JSON：{e}")
+            if not entry.get("output"):
+                raise ValueError(f"清單第 {line_no} 行缺少 output 欄位")
+
+            entry.setdefault("id", entry["output"])
+            if entry["id"] in seen_ids:
+                raise ValueError(f"清單第 {line_no} 行的 id 重複：{entry['id']}")
+            seen_ids.add(entry["id"])
+            entries.append(entry)
+    return entries
+
+
+def build_job(entry: Dict[str, Any], default_model: str,
+              default_voice: str = "Kore",
+              use_cache: bool = True) -> async_synthesis_engine.SynthesisJob:
+    """將清單項目轉換為合成工作
+
+    Raises:
+        ValueError: 項目內容不完整
+    """
+    model = entry.get("model", default_model)
+
+    if entry.get("mode", "single") == "multi":
+        speakers = entry.get("speakers")
+        content = entry.get("content")
+        if entry.get("dialogue"):
+            with open(entry["dialogue"], "r", encoding="utf-8") as f:
+                dialogue_data = json.load(f)
+            speakers = dialogue_data.get("speakers", [])
+            content = dialogue_data.get("content", "")
+
+        if not speakers or len(speakers) < 2:
+            raise ValueError("需要至少 2 個講者")
+        if not content:
+            raise ValueError("缺少對話內容")
+
+        return async_synthesis_engine.SynthesisJob(
+            model=model,
+            contents=f"TTS 以下對話：\n{content}",
+            config=tts_synthesis.build_multi_speaker_config(speakers),
+            key=entry["id"],
+            use_cache=use_cache
+        )
+
+    text = entry.get("text")
+    if not text:
+        raise ValueError("缺少 text 欄位")
+    if entry.get("style"):
+        text = f"{entry['style']}地說：{text}"
+
+    return async_synthesis_engine.SynthesisJob(
+        model=model,
+        contents=text,
+        config=tts_synthesis.build_single_speaker_config(
+            entry.get("voice", default_voice)
+        ),
+        key=entry["id"],
+        use_cache=use_cache
+    )
+
+
+def default_checkpoint_path(manifest_path: str) -> str:
+    """清單檔對應的預設檢查點路徑"""
+    return f"{manifest_path}.checkpoint.jsonl"
+
+
+def load_checkpoint(checkpoint_path: str) -> Set[str]:
+    """讀取檢查點，返回已完成的工作 id
+
+    檢查點為僅附加的 JSONL 檔案；中斷時最後一行可能不完整，會被忽略。
+    """
+    completed = set()
+    if not os.path.exists(checkpoint_path):
+        return completed
+
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "done":
+                completed.add(record["id"])
+    return completed
+
+
+def run_batch(
+    client: Any,
+    manifest_path: str,
+    save_func: Callable,
+    default_model: str,
+    checkpoint_path: Optional[str] = None,
+    concurrency: int = async_synthesis_engine.DEFAULT_MAX_CONCURRENCY,
+    use_cache: bool = True,
+    bytes_per_second: Optional[int] = None,
+    postprocess: Optional[Callable[[bytes, int], bytes]] = None,
+    default_voice: str = "Kore"
+) -> Dict[str, Any]:
+    """執行批次合成
+
+    Args:
+        client: Gemini 客戶端
+        manifest_path: JSONL 清單檔路徑
+        save_func: 儲存音訊的函數 save_func(檔名, PCM 資料, rate=取樣率)，
+                   取樣率依各工作的模型決定
+        default_model: 項目未指定模型時使用的模型
+        checkpoint_path: 檢查點檔案路徑（預設為清單檔旁的 .checkpoint.jsonl）
+        concurrency: 同時進行的請求數上限
+        use_cache: 是否使用合成快取
+        bytes_per_second: PCM 每秒位元組數，用於計算音訊長度
+                          （None 表示依各工作模型的輸出取樣率計算）
+        postprocess: 寫檔前的 PCM 後處理函數 postprocess(PCM 資料, 取樣率)
+                     （例如 audio_postprocess.process），取樣率依各工作的模型決定
+        default_voice: 單一講者項目未指定語音時使用的語音
+
+    Returns:
+        統計資料字典（total、skipped、done、failed、elapsed）
+    """
+    entries = load_manifest(manifest_path)
+    checkpoint_path = checkpoint_path or default_checkpoint_path(manifest_path)
+    completed_ids = load_checkpoint(checkpoint_path)
+
+    # 已完成且輸出檔仍存在的工作直接跳過
+    pending = [e for e in entries
+               if not (e["id"] in completed_ids and os.path.exists(e["output"]))]
+    stats = {
+        "total": len(entries),
+        "skipped": len(entries) - len(pending),
+        "done": 0,
+        "failed": 0,
+        "elapsed": 0.0,
+    }
+
+    print(f"批次工作：共 {stats['total']} 個，"
+          f"已完成 {stats['skipped']} 個，待處理 {len(pending)} 個")
+
+    jobs = []
+    outputs = {}
+    for entry in pending:
+        try:
+            jobs.append(build_job(entry, default_model, default_voice,
+                                  use_cache=use_cache))
+            outputs[entry["id"]] = entry["output"]
+        except (OSError, ValueError) as e:
+            print(f"✗ {entry['id']}：{e}")
+            stats["failed"] += 1
+
+    if not jobs:
+        return stats
+
+    start_time = time.perf_counter()
+    audio_seconds = 0.0
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        def on_result(result: async_synthesis_engine.JobResult):
+            nonlocal audio_seconds
+            job_id = result.job.key
+            output = outputs[job_id]
+
+            error = result.error
+            # 各工作可能指定不同的模型，取樣率在收到該工作的音訊後才能確定
+            rate = tts_synthesis.output_sample_rate(result.job.model)
+            if result.ok:
+                # 後處理或寫檔失敗只記為此工作失敗，不中斷其餘工作
+                try:
+                    if postprocess:
+                        result.audio_data = postprocess(result.audio_data, rate)
+                    output_dir = os.path.dirname(output)
+                    if output_dir:
+                        os.makedirs(output_dir, exist_ok=True)
+                    save_func(output, result.audio_data, rate=rate)
+                except Exception as e:
+                    error = e
+
+            if error is None:
+                # 輸出檔寫入後才記錄完成，確保中斷時不會遺漏
+                checkpoint.write(json.dumps({
+                    "id": job_id,
+                    "output": output,
+                    "status": "done",
+                    "elapsed": round(result.elapsed, 3),
+                }, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+
+                stats["done"] += 1
+                audio_seconds += len(result.audio_data) / (bytes_per_second
+                                                           or rate * 2)
+                status = f"✓ {job_id}（{result.elapsed:.1f} 秒）"
+            else:
+                stats["failed"] += 1
+                status = f"✗ {job_id}：{error}"
+
+            finished = stats["done"] + stats["failed"]
+            wall = time.perf_counter() - start_time
+            print(f"[{finished}/{len(pending)}] {status} | "
+                  f"{finished / wall * 60:.1f} 個/分鐘，"
+                  f"即時倍率 {audio_seconds / wall:.1f}x", flush=True)
+
+        async_synthesis_engine.get_engine().run_jobs(
+            client, jobs, on_result=on_result, max_concurrency=concurrency
+        )
+
+    stats["elapsed"] = time.perf_counter() - start_time
+    return stats
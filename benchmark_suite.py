@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+效能基準測試套件
+以模擬後端（mock_backend）離線執行，不需要 API 金鑰，涵蓋：
+- 語音預覽查找（冷啟動生成、共用預覽快取、預先生成檔案、封裝檔、預覽伺服器）
+- 預覽編碼（每次點擊的傳送量、編碼耗時與音質）
+- 大型 SRT / TXT 檔案解析
+- 長對話腳本的清理與風格套用
+- WAV 寫入
+- 音訊後處理（響度標準化、去除靜音）與採樣率／聲道轉換
+- 輸出格式的串流編碼（WAV、PCM 與已安裝後端的 FLAC／Opus／MP3）
+- 批次合成的端對端吞吐量
+
+結果儲存為 JSON，可用 --compare 與先前的結果比較
+
+用法：
+    python benchmark_suite.py
+    python benchmark_suite.py --only parsing wav
+    python benchmark_suite.py --compare benchmarks/20250601_120000_abc1234.json
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# 基準測試不應受速率限制器的預設配額影響，須在載入合成模組前設定
+os.environ.setdefault("GEMINI_TTS_RPM", "100000")
+os.environ.setdefault("GEMINI_TTS_MAX_RPM", "100000")
+os.environ.setdefault("GEMINI_TTS_MAX_IN_FLIGHT", "64")
+# 預覽伺服器改用系統指定的連接埠，避免與執行中的應用程式衝突
+os.environ.setdefault("GEMINI_TTS_PREVIEW_PORT", "0")
+
+import numpy as np
+import streamlit.logger
+
+import audio_convert
+import audio_encoders
+import audio_postprocess
+import batch_runner
+import file_upload_module
+import mock_backend
+import preview_archive
+import preview_cache
+import preview_encoding
+import preview_index
+import preview_server
+import preview_texts
+import tts_synthesis
+import voice_preview_widget
+import wav_writer
+from gemini_tts_app import apply_styles_to_dialogue, clean_dialogue_text
+
+# 直接執行時 Streamlit 會對每個元件呼叫發出 bare mode 警告
+streamlit.logger.get_logger(
+    "streamlit.runtime.scriptrunner_utils.script_run_context"
+).disabled = True
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT_DIR = os.path.join(SOURCE_DIR, "benchmarks")
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], Dict[str, Dict[str, Any]]]] = {}
+
+
+def benchmark(name: str):
+    """註冊一組基準測試"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int = 1,
+            setup: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """重複執行 func 並計算耗時統計（setup 不計入耗時）"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start_time)
+
+    samples.sort()
+    mean = statistics.mean(samples)
+    return {
+        "iterations": iterations,
+        "mean_ms": mean * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "min_ms": samples[0] * 1000,
+        "ops_per_sec": 1.0 / mean if mean else 0.0,
+    }
+
+
+def make_client(args: argparse.Namespace) -> mock_backend.FakeGeminiClient:
+    return mock_backend.FakeGeminiClient(mock_backend.MockConfig(
+        latency=mock_backend.LatencyModel(
+            distribution="lognormal" if args.jitter else "fixed",
+            base=args.latency,
+            jitter=args.jitter
+        ),
+        seed=0
+    ))
+
+
+@benchmark("preview")
+def bench_preview(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """透過 _play_preview_with_placeholder 查找語音預覽"""
+    client = make_client(args)
+    voice, language = "Zephyr", "zh-TW"
+    model = preview_texts.DEFAULT_PREVIEW_MODEL
+    pregenerated_file = os.path.join(
+        "voice_previews", f"preview_{voice}_{language}.wav"
+    )
+
+    def generate(api_key, voice_name, lang, model_name):
+        return tts_synthesis.synthesize(
+            client, model_name,
+            preview_texts.get_preview_text(voice_name, lang),
+            tts_synthesis.build_single_speaker_config(voice_name),
+            use_cache=False
+        )
+
+    def lookup():
+        voice_preview_widget._play_preview_with_placeholder(
+            voice, language, "mock", model, generate,
+            wav_writer.write_wav_file, "bench"
+        )
+
+    def reset():
+        preview_cache.get_preview_cache().clear()
+        preview_index.get_preview_index().remove(voice, language)
+        if os.path.exists(pregenerated_file):
+            os.remove(pregenerated_file)
+
+    results = {}
+    results["preview.cold"] = measure(lookup, args.iterations, setup=reset)
+
+    reset()
+    lookup()
+    results["preview.warm_cache"] = measure(lookup, args.iterations * 10)
+
+    reset()
+    os.makedirs("voice_previews", exist_ok=True)
+    wav_writer.write_wav_file(pregenerated_file, generate(None, voice, language, model))
+    preview_index.get_preview_index().add(voice, language, pregenerated_file,
+                                          pregenerated=True)
+
+    def lookup_pregenerated():
+        # 每次都清除預覽快取，量測從預覽索引讀取檔案的成本
+        preview_cache.get_preview_cache().clear()
+        lookup()
+
+    results["preview.warm_pregenerated"] = measure(lookup_pregenerated,
+                                                   args.iterations * 10)
+
+    # 打包成封裝檔後改由 mmap 區段讀取
+    index = preview_index.get_preview_index()
+    preview_index.rebuild_archive("voice_previews", index.archive_path)
+    index.scan()
+    results["preview.warm_archive"] = measure(lookup_pregenerated,
+                                              args.iterations * 10)
+
+    # 透過預覽伺服器播放：重複播放時瀏覽器只以 ETag 重新驗證（304）
+    server = voice_preview_widget.get_preview_server()
+    if server is not None:
+        results.update(_bench_preview_http(server, voice, language,
+                                           args.iterations * 10))
+    os.remove(index.archive_path)
+    reset()
+    index.scan()
+    return results
+
+
+def _bench_preview_http(server, voice: str, language: str,
+                        iterations: int) -> Dict[str, Dict[str, Any]]:
+    """預覽伺服器首次下載與重新驗證的延遲及傳送量"""
+    path = preview_server.preview_path(voice, language)
+
+    def fetch(headers: Optional[Dict[str, str]] = None) -> http.client.HTTPResponse:
+        connection = http.client.HTTPConnection("127.0.0.1", server.port)
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        response.body = response.read()
+        connection.close()
+        return response
+
+    first = fetch()
+    etag = first.getheader("ETag")
+    results = {
+        "preview.http_full": measure(fetch, iterations),
+        "preview.http_revalidate": measure(
+            lambda: fetch({"If-None-Match": etag}), iterations
+        ),
+    }
+    results["preview.http_full"]["payload_bytes"] = len(first.body)
+    results["preview.http_revalidate"]["payload_bytes"] = len(
+        fetch({"If-None-Match": etag}).body
+    )
+    return results
+
+
+@benchmark("encoding")
+def bench_encoding(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """預覽編碼的傳送量與點擊延遲（封裝檔區段 → base64 內嵌 HTML）"""
+    source = os.path.join(SOURCE_DIR, "voice_previews", "preview_Kore_zh-TW.wav")
+    if os.path.exists(source):
+        with open(source, "rb") as f:
+            original = f.read()
+    else:
+        original = preview_encoding.encode_pcm(
+            mock_backend.synthetic_pcm("x" * 12 * 6), encoding="wav"
+        )
+    samples, rate = preview_encoding.read_wav(original)
+    os.makedirs("encoding_src", exist_ok=True)
+    source_path = os.path.join("encoding_src", "preview_Kore_zh-TW.wav")
+    with open(source_path, "wb") as f:
+        f.write(original)
+
+    results = {}
+    for encoding in preview_encoding.ENCODINGS:
+        archive_path = f"encoding_{encoding}.pack"
+        preview_archive.build_archive(
+            archive_path, [("Kore", "zh-TW", source_path)], encoding
+        )
+        archive = preview_archive.PreviewArchive(archive_path)
+        payload = archive.get("Kore", "zh-TW")
+
+        result = measure(
+            lambda: voice_preview_widget._autoplay_html(
+                "bench", voice_preview_widget._inline_source(payload)
+            ),
+            args.iterations * 10
+        )
+        encode = measure(
+            lambda: preview_encoding.encode_wav(original, encoding),
+            args.iterations
+        )
+        result["encode_ms"] = encode["mean_ms"]
+        result["stored_bytes"] = len(payload)
+        result["payload_bytes"] = len(
+            voice_preview_widget._autoplay_html(
+                "bench", voice_preview_widget._inline_source(payload)
+            ).encode("utf-8")
+        )
+        result["snr_db"] = _encoding_snr(samples, rate, bytes(payload), encoding)
+        results[f"encoding.{encoding}"] = result
+
+    baseline = results["encoding.wav"]["payload_bytes"]
+    for result in results.values():
+        result["payload_ratio"] = baseline / result["payload_bytes"]
+    return results
+
+
+def _encoding_snr(samples: np.ndarray, rate: int, data: bytes,
+                  encoding: str) -> Optional[float]:
+    """編碼後的訊號雜訊比（與相同頻寬的原始訊號比較，dB；未轉換時為 None）"""
+    if encoding == "wav":
+        return None
+    reference = preview_encoding.resample(samples, rate,
+                                          preview_encoding.COMPACT_RATE)
+    # 壓縮編碼的標頭以 data 區塊結尾
+    body = np.frombuffer(data[data.index(b"data") + 8:], dtype=np.uint8)
+    if encoding == "mulaw":
+        decoded = preview_encoding.mulaw_decode(body).astype(np.float64)
+    else:
+        decoded = (body.astype(np.float64) - 128) * 256
+    length = min(len(reference), len(decoded))
+    noise = reference[:length] - decoded[:length]
+    return float(10 * np.log10(np.sum(reference[:length] ** 2)
+                               / max(np.sum(noise ** 2), 1e-9)))
+
+
+def _build_srt(blocks: int) -> str:
+    lines = []
+    for i in range(blocks):
+        start, end = i * 3, i * 3 + 2
+        text = (f"主持人：第 {i} 段字幕內容，今天我們來聊聊語音合成。" if i % 2
+                else f"第 {i} 段沒有講者標記的字幕內容。")
+        lines.append(f"{i + 1}\n00:{start // 60:02d}:{start % 60:02d},000 --> "
+                     f"00:{end // 60:02d}:{end % 60:02d},000\n{text}\n")
+    return "\n".join(lines)
+
+
+def _build_script(lines: int, speakers: List[str]) -> str:
+    script = []
+    for i in range(lines):
+        if i % 10 == 9:
+            script.append("（背景音樂漸弱）")
+        script.append(f"{speakers[i % 2]}：這是第 {i} 句對話，內容稍微長一點以接近真實的腳本。")
+    return "\n".join(script)
+
+
+@benchmark("parsing")
+def bench_parsing(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """file_upload_module 解析大型 SRT / TXT 檔案"""
+    srt_content = _build_srt(args.lines)
+    txt_content = _build_script(args.lines, ["主持人", "嘉賓"])
+    iterations = max(1, args.iterations // 2)
+
+    results = {
+        "parsing.srt": measure(
+            lambda: file_upload_module.process_uploaded_file(srt_content, "big.srt"),
+            iterations
+        ),
+        "parsing.txt": measure(
+            lambda: file_upload_module.process_uploaded_file(txt_content, "big.txt"),
+            iterations
+        ),
+    }
+    results["parsing.srt"]["input_bytes"] = len(srt_content.encode("utf-8"))
+    results["parsing.txt"]["input_bytes"] = len(txt_content.encode("utf-8"))
+    return results
+
+
+@benchmark("dialogue")
+def bench_dialogue(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """長對話腳本的 clean_dialogue_text / apply_styles_to_dialogue"""
+    script = _build_script(args.lines, ["主持人", "嘉賓"])
+    speakers = ["主持人", "嘉賓"]
+    styles = [["興奮的", "快速地"], ["平靜的"]]
+    cleaned, _ = clean_dialogue_text(script, speakers)
+    iterations = max(1, args.iterations // 2)
+
+    return {
+        "dialogue.clean": measure(
+            lambda: clean_dialogue_text(script, speakers), iterations
+        ),
+        "dialogue.clean_detect_speakers": measure(
+            lambda: clean_dialogue_text(script, ["講者1", "講者2"]), iterations
+        ),
+        "dialogue.apply_styles": measure(
+            lambda: apply_styles_to_dialogue(cleaned, speakers, styles), iterations
+        ),
+    }
+
+
+@benchmark("wav")
+def bench_wav(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """WAV 寫入（一次寫入與串流附加）"""
+    seconds = 60
+    pcm = mock_backend.synthetic_pcm("x" * 12 * seconds)
+    chunk_size = 24000  # 0.5 秒
+
+    def write_streaming():
+        with wav_writer.WavWriter("bench_stream.wav") as writer:
+            for i in range(0, len(pcm), chunk_size):
+                writer.append_frames(pcm[i:i + chunk_size])
+
+    results = {
+        "wav.write_file": measure(
+            lambda: wav_writer.write_wav_file("bench_full.wav", pcm),
+            args.iterations
+        ),
+        "wav.write_streaming": measure(write_streaming, args.iterations),
+    }
+    for result in results.values():
+        result["audio_seconds"] = seconds
+        result["mb_per_sec"] = len(pcm) / 1e6 * result["ops_per_sec"]
+    return results
+
+
+@benchmark("postprocess")
+def bench_postprocess(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """音訊後處理（去除靜音、響度標準化、淡入淡出）"""
+    config = audio_postprocess.PostProcessConfig()
+    results = {}
+    for name, seconds in (("postprocess.clip_3s", 3), ("postprocess.long_60s", 60)):
+        pcm = mock_backend.synthetic_pcm("x" * 12 * seconds)
+        result = measure(lambda: audio_postprocess.process(pcm, config=config),
+                         args.iterations)
+        result["audio_seconds"] = seconds
+        result["realtime_factor"] = seconds * result["ops_per_sec"]
+        results[name] = result
+    return results
+
+
+@benchmark("convert")
+def bench_convert(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """採樣率與聲道轉換（24kHz 單聲道 → 輸出設定）"""
+    seconds = 60
+    pcm = mock_backend.synthetic_pcm("x" * 12 * seconds)
+    results = {}
+    for target_rate, channels in ((16000, 1), (8000, 1), (16000, 2), (48000, 1)):
+        result = measure(
+            lambda: audio_convert.convert(pcm, 24000, target_rate, 1, channels),
+            args.iterations
+        )
+        result["audio_seconds"] = seconds
+        result["realtime_factor"] = seconds * result["ops_per_sec"]
+        results[f"convert.{target_rate}_{channels}ch"] = result
+    return results
+
+
+@benchmark("encoders")
+def bench_encoders(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """輸出格式的串流編碼速度與檔案大小（只測量已安裝後端的格式）"""
+    seconds = 60
+    pcm = mock_backend.synthetic_pcm("x" * 12 * seconds)
+    chunk_size = 24000  # 0.5 秒
+
+    results = {}
+    for name in audio_encoders.available_formats():
+        path = f"bench_encode{audio_encoders.FORMATS[name].extension}"
+        encoders = []
+
+        def encode_streaming():
+            with audio_encoders.open_encoder(path, name) as encoder:
+                for i in range(0, len(pcm), chunk_size):
+                    encoder.write(pcm[i:i + chunk_size])
+            encoders.append(encoder)
+
+        result = measure(encode_streaming, args.iterations)
+        stats = encoders[-1].stats
+        result["backend"] = stats.backend
+        result["audio_seconds"] = seconds
+        result["realtime_factor"] = seconds * result["ops_per_sec"]
+        result["payload_bytes"] = stats.bytes_out
+        result["compression_ratio"] = stats.compression_ratio
+        results[f"encoders.{name}"] = result
+    return results
+
+
+@benchmark("batch")
+def bench_batch(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """批次合成的端對端吞吐量（清單 → 引擎 → 模擬後端 → WAV 檔案）"""
+    client = make_client(args)
+    manifest_path = "bench_manifest.jsonl"
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        for i in range(args.batch_jobs):
+            f.write(json.dumps({
+                "id": f"job{i}",
+                "text": f"第 {i} 個批次工作，用來測量端對端的合成吞吐量。",
+                "voice": "Kore",
+                "output": os.path.join("batch_out", f"job{i}.wav"),
+            }, ensure_ascii=False) + "\n")
+
+    checkpoint_path = batch_runner.default_checkpoint_path(manifest_path)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = batch_runner.run_batch(
+            client, manifest_path, wav_writer.write_wav_file,
+            "gemini-2.5-flash-preview-tts",
+            concurrency=args.concurrency,
+            use_cache=False
+        )
+
+    audio_bytes = client.stats()["audio_bytes"]
+    return {
+        "batch.throughput": {
+            "jobs": args.batch_jobs,
+            "done": stats["done"],
+            "failed": stats["failed"],
+            "concurrency": args.concurrency,
+            "elapsed_sec": stats["elapsed"],
+            "jobs_per_sec": stats["done"] / stats["elapsed"] if stats["elapsed"] else 0.0,
+            "realtime_factor": (audio_bytes / 48000) / stats["elapsed"]
+            if stats["elapsed"] else 0.0,
+            "peak_in_flight": client.stats()["peak_in_flight"],
+        }
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SOURCE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    """與先前的結果比較並列出平均耗時的變化"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    print(f"\n與 {baseline.get('commit', '?')}（{baseline_path}）比較：")
+    for name, result in current["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("mean_ms", "jobs_per_sec", "payload_bytes"):
+            if metric in result and metric in previous and previous[metric]:
+                change = (result[metric] - previous[metric]) / previous[metric] * 100
+                print(f"  {name:<32} {metric:<13} "
+                      f"{previous[metric]:>10.3f} → {result[metric]:>10.3f} "
+                      f"({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini TTS 效能基準測試（離線）")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS),
+                        help="只執行指定的測試組")
+    parser.add_argument("--iterations", type=int, default=20, help="每項測試的重複次數")
+    parser.add_argument("--lines", type=int, default=5000, help="解析與對話測試的行數")
+    parser.add_argument("--batch-jobs", type=int, default=200, help="批次測試的工作數")
+    parser.add_argument("--concurrency", type=int, default=8, help="批次測試的並行數")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="模擬後端的延遲中位數（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="延遲的對數常態形狀參數（0 表示固定延遲）")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="結果 JSON 的目錄")
+    parser.add_argument("--compare", help="要比較的先前結果 JSON 檔案")
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items()
+                   if k not in ("output_dir", "compare")},
+        "results": {},
+    }
+
+    # 在暫存目錄中執行，避免動到專案中的預覽檔案與快取
+    work_dir = tempfile.mkdtemp(prefix="tts_bench_")
+    os.environ.setdefault("GEMINI_TTS_CACHE_DIR", os.path.join(work_dir, "cache"))
+    original_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        for name in names:
+            print(f"▶ {name}：{BENCHMARKS[name].__doc__}", flush=True)
+            results = BENCHMARKS[name](args)
+            for result_name, result in results.items():
+                report["results"][result_name] = result
+                if "encode_ms" in result:
+                    print(f"  {result_name:<32} 平均 {result['mean_ms']:9.3f} ms  "
+                          f"傳送 {result['payload_bytes'] / 1024:8.1f} KiB"
+                          f"（{result['payload_ratio']:.1f}x），"
+                          f"編碼 {result['encode_ms']:.1f} ms"
+                          + (f"，SNR {result['snr_db']:.1f} dB"
+                             if result["snr_db"] is not None else ""))
+                elif "compression_ratio" in result:
+                    print(f"  {result_name:<32} 平均 {result['mean_ms']:9.3f} ms  "
+                          f"檔案 {result['payload_bytes'] / 1024:8.1f} KiB"
+                          f"（壓縮 {result['compression_ratio']:.1f}x），"
+                          f"即時倍率 {result['realtime_factor']:.0f}x"
+                          f"（{result['backend']}）")
+                elif "payload_bytes" in result:
+                    print(f"  {result_name:<32} 平均 {result['mean_ms']:9.3f} ms  "
+                          f"傳送 {result['payload_bytes'] / 1024:8.1f} KiB")
+                elif "mean_ms" in result:
+                    print(f"  {result_name:<32} 平均 {result['mean_ms']:9.3f} ms  "
+                          f"p95 {result['p95_ms']:9.3f} ms")
+                else:
+                    print(f"  {result_name:<32} "
+                          f"{result['jobs_per_sec']:.1f} 個/秒，"
+                          f"即時倍率 {result['realtime_factor']:.1f}x")
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(
+        args.output_dir,
+        f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['commit']}.json"
+    )
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 結果已儲存至：{output_path}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
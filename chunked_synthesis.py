@@ -0,0 +1,256 @@
+"""
+長文本分段合成模組
+依句子邊界（含中日文標點 。！？）切分長文本，透過非同步合成引擎
+以有限的並行數同時合成各段，再依原始順序拼接 PCM 資料或直接以串流編碼器寫入檔案
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+import async_synthesis_engine
+import audio_encoders
+import single_flight
+import tts_synthesis
+
+# 每段的預設最大字元數
+DEFAULT_MAX_CHARS = 400
+# 預設並行數
+DEFAULT_MAX_WORKERS = 4
+
+# 句尾標點（中日文與英文），標點保留在句子結尾
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;…])|(?<=[.])(?=\s)|\n+')
+# 句子過長時的次要切分點
+_CLAUSE_END = re.compile(r'(?<=[，,、：:])')
+# 子句仍過長時，優先在空白或右括號、引號、破折號之後切分，避免切斷單字
+_SOFT_BREAK = re.compile(r'(?<=[\s)）」』》\]—–-])')
+
+
+def split_sentences(text: str) -> List[str]:
+    """依句子邊界切分文本，忽略空白句子"""
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def _cut_point(text: str, max_chars: int) -> int:
+    """在前 max_chars 個字元內尋找最後一個空白或標點切分點，找不到時返回 max_chars"""
+    cut = max_chars
+    for match in _SOFT_BREAK.finditer(text, 1, max_chars + 1):
+        if 0 < len(text[:match.start()].rstrip()) <= max_chars:
+            cut = match.start()
+    return cut
+
+
+def _split_long_sentence(sentence: str, max_chars: int) -> List[str]:
+    """將超過長度上限的句子依子句切分，仍過長時在空白或標點處切分，
+    都找不到時才直接截斷"""
+    pieces = []
+    current = ""
+    for clause in _CLAUSE_END.split(sentence):
+        if not clause:
+            continue
+        if len(current) + len(clause) <= max_chars:
+            current += clause
+            continue
+        if current:
+            pieces.append(current)
+        while len(clause) > max_chars:
+            cut = _cut_point(clause, max_chars)
+            pieces.append(clause[:cut].rstrip())
+            clause = clause[cut:].lstrip()
+        current = clause
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text: str, max_chars: int = DEFAULT_MAX_CHARS,
+               style_prefix: str = "") -> List[str]:
+    """將文本切分為不超過 max_chars 的段落，盡量在句子邊界切分
+
+    風格前綴（例如「興奮的地說：」）會加回每一段開頭，確保每段都保有相同的語氣指示。
+    前綴由呼叫端明確提供，不從文本猜測，避免把「他對我說：」之類的敘述當成前綴重複朗讀。
+    不需要切分的文本維持原樣（保留換行）。
+
+    Args:
+        text: 要切分的文本（不含風格前綴）
+        max_chars: 每段的最大字元數（不含風格前綴）
+        style_prefix: 加在每一段開頭的風格前綴
+
+    Returns:
+        段落列表
+    """
+    if not text.strip():
+        return []
+    if len(text) <= max_chars:
+        return [f"{style_prefix}{text}"]
+
+    chunks = []
+    current = ""
+    for sentence in split_sentences(text):
+        if len(sentence) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_long_sentence(sentence, max_chars))
+            continue
+
+        # 英文句子之間需要保留空白
+        separator = " " if current and sentence[0].isascii() else ""
+        if len(current) + len(separator) + len(sentence) <= max_chars:
+            current += separator + sentence
+        else:
+            chunks.append(current)
+            current = sentence
+    if current:
+        chunks.append(current)
+
+    return [f"{style_prefix}{chunk}" for chunk in chunks]
+
+
+def _synthesize_chunks(
+    client: Any,
+    model: str,
+    text: str,
+    config: Any,
+    on_audio: Callable[[bytes], None],
+    max_chars: int,
+    max_workers: int,
+    use_cache: bool,
+    on_progress: Optional[Callable[[int, int], None]],
+    postprocess: Optional[Callable[..., bytes]] = None,
+    style_prefix: str = ""
+) -> None:
+    """分段並行合成，並依原始順序將各段 PCM 交給 on_audio
+
+    段落完成的順序不固定；前面的段落都交付後才交付下一段，
+    已交付的段落不再保留在記憶體中。提供 postprocess 時，
+    各段在交付前分別處理（例如響度標準化，讓各段音量一致），
+    並以 postprocess(PCM 資料, head=..., tail=...) 告知該段是否位於整段音訊的開頭或結尾，
+    去除靜音與淡入淡出只套用在外側邊緣，段落之間的停頓保持原樣。
+    """
+    chunks = chunk_text(text, max_chars, style_prefix) or [f"{style_prefix}{text}"]
+    jobs = [
+        async_synthesis_engine.SynthesisJob(model, chunk, config, key=i,
+                                            use_cache=use_cache)
+        for i, chunk in enumerate(chunks)
+    ]
+
+    ready: Dict[int, bytes] = {}
+    next_index = 0
+    completed = 0
+
+    def on_result(result: async_synthesis_engine.JobResult):
+        nonlocal next_index, completed
+        # 任一段失敗時立即中止，引擎會取消其餘段落；已完成的段落保留在快取中
+        if result.error is not None:
+            raise result.error
+        audio_data = result.audio_data
+        if postprocess:
+            key = result.job.key
+            audio_data = postprocess(audio_data, head=key == 0,
+                                     tail=key == len(chunks) - 1)
+        ready[result.job.key] = audio_data
+        result.audio_data = None
+        while next_index in ready:
+            on_audio(ready.pop(next_index))
+            next_index += 1
+        completed += 1
+        if on_progress:
+            on_progress(completed, len(chunks))
+
+    async_synthesis_engine.get_engine().run_jobs(
+        client, jobs, on_result=on_result, max_concurrency=max_workers
+    )
+
+
+def synthesize_chunked(
+    client: Any,
+    model: str,
+    text: str,
+    config: Any,
+    max_chars: int = DEFAULT_MAX_CHARS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    use_cache: bool = True,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    postprocess: Optional[Callable[..., bytes]] = None,
+    style_prefix: str = ""
+) -> bytes:
+    """分段並行合成長文本
+
+    各段以合成快取為單位儲存，因此中途失敗後重新執行時，
+    已完成的段落會直接從快取取得。
+
+    Args:
+        client: Gemini 客戶端
+        model: TTS 模型名稱
+        text: 要合成的文本（不含風格前綴）
+        config: 單一講者的 GenerateContentConfig
+        max_chars: 每段的最大字元數
+        max_workers: 同時進行的請求數上限
+        use_cache: 是否使用合成快取
+        on_progress: 進度回呼 (已完成段數, 總段數)，在呼叫端執行緒中執行
+        postprocess: 各段 PCM 的後處理函數 postprocess(PCM 資料, head=..., tail=...)
+        style_prefix: 加在每一段開頭的風格前綴（例如「興奮的地說：」）
+
+    Returns:
+        依原始順序拼接的 PCM 資料
+    """
+    parts: List[bytes] = []
+    _synthesize_chunks(client, model, text, config, parts.append,
+                       max_chars, max_workers, use_cache, on_progress,
+                       postprocess, style_prefix)
+    return b"".join(parts)
+
+
+def synthesize_chunked_to_file(
+    client: Any,
+    model: str,
+    text: str,
+    config: Any,
+    output_file: str,
+    max_chars: int = DEFAULT_MAX_CHARS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    use_cache: bool = True,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    postprocess: Optional[Callable[..., bytes]] = None,
+    output_format: Optional[str] = None,
+    style_prefix: str = ""
+) -> audio_encoders.EncodeStats:
+    """分段並行合成長文本，並依序以串流編碼器寫入檔案
+
+    其餘參數同 synthesize_chunked；各段交付後立即送進編碼器，
+    不需在記憶體中保留完整的 PCM 資料。編碼器寫入同目錄的暫存檔，
+    全部完成後才替換 output_file，合成失敗時不會留下不完整的輸出檔案。
+
+    Args:
+        output_file: 輸出檔案路徑
+        output_format: 輸出格式（wav、flac、opus、mp3 等，None 表示依副檔名判斷）
+
+    Returns:
+        編碼統計（音訊長度、編碼耗時與壓縮率）
+
+    Raises:
+        audio_encoders.EncoderUnavailableError: 沒有可用的編碼後端（在合成前檢查）
+    """
+    audio_encoders.resolve(output_file, output_format)
+    encoder: Optional[audio_encoders.AudioEncoder] = None
+
+    with single_flight.atomic_write(output_file) as temp_path:
+        def on_audio(pcm: bytes):
+            nonlocal encoder
+            if encoder is None:
+                # 收到第一段音訊後才知道模型輸出的採樣率；
+                # 暫存檔保留原副檔名，output_format 為 None 時仍可判斷格式
+                encoder = audio_encoders.open_encoder(
+                    temp_path, output_format,
+                    tts_synthesis.output_sample_rate(model)
+                )
+            encoder.write(pcm)
+
+        try:
+            _synthesize_chunks(client, model, text, config, on_audio,
+                               max_chars, max_workers, use_cache, on_progress,
+                               postprocess, style_prefix)
+        finally:
+            if encoder is not None:
+                encoder.close()
+    return encoder.stats
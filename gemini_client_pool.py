@@ -0,0 +1,136 @@
+"""
+Gemini 客戶端共用池模組
+以 API 金鑰和 HTTP 選項為鍵，在整個行程中共用 genai.Client，
+讓網頁介面、命令列工具和預覽生成器重複使用已建立的連線
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+import httpx
+from google import genai
+from google.genai import types
+
+import mock_backend
+
+# 閒置連線保留時間（秒），避免每次點擊預覽都重新進行 TLS 握手
+KEEPALIVE_EXPIRY = 120.0
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+_clients: Dict[str, genai.Client] = {}
+_lock = threading.Lock()
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "construct_seconds": 0.0,
+}
+
+
+def _normalize_http_options(
+    http_options: Optional[Union[types.HttpOptions, Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """將 HTTP 選項轉為可比較的字典"""
+    if http_options is None:
+        return {}
+    if isinstance(http_options, types.HttpOptions):
+        return http_options.model_dump(mode="json", exclude_none=True)
+    return dict(http_options)
+
+
+def _pool_key(api_key: str, options: Dict[str, Any]) -> str:
+    """產生共用池的鍵（不直接保存 API 金鑰明文）"""
+    canonical = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(f"{api_key}\0{canonical}".encode("utf-8")).hexdigest()
+
+
+def _with_keepalive(options: Dict[str, Any]) -> Dict[str, Any]:
+    """在未指定連線限制時，加入較長的 keep-alive 設定"""
+    options = dict(options)
+    limits = httpx.Limits(
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+    for field in ("client_args", "async_client_args"):
+        args = dict(options.get(field) or {})
+        args.setdefault("limits", limits)
+        options[field] = args
+    return options
+
+
+def get_client(
+    api_key: str,
+    http_options: Optional[Union[types.HttpOptions, Dict[str, Any]]] = None
+) -> genai.Client:
+    """取得共用的 Gemini 客戶端
+
+    相同的 API 金鑰和 HTTP 選項會取得同一個客戶端實例，
+    其底層的 HTTP 連線會被保留並重複使用。
+
+    Args:
+        api_key: Gemini API 金鑰
+        http_options: 傳給 genai.Client 的 HTTP 選項
+
+    Returns:
+        genai.Client 實例（設定 GEMINI_TTS_MOCK=1 時為模擬後端的假客戶端）
+    """
+    options = _normalize_http_options(http_options)
+    key = _pool_key(api_key, options)
+
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _stats["hits"] += 1
+            return client
+
+        start_time = time.perf_counter()
+        if mock_backend.is_enabled():
+            # 離線測試：以模擬後端取代真實的 API
+            client = mock_backend.FakeGeminiClient(
+                mock_backend.MockConfig.from_env()
+            )
+        else:
+            client = genai.Client(
+                api_key=api_key,
+                http_options=_with_keepalive(options)
+            )
+        # 只量到建構函數的耗時；連線與 TLS 握手在第一次請求時才進行
+        _stats["construct_seconds"] += time.perf_counter() - start_time
+        _stats["misses"] += 1
+        _clients[key] = client
+        return client
+
+
+def close_all() -> None:
+    """關閉並移除所有共用的客戶端"""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            print(f"關閉 Gemini 客戶端時發生錯誤：{e}")
+
+
+def get_pool_stats() -> Dict[str, float]:
+    """取得共用池統計資料
+
+    Returns:
+        包含客戶端數量、命中次數、建立次數、genai.Client 建構函數的平均耗時
+        以及重複使用所省下的建構時間的字典（不含連線建立與 TLS 握手，
+        重複使用客戶端實際省下的時間通常更多）
+    """
+    with _lock:
+        misses = _stats["misses"]
+        avg_construct = _stats["construct_seconds"] / misses if misses else 0.0
+        return {
+            "clients": len(_clients),
+            "hits": _stats["hits"],
+            "misses": misses,
+            "avg_construct_ms": avg_construct * 1000,
+            "saved_construct_ms": _stats["hits"] * avg_construct * 1000,
+        }
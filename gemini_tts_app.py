@@ -1,14 +1,29 @@
 import os
-import wave
+import wav_writer
 import streamlit as st
 from google import genai
 from google.genai import types
 from typing import List
 from datetime import datetime
+from dataclasses import asdict
 from dotenv import load_dotenv
 import file_upload_module
 import voice_preview_widget
 import background_preview_generator
+import gemini_client_pool
+import synthesis_cache
+import rate_limiter
+import retry_policy
+import tts_metrics
+import profiling
+import tts_synthesis
+import chunked_synthesis
+import preview_texts
+import preview_cache
+import preview_index
+import audio_postprocess
+import audio_convert
+import audio_encoders
 
 # 載入環境變數
 load_dotenv()
@@ -134,11 +149,13 @@ STYLE_SUGGESTIONS = {
 def save_wave_file(filename: str, pcm_data: bytes, channels: int = 1,
                    rate: int = 24000, sample_width: int = 2):
     """儲存 PCM 資料為 WAV 檔案"""
-    with wave.open(filename, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(rate)
-        wf.writeframes(pcm_data)
+    wav_writer.write_wav_file(filename, pcm_data, channels, rate, sample_width)
+
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_client(api_key: str) -> genai.Client:
+    """取得跨工作階段共用的 Gemini 客戶端"""
+    return gemini_client_pool.get_client(api_key)
 
 
 def generate_voice_preview(api_key: str, voice_name: str,
@@ -156,54 +173,24 @@ def generate_voice_preview(api_key: str, voice_name: str,
     Returns:
         音訊資料的 bytes
     """
-    # 根據語言選擇預覽文本
-    preview_texts = {
-        "zh-TW": f"您好，我是 {voice_name}。這是我的聲音預覽，希望您喜歡。",
-        "zh-CN": f"您好，我是 {voice_name}。这是我的声音预览，希望您喜欢。",
-        "en-US": (f"Hello, I am {voice_name}. This is a preview of my voice. "
-                  f"I hope you like it."),
-        "ja-JP": f"こんにちは、私は{voice_name}です。これは私の声のプレビューです。",
-        "ko-KR": f"안녕하세요, 저는 {voice_name}입니다. 제 목소리 미리듣기입니다.",
-        "es-US": (f"Hola, soy {voice_name}. Esta es una vista previa de "
-                  f"mi voz."),
-        "fr-FR": (f"Bonjour, je suis {voice_name}. Ceci est un aperçu de "
-                  f"ma voix."),
-        "de-DE": (f"Hallo, ich bin {voice_name}. Dies ist eine Vorschau "
-                  f"meiner Stimme."),
-    }
-    
-    # 如果語言不在預設列表中，使用英文
-    preview_text = preview_texts.get(language, preview_texts["en-US"])
+    # 根據語言選擇預覽文本（不在預設列表中的語言使用英文）
+    preview_text = preview_texts.get_preview_text(voice_name, language)
     
     try:
-        # 初始化 Gemini 客戶端
-        client = genai.Client(api_key=api_key)
+        # 取得共用的 Gemini 客戶端
+        client = get_gemini_client(api_key)
         
         # 準備生成配置
-        config = types.GenerateContentConfig(
-            response_modalities=["AUDIO"],
-            speech_config=types.SpeechConfig(
-                voice_config=types.VoiceConfig(
-                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                        voice_name=voice_name
-                    )
-                )
-            )
-        )
+        config = tts_synthesis.build_single_speaker_config(voice_name)
         
-        # 生成語音
-        response = client.models.generate_content(
-            model=model_name,
-            contents=preview_text,
-            config=config
+        # 生成語音（預覽已有獨立的檔案快取，不重複寫入合成快取）
+        return tts_synthesis.synthesize(
+            client, model_name, preview_text, config, use_cache=False
         )
-        
-        # 檢查回應是否有效
-        if response and response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-            return response.candidates[0].content.parts[0].inline_data.data
-        else:
-            return None
-            
+    
+    except tts_synthesis.NoAudioError:
+        return None
+    
     except Exception as e:
         st.error(f"生成預覽失敗：{str(e)}")
         return None
@@ -412,19 +399,10 @@ def main():
     st.title("🎙️ Gemini TTS 多語言文字轉語音系統")
     st.markdown("使用 Google Gemini API 將文字轉換為自然的語音")
     
-    # 在應用程式啟動時自動載入已存在的預覽檔案
-    if 'voice_previews' not in st.session_state:
-        st.session_state.voice_previews = {}
-        # 掃描目錄中的預覽檔案
-        for file in os.listdir("."):
-            if file.startswith("preview_") and file.endswith(".wav"):
-                # 從檔名中提取語音名稱和語言
-                parts = file[8:-4].split("_")  # 移除 "preview_" 和 ".wav"
-                if len(parts) >= 2:
-                    voice_name = parts[0]
-                    language = "_".join(parts[1:])  # 處理語言代碼中的底線
-                    preview_key = f"{voice_name}_{language}"
-                    st.session_state.voice_previews[preview_key] = file
+    # 預覽索引與預覽快取在伺服器啟動時建立一次，所有工作階段共用
+    preview_index.get_preview_index()
+    preview_cache.get_preview_cache()
+    preview_server = voice_preview_widget.get_preview_server()
     
     # 側邊欄設定
     with st.sidebar:
@@ -482,7 +460,27 @@ def main():
             channels = st.selectbox("聲道", [1, 2], index=0)
             
             st.markdown("### 輸出設定")
-            output_format = st.selectbox("輸出格式", ["WAV", "PCM"], index=0)
+            output_format = st.selectbox(
+                "輸出格式", audio_encoders.available_formats(), index=0,
+                format_func=lambda name: audio_encoders.FORMATS[name].label,
+                help="FLAC 為無損壓縮；Opus、MP3 為有損壓縮，檔案最小。"
+                     "壓縮格式需要安裝 soundfile、lameenc 或 ffmpeg"
+            )
+            postprocess = st.checkbox(
+                "音量標準化與去除靜音", value=True,
+                help="去除頭尾靜音、將響度標準化為一致的音量（長文本各段分別處理），並加上短淡入淡出"
+            )
+            
+            st.markdown("### 長文本設定")
+            chunk_workers = st.slider(
+                "分段合成並行數", min_value=1, max_value=8,
+                value=chunked_synthesis.DEFAULT_MAX_WORKERS,
+                help="單一講者長文本會依句子切分，並同時合成多個段落"
+            )
+            stream_mode = st.checkbox(
+                "串流模式", value=False,
+                help="整段以串流方式合成，收到第一段音訊即顯示進度與首段音訊延遲（不分段）"
+            )
         
         st.markdown("---")
         st.markdown("### 📚 使用說明")
@@ -512,9 +510,9 @@ def main():
             api_key,
             selected_language,
             model_name,
-            generate_voice_preview,
             save_wave_file,
-            show_ui=True  # 在側邊欄顯示進度
+            show_ui=True,  # 在側邊欄顯示進度
+            languages=list(SUPPORTED_LANGUAGES.keys())
         )
     
     # 主要內容區域
@@ -583,15 +581,14 @@ def main():
             key="single_text_content"
         )
         
-        # 如果有選擇風格，加入到提示中
+        # 如果有選擇風格，加入到提示中（長文本分段時加在每一段開頭）
+        style_prompt = ""
+        text_body = text_content
         if selected_styles and text_content:
             style_prompt = "，".join(selected_styles) + "地說："
-            if not text_content.startswith(style_prompt):
-                full_prompt = style_prompt + text_content
-            else:
-                full_prompt = text_content
-        else:
-            full_prompt = text_content
+            if text_content.startswith(style_prompt):
+                text_body = text_content[len(style_prompt):]
+        full_prompt = style_prompt + text_body
     
     else:  # 多講者模式
         st.subheader("多講者對話設定")
@@ -698,9 +695,10 @@ def main():
             return
         
         try:
-            with st.spinner("正在生成語音..."):
-                # 初始化 Gemini 客戶端
-                client = genai.Client(api_key=api_key)
+            # 設定 GEMINI_TTS_PROFILE=1 時記錄此次生成的效能分析
+            with st.spinner("正在生成語音..."), profiling.profile_from_env("app_generate"):
+                # 取得共用的 Gemini 客戶端
+                client = get_gemini_client(api_key)
                 
                 # 準備生成配置
                 if tts_mode == "單一講者":
@@ -791,25 +789,69 @@ def main():
                 with st.expander("調試信息 - 發送給 API 的提示"):
                     st.text(prompt)
                 
-                # 生成語音
-                response = client.models.generate_content(
-                    model=model_name,
-                    contents=prompt,
-                    config=config
-                )
+                # 生成語音（相同請求直接使用合成快取）
+                stream_stats = None
                 
-                # 檢查回應是否有效
-                if not response or not response.candidates:
-                    st.error("API 未返回有效的回應。請檢查您的輸入內容。")
-                    return
+                def postprocess_audio(pcm: bytes, head: bool = True,
+                                      tail: bool = True) -> bytes:
+                    # 取樣率依模型回應的 MIME 類型判斷（各段回應後才呼叫）；
+                    # 分段合成時只在整段音訊的頭尾去除靜音與淡入淡出
+                    return audio_postprocess.process(
+                        pcm, tts_synthesis.output_sample_rate(model_name),
+                        head=head, tail=tail
+                    )
                 
-                if not response.candidates[0].content or not response.candidates[0].content.parts:
+                try:
+                    # 生成期間背景預覽生成服務不開始新的工作，預先提取不與前景請求競爭
+                    with background_preview_generator.get_preview_generator().foreground():
+                        if stream_mode:
+                            # 串流合成：即時顯示已接收的音訊長度
+                            stream_status = st.empty()
+                            received = []
+                            
+                            def on_chunk(chunk: bytes):
+                                received.append(chunk)
+                                seconds = sum(len(c) for c in received) / (
+                                    tts_synthesis.output_sample_rate(model_name) * 2
+                                )
+                                stream_status.info(f"🎧 串流接收中... 已收到 {seconds:.1f} 秒音訊")
+                            
+                            stream_stats = tts_synthesis.synthesize_stream(
+                                client, model_name, prompt, config, on_chunk
+                            )
+                            audio_data = b"".join(received)
+                            stream_status.info(
+                                f"⏱️ 首段音訊延遲：{stream_stats.time_to_first_audio * 1000:.0f} 毫秒，"
+                                f"總耗時 {stream_stats.total_seconds:.1f} 秒"
+                            )
+                        elif tts_mode == "單一講者":
+                            # 長文本依句子切分後並行合成
+                            progress_bar = st.progress(0.0)
+                            audio_data = chunked_synthesis.synthesize_chunked(
+                                client, model_name, text_body, config,
+                                max_workers=chunk_workers,
+                                style_prefix=style_prompt,
+                                on_progress=lambda done, total: progress_bar.progress(
+                                    done / total, text=f"分段合成中... ({done}/{total})"
+                                ),
+                                postprocess=postprocess_audio if postprocess else None
+                            )
+                        else:
+                            audio_data = tts_synthesis.synthesize(
+                                client, model_name, prompt, config
+                            )
+                    
+                    # 串流與多講者的輸出整段處理（分段合成已逐段處理）
+                    if postprocess and (stream_mode or tts_mode != "單一講者"):
+                        audio_data = postprocess_audio(audio_data)
+                except tts_synthesis.NoAudioError:
                     st.error("API 回應中沒有音訊資料。可能是因為文本格式不正確或講者名稱不匹配。")
-                    st.info(f"當前講者設定：{speakers}")
+                    if tts_mode != "單一講者":
+                        st.info(f"當前講者設定：{speakers}")
+                    return
+                except retry_policy.CircuitOpenError as e:
+                    st.error(f"{e}（多次連續失敗，已暫停發送請求）")
                     return
-                
-                # 獲取音訊資料
-                audio_data = response.candidates[0].content.parts[0].inline_data.data
                 
                 # 創建輸出目錄
                 output_dir = "output"
@@ -818,23 +860,31 @@ def main():
                 
                 # 儲存檔案
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"gemini_tts_{timestamp}.wav"
+                file_format = audio_encoders.FORMATS[output_format]
+                filename = f"gemini_tts_{timestamp}{file_format.extension}"
                 filepath = os.path.join(output_dir, filename)
                 
-                if output_format == "WAV":
-                    save_wave_file(filepath, audio_data, channels, sample_rate)
-                else:
-                    # 儲存為 PCM
-                    filename = f"gemini_tts_{timestamp}.pcm"
-                    filepath = os.path.join(output_dir, filename)
-                    with open(filepath, "wb") as f:
-                        f.write(audio_data)
+                # 實際轉換為設定的採樣率與聲道數（只改寫 WAV 標頭會讓音訊變速）
+                source_rate = tts_synthesis.output_sample_rate(model_name)
+                audio_data = audio_convert.convert(
+                    audio_data, source_rate, sample_rate, 1, channels
+                )
+                
+                encode_stats = audio_encoders.encode_file(
+                    filepath, audio_data, output_format, sample_rate, channels
+                )
                 
                 st.success(f"✅ 語音生成成功！檔案已儲存為：{filepath}")
+                if output_format not in ("wav", "pcm"):
+                    st.caption(
+                        f"🗜️ {file_format.label}：{encode_stats.bytes_out / 1024 / 1024:.2f} MB"
+                        f"（壓縮 {encode_stats.compression_ratio:.1f}x），"
+                        f"編碼速度 {encode_stats.realtime_factor:.0f}x 即時"
+                    )
                 
                 # 顯示音訊播放器
-                if output_format == "WAV":
-                    st.audio(filepath)
+                if output_format != "pcm":
+                    st.audio(filepath, format=file_format.mime_type)
                 
                 # 下載按鈕
                 with col_download:
@@ -843,7 +893,7 @@ def main():
                             label="📥 下載音訊檔案",
                             data=f.read(),
                             file_name=filename,
-                            mime="audio/wav" if output_format == "WAV" else "audio/pcm",
+                            mime=file_format.mime_type,
                             use_container_width=True
                         )
                 
@@ -856,7 +906,16 @@ def main():
                         "語音": voice_name if tts_mode == "單一講者" else voice_configs,
                         "檔案路徑": filepath,
                         "採樣率": sample_rate,
-                        "聲道": channels
+                        "原始採樣率": source_rate,
+                        "編碼": encode_stats.summary(),
+                        "聲道": channels,
+                        "合成快取": synthesis_cache.get_default_cache().stats(),
+                        "速率限制": rate_limiter.get_default_limiter().stats(),
+                        "重試": retry_policy.get_default_policy().stats(),
+                        "預覽快取": preview_cache.get_preview_cache().stats(),
+                        "預覽伺服器": preview_server.stats() if preview_server else None,
+                        "效能指標": tts_metrics.get_default_registry().summary(),
+                        "串流": asdict(stream_stats) if stream_stats else None
                     })
         
         except Exception as e:
@@ -864,4 +923,6 @@ def main():
             st.exception(e)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # GEMINI_TTS_PROFILE=all 時分析每次重新執行（含 Streamlit 介面繪製）
+    with profiling.profile_from_env("app_rerun", scope="rerun"):
+        main() 
\ No newline at end of file
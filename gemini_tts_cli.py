@@ -6,13 +6,22 @@ Gemini TTS 命令列工具
 
 import os
 import sys
-import wave
+import contextlib
 import argparse
+import functools
 import json
-from google import genai
-from google.genai import types
 from typing import List, Dict
 from dotenv import load_dotenv
+import gemini_client_pool
+import synthesis_cache
+import tts_synthesis
+import chunked_synthesis
+import batch_runner
+import retry_policy
+import tts_metrics
+import profiling
+import audio_postprocess
+import audio_encoders
 
 # 載入環境變數
 load_dotenv()
@@ -26,38 +35,108 @@ VOICES = [
     "Vindemiatrix", "Sadachbia", "Sadaltager", "Sulafat"
 ]
 
-def save_wave_file(filename: str, pcm_data: bytes, channels: int = 1, rate: int = 24000, sample_width: int = 2):
-    """儲存 PCM 資料為 WAV 檔案"""
-    with wave.open(filename, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(rate)
-        wf.writeframes(pcm_data)
+def save_audio_file(filename: str, pcm_data: bytes, rate: int = 24000,
+                    output_format: str = None) -> audio_encoders.EncodeStats:
+    """儲存 PCM 資料為音訊檔案（格式依 output_format 或副檔名決定）"""
+    return audio_encoders.encode_file(filename, pcm_data, output_format, rate)
 
-def single_speaker_tts(client, model: str, text: str, voice: str, output_file: str):
-    """單一講者 TTS"""
-    print(f"使用語音 {voice} 生成單一講者語音...")
+def print_encode_stats(stats: audio_encoders.EncodeStats):
+    """顯示輸出檔案大小與編碼速度"""
+    label = audio_encoders.FORMATS[stats.format].label
+    print(f"🗜️ {label}（{stats.backend}）：{stats.audio_seconds:.1f} 秒音訊，"
+          f"{stats.bytes_out / 1024 / 1024:.2f} MB（壓縮 {stats.compression_ratio:.1f}x），"
+          f"編碼速度 {stats.realtime_factor:.0f}x 即時")
+
+def stream_to_file(client, model: str, contents: str, config, output_file: str,
+                   use_cache: bool = True,
+                   output_format: str = None) -> tts_synthesis.StreamStats:
+    """串流合成並邊接收邊編碼寫入檔案，完成後顯示首段音訊延遲"""
+    audio_encoders.resolve(output_file, output_format)
+    encoder = None
     
-    response = client.models.generate_content(
-        model=model,
-        contents=text,
-        config=types.GenerateContentConfig(
-            response_modalities=["AUDIO"],
-            speech_config=types.SpeechConfig(
-                voice_config=types.VoiceConfig(
-                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                        voice_name=voice
-                    )
-                )
+    def on_chunk(chunk: bytes):
+        nonlocal encoder
+        if encoder is None:
+            # 收到第一段音訊後才知道模型輸出的採樣率
+            encoder = audio_encoders.open_encoder(
+                output_file, output_format, tts_synthesis.output_sample_rate(model)
             )
+        encoder.write(chunk)
+    
+    try:
+        stats = tts_synthesis.synthesize_stream(
+            client, model, contents, config,
+            on_chunk=on_chunk,
+            use_cache=use_cache
         )
+    finally:
+        if encoder is not None:
+            encoder.close()
+    
+    source = "（快取）" if stats.cached else ""
+    print(f"⏱️ 首段音訊延遲：{stats.time_to_first_audio * 1000:.0f} 毫秒{source}，"
+          f"總耗時 {stats.total_seconds:.1f} 秒，共 {stats.chunks} 段")
+    print_encode_stats(encoder.stats)
+    return stats
+
+def postprocess_pcm(model: str, pcm_data: bytes,
+                    head: bool = True, tail: bool = True) -> bytes:
+    """以模型實際的輸出取樣率對 PCM 套用後處理（在收到音訊後才讀取取樣率）
+
+    head / tail 表示分段是否位於整段音訊的開頭 / 結尾
+    """
+    return audio_postprocess.process(pcm_data,
+                                     tts_synthesis.output_sample_rate(model),
+                                     head=head, tail=tail)
+
+
+def single_speaker_tts(client, model: str, text: str, voice: str, output_file: str,
+                       use_cache: bool = True,
+                       chunk_chars: int = chunked_synthesis.DEFAULT_MAX_CHARS,
+                       concurrency: int = chunked_synthesis.DEFAULT_MAX_WORKERS,
+                       stream: bool = False,
+                       postprocess: bool = True,
+                       output_format: str = None,
+                       style_prefix: str = ""):
+    """單一講者 TTS（長文本會依句子切分後並行合成；串流模式則整段串流）
+    
+    style_prefix 為風格前綴（例如「興奮的地說：」），分段時加在每一段開頭
+    """
+    print(f"使用語音 {voice} 生成單一講者語音...")
+    config = tts_synthesis.build_single_speaker_config(voice)
+    
+    if stream:
+        stream_to_file(client, model, f"{style_prefix}{text}", config,
+                       output_file, use_cache, output_format)
+        print(f"✅ 語音已儲存至：{output_file}")
+        return
+    
+    def report_progress(done: int, total: int):
+        if total > 1:
+            print(f"  分段進度：{done}/{total}", flush=True)
+    
+    # 各段依序直接編碼寫入檔案，不需在記憶體中保留完整音訊
+    encode_stats = chunked_synthesis.synthesize_chunked_to_file(
+        client,
+        model,
+        text,
+        config,
+        output_file,
+        max_chars=chunk_chars,
+        max_workers=concurrency,
+        use_cache=use_cache,
+        on_progress=report_progress,
+        postprocess=functools.partial(postprocess_pcm, model) if postprocess else None,
+        output_format=output_format,
+        style_prefix=style_prefix
     )
     
-    audio_data = response.candidates[0].content.parts[0].inline_data.data
-    save_wave_file(output_file, audio_data)
+    print_encode_stats(encode_stats)
     print(f"✅ 語音已儲存至：{output_file}")
 
-def multi_speaker_tts(client, model: str, dialogue_file: str, output_file: str):
+def multi_speaker_tts(client, model: str, dialogue_file: str, output_file: str,
+                      use_cache: bool = True, stream: bool = False,
+                      postprocess: bool = True, output_format: str = None):
     """多講者 TTS"""
     # 讀取對話檔案
     with open(dialogue_file, 'r', encoding='utf-8') as f:
@@ -71,36 +150,28 @@ def multi_speaker_tts(client, model: str, dialogue_file: str, output_file: str):
     
     print(f"生成多講者對話，講者：{[s['name'] for s in speakers]}")
     
-    # 建立講者配置
-    speaker_voice_configs = []
-    for speaker in speakers:
-        speaker_voice_configs.append(
-            types.SpeakerVoiceConfig(
-                speaker=speaker["name"],
-                voice_config=types.VoiceConfig(
-                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                        voice_name=speaker["voice"]
-                    )
-                )
-            )
-        )
+    prompt = f"TTS 以下對話：\n{content}"
+    config = tts_synthesis.build_multi_speaker_config(speakers)
+    
+    if stream:
+        stream_to_file(client, model, prompt, config, output_file, use_cache,
+                       output_format)
+        print(f"✅ 語音已儲存至：{output_file}")
+        return
     
     # 生成語音
-    response = client.models.generate_content(
-        model=model,
-        contents=f"TTS 以下對話：\n{content}",
-        config=types.GenerateContentConfig(
-            response_modalities=["AUDIO"],
-            speech_config=types.SpeechConfig(
-                multi_speaker_voice_config=types.MultiSpeakerVoiceConfig(
-                    speaker_voice_configs=speaker_voice_configs
-                )
-            )
-        )
+    audio_data = tts_synthesis.synthesize(
+        client,
+        model,
+        prompt,
+        config,
+        use_cache=use_cache
     )
     
-    audio_data = response.candidates[0].content.parts[0].inline_data.data
-    save_wave_file(output_file, audio_data)
+    rate = tts_synthesis.output_sample_rate(model)
+    if postprocess:
+        audio_data = audio_postprocess.process(audio_data, rate)
+    print_encode_stats(save_audio_file(output_file, audio_data, rate, output_format))
     print(f"✅ 語音已儲存至：{output_file}")
 
 def generate_prompt(prompt_type: str, style: str = None) -> str:
@@ -131,6 +202,8 @@ def main():
                        help="TTS 模型")
     parser.add_argument("--mode", choices=["single", "multi"], default="single", help="TTS 模式")
     parser.add_argument("--output", "-o", default="output.wav", help="輸出檔案名稱")
+    parser.add_argument("--format", "-f", choices=list(audio_encoders.FORMATS),
+                       help="輸出格式（預設依輸出檔案的副檔名判斷；壓縮格式需要 soundfile、lameenc 或 ffmpeg）")
     
     # 單一講者參數
     parser.add_argument("--text", "-t", help="要轉換的文字（單一講者模式）")
@@ -138,17 +211,47 @@ def main():
     parser.add_argument("--prompt-type", choices=["podcast", "audiobook", "education", "customer"],
                        help="使用預設提示類型")
     parser.add_argument("--style", help="語音風格（如：興奮的、平靜的、神秘的）")
+    parser.add_argument("--chunk-chars", type=int, default=chunked_synthesis.DEFAULT_MAX_CHARS,
+                       help="長文本分段的每段最大字元數")
+    parser.add_argument("--concurrency", type=int, default=chunked_synthesis.DEFAULT_MAX_WORKERS,
+                       help="同時進行的合成請求數上限")
+    parser.add_argument("--stream", action="store_true",
+                       help="串流合成：邊接收邊寫檔並顯示首段音訊延遲（不分段、不做後處理）")
+    parser.add_argument("--no-postprocess", action="store_true",
+                       help="不做音訊後處理（去除頭尾靜音、響度標準化、淡入淡出）")
     
     # 多講者參數
     parser.add_argument("--dialogue", "-d", help="對話 JSON 檔案路徑（多講者模式）")
     parser.add_argument("--create-dialogue-template", action="store_true", 
                        help="建立對話範本檔案")
     
+    # 批次參數
+    parser.add_argument("--batch", "-b", help="批次清單檔（JSONL，每行一個合成工作）")
+    parser.add_argument("--checkpoint",
+                       help="批次檢查點檔案（預設為清單檔旁的 .checkpoint.jsonl）")
+    
     # 其他參數
     parser.add_argument("--list-voices", action="store_true", help="列出所有可用語音")
+    parser.add_argument("--list-formats", action="store_true", help="列出輸出格式與可用的編碼後端")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="不使用合成快取，強制重新呼叫 API")
+    parser.add_argument("--cache-stats", action="store_true",
+                       help="顯示合成快取統計資料")
+    parser.add_argument("--profile", action="store_true",
+                       help="以 cProfile / tracemalloc 分析此次執行，結果寫入 profiles 目錄")
+    parser.add_argument("--metrics-file",
+                       help="將效能指標以 Prometheus 文字格式寫入此檔案")
     
     args = parser.parse_args()
     
+    # 顯示快取統計
+    if args.cache_stats:
+        stats = synthesis_cache.get_default_cache().stats()
+        print("合成快取統計：")
+        for name, value in stats.items():
+            print(f"  {name}: {value}")
+        return
+    
     # 列出語音選項
     if args.list_voices:
         print("可用語音選項：")
@@ -156,6 +259,19 @@ def main():
             print(f"{i:2d}. {voice}")
         return
     
+    # 列出輸出格式
+    if args.list_formats:
+        print("輸出格式：")
+        for name, output_format in audio_encoders.FORMATS.items():
+            backend = audio_encoders.get_backend(name)
+            status = f"✅ {backend.name}" if backend else "❌ 未安裝可用的後端"
+            print(f"  {name:<5} {output_format.extension:<6} {status}")
+        return
+    
+    # 指定輸出格式時，輸出檔案使用對應的副檔名
+    if args.format and audio_encoders.format_for_path(args.output, None) != args.format:
+        args.output = os.path.splitext(args.output)[0] + audio_encoders.FORMATS[args.format].extension
+    
     # 建立對話範本
     if args.create_dialogue_template:
         template = {
@@ -193,26 +309,72 @@ def main():
     
     # 初始化客戶端
     try:
-        client = genai.Client(api_key=args.api_key)
+        client = gemini_client_pool.get_client(args.api_key)
     except Exception as e:
         print(f"❌ 無法初始化 Gemini 客戶端：{e}")
         return
     
+    metrics = tts_metrics.get_default_registry()
+    if args.metrics_file:
+        metrics.metrics_file = args.metrics_file
+    
+    # 效能分析：記錄此次生成的 CPU 熱點與記憶體配置
+    profile = contextlib.ExitStack()
+    if args.profile:
+        profile_label = "batch" if args.batch else args.mode
+        profile.enter_context(profiling.profile_run(f"cli_{profile_label}"))
+    
     # 執行 TTS
     try:
-        if args.mode == "single":
+        if args.batch:
+            # 批次模式：並行執行清單中的所有工作，可從檢查點續傳
+            stats = batch_runner.run_batch(
+                client,
+                args.batch,
+                # 各工作的輸出格式依其 output 的副檔名決定，取樣率依其模型決定
+                save_audio_file,
+                args.model,
+                checkpoint_path=args.checkpoint,
+                concurrency=args.concurrency,
+                use_cache=not args.no_cache,
+                postprocess=None if args.no_postprocess else audio_postprocess.process,
+                default_voice=args.voice
+            )
+            print(f"✅ 批次完成：成功 {stats['done']} 個，"
+                  f"跳過 {stats['skipped']} 個，失敗 {stats['failed']} 個，"
+                  f"耗時 {stats['elapsed']:.1f} 秒")
+            retry_stats = retry_policy.get_default_policy().stats()
+            print(f"   重試 {retry_stats['retries']} 次，"
+                  f"斷路器開啟 {retry_stats['breaker']['opens']} 次")
+            summary = metrics.summary()
+            print(f"   音訊 {summary['audio_seconds']:.1f} 秒，"
+                  f"平均延遲 {summary['latency_mean_seconds'] or 0:.2f} 秒，"
+                  f"即時倍率 {summary['realtime_factor'] or 0:.1f}x")
+            if stats["failed"]:
+                print("💡 重新執行相同指令即可只處理未完成的工作")
+                sys.exit(1)
+        
+        elif args.mode == "single":
             # 單一講者模式
+            style_prefix = ""
             if args.prompt_type:
                 text = generate_prompt(args.prompt_type, args.style)
             elif args.text:
                 text = args.text
                 if args.style:
-                    text = f"{args.style}地說：{text}"
+                    style_prefix = f"{args.style}地說："
             else:
                 print("❌ 請提供 --text 參數或使用 --prompt-type")
                 return
             
-            single_speaker_tts(client, args.model, text, args.voice, args.output)
+            single_speaker_tts(client, args.model, text, args.voice, args.output,
+                               use_cache=not args.no_cache,
+                               chunk_chars=args.chunk_chars,
+                               concurrency=args.concurrency,
+                               stream=args.stream,
+                               postprocess=not args.no_postprocess,
+                               output_format=args.format,
+                               style_prefix=style_prefix)
             
         else:
             # 多講者模式
@@ -221,11 +383,27 @@ def main():
                 print("💡 提示：使用 --create-dialogue-template 建立範本")
                 return
             
-            multi_speaker_tts(client, args.model, args.dialogue, args.output)
+            multi_speaker_tts(client, args.model, args.dialogue, args.output,
+                              use_cache=not args.no_cache,
+                              stream=args.stream,
+                              postprocess=not args.no_postprocess,
+                              output_format=args.format)
+    
+    except retry_policy.CircuitOpenError as e:
+        print(f"❌ 生成失敗：{e}")
+        print("💡 後端連續失敗，已暫停發送請求，請稍後再試")
+        # 只有使用快取的分段合成才能從已完成的分段續傳
+        if not args.no_cache and not args.batch and args.mode == "single" and not args.stream:
+            print("   已完成的分段已快取，稍後重新執行相同指令即可續傳")
+        sys.exit(1)
     
     except Exception as e:
         print(f"❌ 生成失敗：{e}")
         sys.exit(1)
+    
+    finally:
+        profile.close()
+        metrics.flush()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
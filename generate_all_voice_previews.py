@@ -5,11 +5,19 @@
 """
 
 import os
-import wave
-from google import genai
-from google.genai import types
+import wav_writer
 from dotenv import load_dotenv
 import time
+import gemini_client_pool
+import tts_synthesis
+import async_synthesis_engine
+import preview_texts
+import rate_limiter
+import retry_policy
+import tts_metrics
+import preview_archive
+import preview_index
+import single_flight
 
 # 載入環境變數
 load_dotenv()
@@ -32,59 +40,30 @@ LANGUAGES = [
     "ko-KR",  # 韓語
 ]
 
-# 預覽文本
-PREVIEW_TEXTS = {
-    "zh-TW": lambda voice: f"您好，我是 {voice}。這是我的聲音預覽，希望您喜歡。",
-    "zh-CN": lambda voice: f"您好，我是 {voice}。这是我的声音预览，希望您喜欢。",
-    "en-US": lambda voice: f"Hello, I am {voice}. This is a preview of my voice. I hope you like it.",
-    "ja-JP": lambda voice: f"こんにちは、私は{voice}です。これは私の声のプレビューです。",
-    "ko-KR": lambda voice: f"안녕하세요, 저는 {voice}입니다. 제 목소리 미리듣기입니다.",
-}
+# 同時進行的生成請求數上限
+MAX_CONCURRENCY = int(os.getenv("GEMINI_TTS_MAX_CONCURRENCY", "8"))
 
 
 def save_wave_file(filename: str, pcm_data: bytes, channels: int = 1,
                    rate: int = 24000, sample_width: int = 2):
     """儲存 PCM 資料為 WAV 檔案"""
-    with wave.open(filename, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(rate)
-        wf.writeframes(pcm_data)
+    wav_writer.write_wav_file(filename, pcm_data, channels, rate, sample_width)
 
 
 def generate_voice_preview(api_key: str, voice_name: str, language: str,
                           model_name: str = "gemini-2.5-flash-preview-tts") -> bytes:
     """生成語音預覽"""
-    preview_text = PREVIEW_TEXTS.get(language, PREVIEW_TEXTS["en-US"])(voice_name)
+    client = gemini_client_pool.get_client(api_key)
+    engine = async_synthesis_engine.get_engine()
+    result = engine.submit(
+        client, preview_texts.build_preview_job(voice_name, language, model_name)
+    ).result()
     
-    try:
-        client = genai.Client(api_key=api_key)
-        
-        config = types.GenerateContentConfig(
-            response_modalities=["AUDIO"],
-            speech_config=types.SpeechConfig(
-                voice_config=types.VoiceConfig(
-                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                        voice_name=voice_name
-                    )
-                )
-            )
-        )
-        
-        response = client.models.generate_content(
-            model=model_name,
-            contents=preview_text,
-            config=config
-        )
-        
-        if response and response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-            return response.candidates[0].content.parts[0].inline_data.data
-        else:
-            return None
-            
-    except Exception as e:
-        print(f"生成 {voice_name} ({language}) 失敗：{str(e)}")
+    if result.error is not None:
+        if not isinstance(result.error, tts_synthesis.NoAudioError):
+            print(f"生成 {voice_name} ({language}) 失敗：{str(result.error)}")
         return None
+    return result.audio_data
 
 
 def main():
@@ -112,6 +91,10 @@ def main():
     
     start_time = time.time()
     
+    # 找出尚未生成的預覽，並鎖定各預覽檔案直到寫入完成，
+    # 避免與執行中的網頁介面（背景生成）重複生成同一個預覽
+    jobs = []
+    locks = {}
     for voice in VOICE_OPTIONS:
         for language in LANGUAGES:
             filename = f"{preview_dir}/preview_{voice}_{language}.wav"
@@ -122,22 +105,52 @@ def main():
                 skipped += 1
                 continue
             
-            print(f"生成中：{voice} - {language}...", end="", flush=True)
-            
-            # 生成預覽
-            audio_data = generate_voice_preview(api_key, voice, language)
+            lock = single_flight.FileLock(filename)
+            if not lock.acquire(blocking=False):
+                print(f"✓ 跳過（其他行程生成中）：{voice} - {language}")
+                skipped += 1
+                continue
+            # 取得鎖之前其他行程可能剛好寫完
+            if os.path.exists(filename):
+                lock.release()
+                print(f"✓ 跳過（已存在）：{voice} - {language}")
+                skipped += 1
+                continue
             
-            if audio_data:
-                # 儲存檔案
-                save_wave_file(filename, audio_data)
-                print(f" ✓ 完成")
+            locks[(voice, language)] = lock
+            jobs.append(preview_texts.build_preview_job(voice, language))
+    
+    print(f"並行生成 {len(jobs)} 個預覽（並行上限：{MAX_CONCURRENCY}）...")
+    
+    def on_result(result: async_synthesis_engine.JobResult):
+        nonlocal generated, failed
+        voice, language = result.job.key
+        
+        lock = locks.pop((voice, language))
+        try:
+            if result.ok:
+                # 先寫入暫存檔再改名，網頁介面不會讀到寫到一半的檔案
+                filename = f"{preview_dir}/preview_{voice}_{language}.wav"
+                with single_flight.atomic_write(filename) as temp_path:
+                    save_wave_file(temp_path, result.audio_data)
+                print(f"✓ 完成：{voice} - {language}（{result.elapsed:.1f} 秒）")
                 generated += 1
             else:
-                print(f" ✗ 失敗")
+                print(f"✗ 失敗：{voice} - {language}：{result.error}")
                 failed += 1
-            
-            # 避免 API 速率限制
-            time.sleep(0.5)
+        finally:
+            lock.release()
+    
+    # 透過非同步引擎並行生成，並行數由號誌限制
+    client = gemini_client_pool.get_client(api_key)
+    try:
+        async_synthesis_engine.get_engine().run_jobs(
+            client, jobs, on_result=on_result, max_concurrency=MAX_CONCURRENCY
+        )
+    finally:
+        # 中斷時釋放尚未完成的預覽的鎖
+        for lock in locks.values():
+            lock.release()
     
     end_time = time.time()
     elapsed_time = end_time - start_time
@@ -148,8 +161,30 @@ def main():
     print(f"成功生成：{generated} 個檔案")
     print(f"跳過（已存在）：{skipped} 個檔案")
     print(f"生成失敗：{failed} 個檔案")
+    pool_stats = gemini_client_pool.get_pool_stats()
+    print(f"客戶端重複使用：{pool_stats['hits']} 次"
+          f"（省下 {pool_stats['saved_construct_ms']:.0f} ms 客戶端建構時間）")
+    limiter_stats = rate_limiter.get_default_limiter().stats()
+    print(f"速率限制：目前 {limiter_stats['rpm']} 次/分鐘，"
+          f"遇到 429 共 {limiter_stats['throttled']} 次")
+    retry_stats = retry_policy.get_default_policy().stats()
+    print(f"重試：{retry_stats['retries']} 次，"
+          f"斷路器開啟 {retry_stats['breaker']['opens']} 次")
+    metrics = tts_metrics.get_default_registry()
+    summary = metrics.summary()
+    print(f"合成延遲：平均 {summary['latency_mean_seconds'] or 0:.2f} 秒，"
+          f"p95 ≤ {summary['latency_p95_seconds'] or 0} 秒，"
+          f"即時倍率 {summary['realtime_factor'] or 0:.1f}x")
+    metrics.flush()
     print(f"預覽檔案儲存在：{os.path.abspath(preview_dir)}")
 
+    # 有新增或缺少封裝檔時重新打包（原子替換，執行中的網頁介面會自動載入新檔）
+    archive_path = os.path.join(preview_dir, preview_archive.ARCHIVE_FILENAME)
+    if generated or not os.path.exists(archive_path):
+        packed = preview_index.rebuild_archive(preview_dir, archive_path)
+        print(f"預覽封裝檔：{archive_path}（{packed} 個預覽，"
+              f"{os.path.getsize(archive_path) / 1024 / 1024:.1f} MiB）")
+
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
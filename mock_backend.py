@@ -0,0 +1,318 @@
+"""
+模擬 Gemini TTS 後端模組
+提供與 genai.Client 相同介面（models.generate_content、
+models.generate_content_stream 及 aio.models 的非同步版本）的本機假客戶端，
+依輸入文字長度返回確定性的合成 PCM，並可設定延遲分佈、錯誤率與 429 注入，
+讓合成引擎、快取與排程功能可以離線測試與效能評估
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import random
+import struct
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from google.genai import errors, types
+
+import tts_synthesis
+
+# 與 Gemini TTS 回應相同的 MIME 類型格式，取樣率依 MockConfig.sample_rate
+MOCK_MIME_TYPE = "audio/L16;codec=pcm;rate={rate}"
+
+
+@dataclass
+class LatencyModel:
+    """請求延遲分佈
+
+    distribution:
+        fixed: 固定為 base 秒
+        uniform: base ± jitter 秒之間均勻分佈
+        lognormal: 中位數為 base 秒、形狀參數為 jitter 的對數常態分佈
+    每個輸入字元另外增加 per_char 秒。
+    """
+    distribution: str = "fixed"
+    base: float = 0.0
+    jitter: float = 0.0
+    per_char: float = 0.0
+
+    def sample(self, rng: random.Random, chars: int) -> float:
+        if self.distribution == "uniform":
+            latency = rng.uniform(self.base - self.jitter, self.base + self.jitter)
+        elif self.distribution == "lognormal":
+            latency = (self.base * rng.lognormvariate(0.0, self.jitter)
+                       if self.base > 0 else 0.0)
+        elif self.distribution == "fixed":
+            latency = self.base
+        else:
+            raise ValueError(f"不支援的延遲分佈：{self.distribution}")
+        return max(0.0, latency + self.per_char * chars)
+
+
+@dataclass
+class MockConfig:
+    """模擬後端設定"""
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    error_rate: float = 0.0           # 返回 503 的機率
+    rate_limit_rate: float = 0.0      # 返回 429 的機率
+    rpm_limit: Optional[int] = None   # 模擬配額：每分鐘超過此數量的請求返回 429
+    chars_per_second: float = 12.0    # 每秒音訊對應的輸入字元數
+    min_seconds: float = 0.3          # 最短音訊長度
+    sample_rate: int = 24000
+    stream_chunk_seconds: float = 0.5
+    stream_first_fraction: float = 0.3  # 串流時首段音訊在總延遲的多少比例時送達
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "MockConfig":
+        """由環境變數建立設定
+
+        GEMINI_TTS_MOCK_LATENCY: 基本延遲秒數
+        GEMINI_TTS_MOCK_LATENCY_DIST: 延遲分佈（fixed / uniform / lognormal）
+        GEMINI_TTS_MOCK_JITTER: 延遲的分佈參數
+        GEMINI_TTS_MOCK_ERROR_RATE: 503 錯誤率
+        GEMINI_TTS_MOCK_429_RATE: 429 錯誤率
+        GEMINI_TTS_MOCK_RPM: 模擬的每分鐘請求配額
+        GEMINI_TTS_MOCK_SEED: 亂數種子
+        """
+        rpm = os.getenv("GEMINI_TTS_MOCK_RPM")
+        seed = os.getenv("GEMINI_TTS_MOCK_SEED")
+        return cls(
+            latency=LatencyModel(
+                distribution=os.getenv("GEMINI_TTS_MOCK_LATENCY_DIST", "fixed"),
+                base=float(os.getenv("GEMINI_TTS_MOCK_LATENCY", "0.5")),
+                jitter=float(os.getenv("GEMINI_TTS_MOCK_JITTER", "0")),
+            ),
+            error_rate=float(os.getenv("GEMINI_TTS_MOCK_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("GEMINI_TTS_MOCK_429_RATE", "0")),
+            rpm_limit=int(rpm) if rpm else None,
+            seed=int(seed) if seed else None,
+        )
+
+
+def _contents_text(contents: Any) -> str:
+    return contents if isinstance(contents, str) else str(contents)
+
+
+def synthetic_pcm(text: str, voice: str = "", model: str = "",
+                  chars_per_second: float = 12.0, min_seconds: float = 0.3,
+                  sample_rate: int = 24000) -> bytes:
+    """產生確定性的 16-bit 單聲道 PCM
+
+    長度與輸入字元數成正比，音高由 (模型, 語音, 文字) 的雜湊決定，
+    因此相同輸入永遠得到相同的資料。
+    """
+    seconds = max(min_seconds, len(text) / chars_per_second)
+    total_samples = int(seconds * sample_rate)
+
+    digest = hashlib.sha256(f"{model}|{voice}|{text}".encode("utf-8")).digest()
+    period = sample_rate // (150 + digest[0] % 250)
+    cycle = struct.pack(
+        f"<{period}h",
+        *(int(8000 * math.sin(2 * math.pi * i / period)) for i in range(period))
+    )
+    repeats = total_samples // period + 1
+    return (cycle * repeats)[:total_samples * 2]
+
+
+def _make_response(data: bytes, sample_rate: int) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(
+            content=types.Content(
+                role="model",
+                parts=[types.Part(inline_data=types.Blob(
+                    data=data, mime_type=MOCK_MIME_TYPE.format(rate=sample_rate)
+                ))]
+            )
+        )]
+    )
+
+
+class MockBackend:
+    """模擬後端的共用狀態（亂數、配額視窗與統計）"""
+
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.config = config or MockConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._recent: deque = deque()
+        self._in_flight = 0
+        self.stats_data: Dict[str, Any] = {
+            "requests": 0,
+            "ok": 0,
+            "errors": 0,
+            "rate_limited": 0,
+            "peak_in_flight": 0,
+            "audio_bytes": 0,
+        }
+
+    def _error(self, code: int) -> errors.APIError:
+        if code == 429:
+            self.stats_data["rate_limited"] += 1
+            return errors.ClientError(429, {"error": {
+                "code": 429, "status": "RESOURCE_EXHAUSTED",
+                "message": "Resource has been exhausted (mock)"}})
+        self.stats_data["errors"] += 1
+        return errors.ServerError(code, {"error": {
+            "code": code, "status": "UNAVAILABLE",
+            "message": "The model is overloaded (mock)"}})
+
+    def begin(self, model: str, contents: Any,
+              config: Any) -> Tuple[float, Optional[BaseException], bytes]:
+        """開始一個請求，返回 (延遲秒數, 要拋出的錯誤, PCM 資料)"""
+        text = _contents_text(contents)
+        cfg = self.config
+        with self._lock:
+            now = time.monotonic()
+            self.stats_data["requests"] += 1
+            self._in_flight += 1
+            self.stats_data["peak_in_flight"] = max(
+                self.stats_data["peak_in_flight"], self._in_flight
+            )
+            latency = cfg.latency.sample(self._rng, len(text))
+
+            while self._recent and now - self._recent[0] >= 60.0:
+                self._recent.popleft()
+            if cfg.rpm_limit is not None and len(self._recent) >= cfg.rpm_limit:
+                return latency, self._error(429), b""
+            self._recent.append(now)
+
+            roll = self._rng.random()
+            if roll < cfg.rate_limit_rate:
+                return latency, self._error(429), b""
+            if roll < cfg.rate_limit_rate + cfg.error_rate:
+                return latency, self._error(503), b""
+
+        voice = tts_synthesis.config_voice_name(config)
+        data = synthetic_pcm(text, voice, model, cfg.chars_per_second,
+                             cfg.min_seconds, cfg.sample_rate)
+        return latency, None, data
+
+    def finish(self, data: bytes, error: Optional[BaseException]) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if error is None:
+                self.stats_data["ok"] += 1
+                self.stats_data["audio_bytes"] += len(data)
+
+    def split_stream(self, data: bytes) -> List[bytes]:
+        size = max(2, int(self.config.stream_chunk_seconds *
+                          self.config.sample_rate) * 2)
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats_data, in_flight=self._in_flight)
+
+
+class _FakeModels:
+    """同步的 client.models 介面"""
+
+    def __init__(self, backend: MockBackend):
+        self._backend = backend
+
+    def generate_content(self, model: str, contents: Any,
+                         config: Any = None) -> types.GenerateContentResponse:
+        latency, error, data = self._backend.begin(model, contents, config)
+        try:
+            time.sleep(latency)
+            if error is not None:
+                raise error
+            return _make_response(data, self._backend.config.sample_rate)
+        finally:
+            self._backend.finish(data, error)
+
+    def generate_content_stream(
+        self, model: str, contents: Any, config: Any = None
+    ) -> Iterator[types.GenerateContentResponse]:
+        latency, error, data = self._backend.begin(model, contents, config)
+        try:
+            first = latency * self._backend.config.stream_first_fraction
+            time.sleep(first)
+            if error is not None:
+                raise error
+            chunks = self._backend.split_stream(data)
+            interval = (latency - first) / max(1, len(chunks) - 1)
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(interval)
+                yield _make_response(chunk, self._backend.config.sample_rate)
+        finally:
+            self._backend.finish(data, error)
+
+
+class _FakeAsyncModels:
+    """非同步的 client.aio.models 介面"""
+
+    def __init__(self, backend: MockBackend):
+        self._backend = backend
+
+    async def generate_content(self, model: str, contents: Any,
+                               config: Any = None) -> types.GenerateContentResponse:
+        latency, error, data = self._backend.begin(model, contents, config)
+        try:
+            await asyncio.sleep(latency)
+            if error is not None:
+                raise error
+            return _make_response(data, self._backend.config.sample_rate)
+        finally:
+            self._backend.finish(data, error)
+
+    async def generate_content_stream(
+        self, model: str, contents: Any, config: Any = None
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        latency, error, data = self._backend.begin(model, contents, config)
+
+        async def stream():
+            try:
+                first = latency * self._backend.config.stream_first_fraction
+                await asyncio.sleep(first)
+                if error is not None:
+                    raise error
+                chunks = self._backend.split_stream(data)
+                interval = (latency - first) / max(1, len(chunks) - 1)
+                for i, chunk in enumerate(chunks):
+                    if i:
+                        await asyncio.sleep(interval)
+                    yield _make_response(chunk, self._backend.config.sample_rate)
+            finally:
+                self._backend.finish(data, error)
+
+        return stream()
+
+
+class _FakeAio:
+    def __init__(self, backend: MockBackend):
+        self.models = _FakeAsyncModels(backend)
+
+
+class FakeGeminiClient:
+    """可取代 genai.Client 的本機假客戶端
+
+    使用方式：
+        client = FakeGeminiClient(MockConfig(latency=LatencyModel("lognormal", 0.8, 0.3),
+                                             rate_limit_rate=0.05, seed=1))
+        tts_synthesis.synthesize(client, model, text, config)
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.backend = MockBackend(config)
+        self.models = _FakeModels(self.backend)
+        self.aio = _FakeAio(self.backend)
+
+    def stats(self) -> Dict[str, Any]:
+        """取得請求統計資料"""
+        return self.backend.stats()
+
+    def close(self) -> None:
+        pass
+
+
+def is_enabled() -> bool:
+    """是否以環境變數 GEMINI_TTS_MOCK 啟用模擬後端"""
+    return os.getenv("GEMINI_TTS_MOCK", "").lower() in ("1", "true", "yes")
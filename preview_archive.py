@@ -0,0 +1,218 @@
+"""
+預覽封裝檔模組
+將所有預覽 WAV 檔案打包成單一檔案，開頭為偏移量表，之後依序存放各預覽的完整 WAV 內容。
+讀取時以 mmap 對應整個檔案，每次播放只取出對應區段的 memoryview，
+不需要開檔、讀檔或複製；重建時先寫入暫存檔再以 os.replace 原子替換。
+打包時可將預覽轉換為較精簡的編碼（preview_encoding）
+
+檔案格式（little-endian）：
+    標頭：MAGIC（8 位元組）、項目數（u32）、編碼名稱長度（u16）、編碼名稱
+    偏移量表（每個項目）：語音名稱長度（u16）、語音名稱、語言代碼長度（u16）、
+        語言代碼、偏移量（u64）、長度（u64）、音訊幀數（u32）、取樣率（u32）
+    資料區：各預覽的完整 WAV 檔案內容
+"""
+
+import io
+import mmap
+import os
+import struct
+import tempfile
+import wave
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import preview_encoding
+
+ARCHIVE_FILENAME = "previews.pack"
+
+MAGIC = b"GTTSPAK2"
+_HEADER = struct.Struct("<8sI")
+_NAME_LENGTH = struct.Struct("<H")
+_ENTRY = struct.Struct("<QQII")
+
+
+@dataclass(frozen=True)
+class ArchiveEntry:
+    """封裝檔中單一預覽的位置與長度"""
+    voice: str
+    language: str
+    offset: int
+    length: int
+    duration: float
+
+
+def _wav_frames(data: bytes) -> Tuple[int, int]:
+    """返回 WAV 內容的 (幀數, 取樣率)"""
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wf:
+            return wf.getnframes(), wf.getframerate()
+    except (wave.Error, EOFError):
+        # 無法解析標頭時以 24kHz 單聲道 16-bit 估算
+        return max(0, len(data) - 44) // 2, 24000
+
+
+def _pack_name(name: str) -> bytes:
+    encoded = name.encode("utf-8")
+    return _NAME_LENGTH.pack(len(encoded)) + encoded
+
+
+def build_archive(archive_path: str,
+                  previews: Iterable[Tuple[str, str, str]],
+                  encoding: str = preview_encoding.DEFAULT_ENCODING) -> int:
+    """將預覽檔案打包成封裝檔（原子替換既有的封裝檔）
+
+    Args:
+        archive_path: 封裝檔路徑
+        previews: (語音名稱, 語言代碼, WAV 檔案路徑) 的序列；
+                  同一組 (語音, 語言) 出現多次時以最後一個為準
+        encoding: 封裝時使用的預覽編碼（見 preview_encoding.ENCODINGS）
+
+    Returns:
+        封裝的預覽數量
+    """
+    if encoding not in preview_encoding.ENCODINGS:
+        raise ValueError(f"不支援的預覽編碼：{encoding}")
+
+    files: Dict[Tuple[str, str], str] = {}
+    for voice_name, language, path in previews:
+        files[(voice_name, language)] = path
+
+    blobs = []
+    for (voice_name, language), path in sorted(files.items()):
+        with open(path, "rb") as f:
+            data = f.read()
+        # 音訊長度以原始檔案計算，壓縮編碼不一定能以 wave 模組解析
+        frames, rate = _wav_frames(data)
+        try:
+            data = preview_encoding.encode_wav(data, encoding)
+        except (wave.Error, EOFError, ValueError) as e:
+            print(f"無法轉換 {path}，保留原始格式：{e}")
+        blobs.append((voice_name, language, data, frames, rate))
+
+    # 先計算偏移量表的大小，才能決定資料區的起點
+    header = _HEADER.pack(MAGIC, len(blobs)) + _pack_name(encoding)
+    table_size = sum(
+        len(_pack_name(voice_name)) + len(_pack_name(language)) + _ENTRY.size
+        for voice_name, language, *_ in blobs
+    )
+    offset = len(header) + table_size
+
+    table = [header]
+    for voice_name, language, data, frames, rate in blobs:
+        table.append(_pack_name(voice_name))
+        table.append(_pack_name(language))
+        table.append(_ENTRY.pack(offset, len(data), frames, rate))
+        offset += len(data)
+
+    directory = os.path.dirname(archive_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".previews-", suffix=".tmp",
+                                     dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"".join(table))
+            for _, _, data, _, _ in blobs:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, archive_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return len(blobs)
+
+
+class PreviewArchive:
+    """以 mmap 讀取的唯讀預覽封裝檔"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 封裝檔路徑
+
+        Raises:
+            OSError: 無法開啟檔案
+            ValueError: 檔案格式不正確
+        """
+        self.path = path
+        self.encoding = ""
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < _HEADER.size:
+                raise ValueError(f"預覽封裝檔過短：{path}")
+            # 對應後即可關閉檔案，mmap 會保有自己的參照
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.inode = stat.st_ino
+        self._view = memoryview(self._mmap)
+        self._entries = self._read_table()
+
+    def _read_table(self) -> Dict[Tuple[str, str], ArchiveEntry]:
+        magic, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是預覽封裝檔或格式版本不符：{self.path}")
+
+        entries = {}
+        position = _HEADER.size
+        try:
+            self.encoding, position = self._read_name(position)
+            for _ in range(count):
+                names = []
+                for _ in range(2):
+                    name, position = self._read_name(position)
+                    names.append(name)
+                offset, length, frames, rate = _ENTRY.unpack_from(
+                    self._mmap, position
+                )
+                position += _ENTRY.size
+                if offset + length > self.size:
+                    raise ValueError(f"預覽封裝檔已損毀：{self.path}")
+                entries[(names[0], names[1])] = ArchiveEntry(
+                    names[0], names[1], offset, length,
+                    frames / rate if rate else 0.0
+                )
+        except struct.error as e:
+            raise ValueError(f"預覽封裝檔已損毀：{self.path}") from e
+        return entries
+
+    def _read_name(self, position: int) -> Tuple[str, int]:
+        (length,) = _NAME_LENGTH.unpack_from(self._mmap, position)
+        position += _NAME_LENGTH.size
+        name = bytes(self._view[position:position + length]).decode("utf-8")
+        return name, position + length
+
+    def lookup(self, voice_name: str,
+               language: str) -> Optional[ArchiveEntry]:
+        return self._entries.get((voice_name, language))
+
+    def get(self, voice_name: str, language: str) -> Optional[memoryview]:
+        """取得預覽的 WAV 內容（mmap 的唯讀區段，不複製資料）"""
+        entry = self.lookup(voice_name, language)
+        if entry is None:
+            return None
+        return self.slice(entry.offset, entry.length)
+
+    def slice(self, offset: int, length: int) -> memoryview:
+        return self._view[offset:offset + length]
+
+    def entries(self) -> Iterator[ArchiveEntry]:
+        return iter(self._entries.values())
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def open_archive(path: str) -> Optional[PreviewArchive]:
+    """開啟預覽封裝檔，檔案不存在或格式不正確時返回 None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return PreviewArchive(path)
+    except (OSError, ValueError) as e:
+        print(f"無法讀取預覽封裝檔，改為讀取個別檔案：{e}")
+        return None
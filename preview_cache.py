@@ -0,0 +1,101 @@
+"""
+預覽記憶體快取模組
+伺服器共用的預覽音訊 LRU 快取，以 st.cache_resource 在所有工作階段間共用，
+總位元組數超過上限時淘汰最久未使用的項目，並記錄命中/未命中/淘汰次數
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import streamlit as st
+
+# 預設容量上限（可用環境變數 GEMINI_TTS_PREVIEW_CACHE_MB 覆寫）
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class PreviewCache:
+    """以位元組數為上限的執行緒安全 LRU 快取"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            max_bytes: 快取內容的總位元組數上限
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """讀取快取內容並標記為最近使用，未命中時返回 None"""
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: Hashable, data: bytes) -> None:
+        """寫入快取並淘汰最久未使用的項目直到符合容量上限"""
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._items[key] = data
+            self._bytes += len(data)
+
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            data = self._items.pop(key, None)
+            if data is not None:
+                self._bytes -= len(data)
+
+    def clear(self) -> None:
+        """清除所有快取項目（不重設統計）"""
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def stats(self) -> Dict[str, Any]:
+        """取得快取統計資料"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_preview_cache() -> PreviewCache:
+    """取得伺服器共用的預覽快取
+
+    可用環境變數 GEMINI_TTS_PREVIEW_CACHE_MB 調整容量上限（MB）
+    """
+    max_mb = float(os.getenv("GEMINI_TTS_PREVIEW_CACHE_MB",
+                             DEFAULT_MAX_BYTES / (1024 * 1024)))
+    return PreviewCache(int(max_mb * 1024 * 1024))
@@ -0,0 +1,144 @@
+"""
+預覽音訊編碼模組
+以 NumPy 向量化運算將 24kHz 16-bit 的預覽降取樣並壓縮成 8-bit 編碼，
+讓預覽封裝檔與每次點擊傳送的資料量降為原本的約四分之一；
+輸出仍為 WAV 容器，瀏覽器可直接以 audio/wav 播放
+
+支援的編碼：
+    wav: 不轉換（24kHz 16-bit PCM）
+    mulaw: 12kHz 8-bit G.711 μ-law（預設，音質接近原始檔）
+    pcm8: 12kHz 8-bit 線性 PCM（相容性最高，雜訊較明顯）
+"""
+
+import io
+import os
+import struct
+import wave
+from typing import Tuple
+
+import numpy as np
+
+ENCODINGS = ("wav", "mulaw", "pcm8")
+DEFAULT_ENCODING = os.getenv("GEMINI_TTS_PREVIEW_ENCODING", "mulaw")
+
+# 壓縮編碼的取樣率（語音預覽的頻寬 6kHz 已足夠辨識音色）
+COMPACT_RATE = 12000
+
+# G.711 μ-law 參數（編碼為 14-bit 精度，解碼為 16-bit）
+_MULAW_BIAS = 0x21
+_MULAW_CLIP = 8158
+_MULAW_DECODE_BIAS = 0x84
+
+# WAV 格式代碼
+_WAVE_FORMAT_MULAW = 7
+
+# 降取樣低通濾波器的長度（奇數）
+_FILTER_TAPS = 63
+
+
+def read_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """解析 16-bit PCM WAV，返回 (單聲道 int16 樣本, 取樣率)"""
+    with wave.open(io.BytesIO(data), "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"只支援 16-bit PCM，收到 {wf.getsampwidth() * 8}-bit")
+        channels = wf.getnchannels()
+        rate = wf.getframerate()
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+def _lowpass_kernel(cutoff: float) -> np.ndarray:
+    """Hamming 視窗的 sinc 低通濾波器（cutoff 為相對於取樣率的比例）"""
+    n = np.arange(_FILTER_TAPS) - (_FILTER_TAPS - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(_FILTER_TAPS)
+    return kernel / kernel.sum()
+
+
+def resample(samples: np.ndarray, rate: int, target_rate: int) -> np.ndarray:
+    """降取樣到 target_rate（先低通濾波避免混疊），返回 float64 樣本"""
+    x = samples.astype(np.float64)
+    if target_rate >= rate or not len(x):
+        return x
+    # 截止頻率略低於新的奈奎斯特頻率
+    x = np.convolve(x, _lowpass_kernel(0.45 * target_rate / rate), mode="same")
+    if rate % target_rate == 0:
+        return x[::rate // target_rate]
+    positions = np.arange(0, len(x) - 1, rate / target_rate)
+    return np.interp(positions, np.arange(len(x)), x)
+
+
+def mulaw_encode(samples: np.ndarray) -> np.ndarray:
+    """將 16-bit 樣本編碼為 G.711 μ-law 位元組（與 G.711 參考實作逐位元一致）"""
+    # 參考實作在 14-bit 精度下量化
+    x = np.clip(np.round(samples), -32768, 32767).astype(np.int32) >> 2
+    sign = np.where(x < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(x), _MULAW_CLIP) + _MULAW_BIAS
+    # magnitude 介於 33 與 8191 之間，最高位元位置減 5 即為區段編號
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 5
+    mantissa = (magnitude >> (exponent + 1)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+def mulaw_decode(data: np.ndarray) -> np.ndarray:
+    """將 G.711 μ-law 位元組解碼為 int16 樣本"""
+    u = ~data.astype(np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    mantissa = u & 0x0F
+    magnitude = (((mantissa << 3) + _MULAW_DECODE_BIAS) << exponent) - _MULAW_DECODE_BIAS
+    return np.where(u & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _mulaw_wav(encoded: np.ndarray, rate: int) -> bytes:
+    # 非 PCM 格式需要 18 位元組的 fmt 區塊與 fact 區塊
+    data_size = len(encoded)
+    header = b"".join([
+        b"RIFF", struct.pack("<I", 50 + data_size), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHHH", 18, _WAVE_FORMAT_MULAW, 1, rate,
+                             rate, 1, 8, 0),
+        b"fact", struct.pack("<II", 4, data_size),
+        b"data", struct.pack("<I", data_size),
+    ])
+    return header + encoded.tobytes()
+
+
+def _pcm_wav(pcm: bytes, rate: int, sample_width: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def encode_samples(samples: np.ndarray, rate: int,
+                   encoding: str = DEFAULT_ENCODING) -> bytes:
+    """將單聲道 int16 樣本編碼為指定格式的 WAV 檔案內容"""
+    if encoding == "wav":
+        return _pcm_wav(samples.astype("<i2").tobytes(), rate, 2)
+    if encoding not in ENCODINGS:
+        raise ValueError(f"不支援的預覽編碼：{encoding}")
+
+    x = resample(samples, rate, COMPACT_RATE)
+    if encoding == "mulaw":
+        return _mulaw_wav(mulaw_encode(x), COMPACT_RATE)
+    # 8-bit WAV 為無號整數，以 128 為零點
+    pcm8 = np.clip(np.round(x / 256) + 128, 0, 255).astype(np.uint8)
+    return _pcm_wav(pcm8.tobytes(), COMPACT_RATE, 1)
+
+
+def encode_wav(data: bytes, encoding: str = DEFAULT_ENCODING) -> bytes:
+    """將 16-bit PCM WAV 檔案內容轉換為指定編碼"""
+    if encoding == "wav":
+        return data
+    samples, rate = read_wav(data)
+    return encode_samples(samples, rate, encoding)
+
+
+def encode_pcm(pcm: bytes, rate: int = 24000,
+               encoding: str = DEFAULT_ENCODING) -> bytes:
+    """將 API 返回的 16-bit 單聲道 PCM 編碼為指定格式的 WAV 檔案內容"""
+    samples = np.frombuffer(pcm[:len(pcm) // 2 * 2], dtype="<i2")
+    return encode_samples(samples, rate, encoding)
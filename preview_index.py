@@ -0,0 +1,317 @@
+"""
+語音預覽索引模組
+在伺服器啟動時掃描一次預覽檔案，建立 (語音, 語言) → 位置、大小、長度的索引，
+透過 st.cache_resource 在所有工作階段間共用；生成新的預覽時增量更新，
+因此查找預覽不需要任何檔案系統呼叫。預覽目錄中有封裝檔（preview_archive）時，
+預先生成的預覽直接從 mmap 區段讀取
+"""
+
+import os
+import threading
+import time
+import wave
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import streamlit as st
+
+import preview_archive
+import preview_encoding
+import single_flight
+
+# 預先生成的預覽目錄（generate_all_voice_previews.py 的輸出）
+PREVIEW_DIR = "voice_previews"
+# 舊版網頁介面即時生成的預覽所在目錄（仍會讀取，新的預覽一律寫入 PREVIEW_DIR）
+CACHE_DIR = "."
+# 檢查封裝檔是否已被重建的最短間隔（秒）
+ARCHIVE_CHECK_INTERVAL = 30.0
+
+
+@dataclass(frozen=True)
+class PreviewEntry:
+    """單一預覽檔案的索引資料"""
+    voice: str
+    language: str
+    path: str
+    size: int
+    duration: float
+    pregenerated: bool
+    # 位於封裝檔中時為資料的偏移量（path 為封裝檔路徑），個別檔案時為 None
+    offset: Optional[int] = None
+
+
+def preview_filename(voice_name: str, language: str) -> str:
+    """預覽檔案的檔名"""
+    return f"preview_{voice_name}_{language}.wav"
+
+
+def parse_preview_filename(filename: str) -> Optional[Tuple[str, str]]:
+    """從預覽檔名取出 (語音名稱, 語言代碼)，不是預覽檔案時返回 None"""
+    if not (filename.startswith("preview_") and filename.endswith(".wav")):
+        return None
+    parts = filename[8:-4].split("_", 1)
+    if len(parts) != 2 or not all(parts):
+        return None
+    return parts[0], parts[1]
+
+
+def _wav_duration(path: str, size: int) -> float:
+    try:
+        with wave.open(path, "rb") as wf:
+            return wf.getnframes() / wf.getframerate()
+    except (wave.Error, EOFError):
+        # 無法解析標頭時以 24kHz 單聲道 16-bit 估算
+        return max(0, size - 44) / (24000 * 2)
+
+
+class PreviewIndex:
+    """(語音, 語言) → 預覽檔案的記憶體索引"""
+
+    def __init__(self, preview_dir: str = PREVIEW_DIR,
+                 cache_dir: str = CACHE_DIR,
+                 archive_path: Optional[str] = None):
+        self.preview_dir = preview_dir
+        self.cache_dir = cache_dir
+        self.archive_path = archive_path or os.path.join(
+            preview_dir, preview_archive.ARCHIVE_FILENAME
+        )
+        self._archive: Optional[preview_archive.PreviewArchive] = None
+        self._archive_checked = 0.0
+        self._entries: Dict[Tuple[str, str], PreviewEntry] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.misses = 0
+
+    def _make_entry(self, voice_name: str, language: str, path: str,
+                    pregenerated: bool) -> PreviewEntry:
+        size = os.path.getsize(path)
+        return PreviewEntry(voice_name, language, path, size,
+                            _wav_duration(path, size), pregenerated)
+
+    def _put(self, entry: PreviewEntry) -> None:
+        # 預先生成的檔案優先於即時生成的檔案
+        current = self._entries.get((entry.voice, entry.language))
+        if current is None or entry.pregenerated or not current.pregenerated:
+            self._entries[(entry.voice, entry.language)] = entry
+
+    def scan(self) -> int:
+        """重新掃描預覽目錄與封裝檔，返回索引中的預覽數量"""
+        archive = preview_archive.open_archive(self.archive_path)
+        entries = []
+        if archive is not None:
+            entries.extend(
+                PreviewEntry(item.voice, item.language, self.archive_path,
+                             item.length, item.duration, True, item.offset)
+                for item in archive.entries()
+            )
+
+        for directory, pregenerated in ((self.preview_dir, True),
+                                        (self.cache_dir, False)):
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as it:
+                for item in it:
+                    key = parse_preview_filename(item.name)
+                    if key is None or not item.is_file():
+                        continue
+                    # 已封裝的預覽只在個別檔案比封裝檔新時才改用檔案
+                    if (pregenerated and archive is not None and key in archive
+                            and item.stat().st_mtime_ns <= archive.mtime_ns):
+                        continue
+                    entries.append(self._make_entry(
+                        key[0], key[1], item.path, pregenerated
+                    ))
+
+        with self._lock:
+            self._archive = archive
+            self._archive_checked = time.monotonic()
+            self._entries = {}
+            for entry in entries:
+                self._put(entry)
+            return len(self._entries)
+
+    def _archive_changed(self) -> bool:
+        """封裝檔是否已被重建（每 ARCHIVE_CHECK_INTERVAL 秒最多檢查一次）"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._archive_checked < ARCHIVE_CHECK_INTERVAL:
+                return False
+            self._archive_checked = now
+            archive = self._archive
+        try:
+            stat = os.stat(self.archive_path)
+        except OSError:
+            return archive is not None
+        return (archive is None or stat.st_ino != archive.inode
+                or stat.st_mtime_ns != archive.mtime_ns)
+
+    def get(self, voice_name: str, language: str) -> Optional[PreviewEntry]:
+        """查找預覽（除了定期檢查封裝檔外不存取檔案系統）"""
+        if self._archive_changed():
+            self.scan()
+        with self._lock:
+            self.lookups += 1
+            entry = self._entries.get((voice_name, language))
+            if entry is None:
+                self.misses += 1
+            return entry
+
+    def read(self, voice_name: str,
+             language: str) -> Optional[Union[bytes, memoryview]]:
+        """讀取預覽的 WAV 內容，索引中沒有時返回 None"""
+        entry = self.get(voice_name, language)
+        if entry is None:
+            return None
+        return self.read_entry(entry)
+
+    def read_entry(self,
+                   entry: PreviewEntry) -> Optional[Union[bytes, memoryview]]:
+        """讀取索引項目的 WAV 內容
+
+        封裝檔中的預覽返回 mmap 的唯讀 memoryview（不開檔也不複製），
+        個別檔案則讀取整個檔案；檔案已被移除、或封裝檔已被重建而項目過期時返回 None。
+        """
+        if entry.offset is not None:
+            with self._lock:
+                archive = self._archive
+            item = (archive.lookup(entry.voice, entry.language)
+                    if archive is not None else None)
+            if item is None or (item.offset, item.length) != (entry.offset,
+                                                              entry.size):
+                return None
+            return archive.slice(item.offset, item.length)
+        try:
+            with open(entry.path, "rb") as f:
+                return f.read()
+        except OSError:
+            self.remove(entry.voice, entry.language)
+            return None
+
+    def add(self, voice_name: str, language: str, path: str,
+            pregenerated: bool = False) -> PreviewEntry:
+        """將剛寫入的預覽檔案加入索引"""
+        entry = self._make_entry(voice_name, language, path, pregenerated)
+        with self._lock:
+            self._put(entry)
+        return entry
+
+    def remove(self, voice_name: str, language: str) -> None:
+        """從索引移除預覽（例如檔案已被刪除）"""
+        with self._lock:
+            self._entries.pop((voice_name, language), None)
+
+    def missing(self, voice_names: Iterable[str], language: str) -> List[str]:
+        """返回指定語言中尚無預覽的語音"""
+        with self._lock:
+            return [voice for voice in voice_names
+                    if (voice, language) not in self._entries]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "previews": len(self._entries),
+                "bytes": sum(e.size for e in self._entries.values()),
+                "audio_seconds": round(
+                    sum(e.duration for e in self._entries.values()), 1
+                ),
+                "archived": sum(e.offset is not None
+                                for e in self._entries.values()),
+                "lookups": self.lookups,
+                "misses": self.misses,
+            }
+
+
+def generate_preview(index: PreviewIndex, voice_name: str, language: str,
+                     synthesize: Callable[[], Optional[bytes]],
+                     save_func: Callable,
+                     pregenerated: bool = False) -> Optional[PreviewEntry]:
+    """生成一個預覽檔案並加入索引，同一個預覽同時只會生成一次
+
+    預覽一律寫入索引的預覽目錄（網頁上的點擊、背景生成服務與
+    generate_all_voice_previews.py 使用同一個路徑），因此檔案鎖在它們之間互斥。
+    行程內相同 (語音, 語言) 的呼叫合併為一次 API 請求，等待者共用同一個索引項目；
+    索引中已有預覽，或取得鎖後發現其他行程已寫好檔案時，不呼叫 API 而直接使用。
+    檔案先寫入暫存檔再改名，讀取端不會看到寫到一半的檔案。
+
+    Args:
+        index: 預覽索引
+        voice_name: 語音名稱
+        language: 語言代碼
+        synthesize: 生成 PCM 資料的函數，失敗時返回 None 或拋出例外
+        save_func: 儲存音訊檔案的函數 (檔案路徑, PCM 資料)
+        pregenerated: 是否為預先生成的預覽
+
+    Returns:
+        預覽的索引項目，生成失敗時返回 None
+    """
+    path = os.path.join(index.preview_dir,
+                        preview_filename(voice_name, language))
+
+    def run() -> Optional[PreviewEntry]:
+        entry = index.get(voice_name, language)
+        if entry is not None:
+            return entry
+        with single_flight.FileLock(path):
+            if os.path.exists(path):
+                return index.add(voice_name, language, path, pregenerated)
+            audio_data = synthesize()
+            if not audio_data:
+                return None
+            with single_flight.atomic_write(path) as temp_path:
+                save_func(temp_path, audio_data)
+            return index.add(voice_name, language, path, pregenerated)
+
+    return single_flight.get_default_flight().do(
+        ("preview", voice_name, language), run
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_preview_index() -> PreviewIndex:
+    """取得伺服器共用的預覽索引（第一次呼叫時掃描預覽目錄）
+
+    預覽目錄中尚無封裝檔，或封裝檔的編碼與設定不同時，先重新建立封裝檔
+    """
+    index = PreviewIndex()
+    archive = preview_archive.open_archive(index.archive_path)
+    if os.path.isdir(index.preview_dir) and (
+            archive is None
+            or archive.encoding != preview_encoding.DEFAULT_ENCODING):
+        try:
+            rebuild_archive(index.preview_dir, index.archive_path)
+        except OSError as e:
+            print(f"無法建立預覽封裝檔，改為讀取個別檔案：{e}")
+    index.scan()
+    return index
+
+
+def rebuild_archive(preview_dir: str = PREVIEW_DIR,
+                    archive_path: Optional[str] = None,
+                    encoding: str = preview_encoding.DEFAULT_ENCODING) -> int:
+    """將預覽目錄中的所有預覽檔案重新打包成封裝檔（原子替換）
+
+    Args:
+        preview_dir: 預覽目錄
+        archive_path: 封裝檔路徑（預設為預覽目錄中的 previews.pack）
+        encoding: 封裝時使用的預覽編碼（見 preview_encoding.ENCODINGS）
+
+    Returns:
+        封裝的預覽數量
+    """
+    archive_path = archive_path or os.path.join(
+        preview_dir, preview_archive.ARCHIVE_FILENAME
+    )
+    # 網頁介面與 generate_all_voice_previews.py 可能同時重建，後開始的等待前一個完成，
+    # 避免較早掃描的結果覆蓋較新的封裝檔
+    with single_flight.FileLock(archive_path):
+        previews = []
+        with os.scandir(preview_dir) as it:
+            for item in it:
+                key = parse_preview_filename(item.name)
+                if key is not None and item.is_file():
+                    previews.append((key[0], key[1], item.path))
+        return preview_archive.build_archive(archive_path, previews, encoding)
@@ -0,0 +1,209 @@
+"""
+預覽音訊靜態伺服器模組
+在背景執行緒以獨立的 HTTP 連接埠提供預覽音訊（/previews/<語音>/<語言>.wav），
+支援 ETag / If-None-Match、Cache-Control 與 Range 請求，
+讓網頁只需引用網址，重複播放時直接使用瀏覽器快取，不再經由 websocket 傳送 base64。
+預設停用：只開放 Streamlit 連接埠的部署（雲端、Docker、反向代理）瀏覽器連不到額外的連接埠，
+需以環境變數明確啟用，且預設只監聽本機位址
+"""
+
+import hashlib
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+# 啟用時的建議連接埠（GEMINI_TTS_PREVIEW_PORT=8765）
+DEFAULT_PORT = 8765
+# 預設只監聽本機位址（可用環境變數 GEMINI_TTS_PREVIEW_HOST 覆寫）
+DEFAULT_HOST = "127.0.0.1"
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+# 網址帶有版本參數時，內容不會改變，可長期快取
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 沒有版本參數時，每次都以 ETag 重新驗證
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_PATH_PATTERN = re.compile(r"^/previews/([^/]+)/([^/]+)\.wav$")
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def make_etag(data: bytes) -> str:
+    """計算預覽內容的 ETag（不含引號）"""
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def preview_path(voice_name: str, language: str) -> str:
+    """預覽音訊的網址路徑"""
+    return f"/previews/{quote(voice_name, safe='')}/{quote(language, safe='')}.wav"
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析單一 Range 標頭，返回 (起點, 終點)（含終點）
+
+    Returns:
+        可滿足的範圍；無法解析或包含多個範圍時返回 None（回應完整內容）
+
+    Raises:
+        ValueError: 範圍超出內容長度（應回應 416）
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-N 表示最後 N 個位元組
+        length = int(end)
+        if length == 0:
+            raise ValueError("空的範圍")
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("範圍超出內容長度")
+    return start, end
+
+
+class PreviewServer:
+    """在背景執行緒提供預覽音訊的 HTTP 伺服器"""
+
+    def __init__(self, loader: Callable[[str, str], Optional[bytes]],
+                 port: int = DEFAULT_PORT, host: str = DEFAULT_HOST):
+        """
+        Args:
+            loader: 依 (語音名稱, 語言代碼) 返回預覽 WAV 內容的函數，沒有預覽時返回 None
+            port: 監聽的連接埠（0 表示由系統指定）
+            host: 監聽的位址
+        """
+        self.loader = loader
+        self.host = host
+        self.requests = 0
+        self.not_modified = 0
+        self.partial = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever,
+                         name="preview-server", daemon=True).start()
+
+    def _count(self, name: str, sent: int = 0) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += sent
+            if name:
+                setattr(self, name, getattr(self, name) + 1)
+
+    def _make_handler(self):
+        server = self
+
+        class PreviewHandler(BaseHTTPRequestHandler):
+            def _serve(self, send_body: bool) -> None:
+                url = urlsplit(self.path)
+                match = _PATH_PATTERN.match(url.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                voice_name, language = (unquote(part) for part in match.groups())
+                data = server.loader(voice_name, language)
+                if data is None:
+                    self.send_error(404)
+                    return
+
+                etag = make_etag(data)
+                quoted_etag = f'"{etag}"'
+                versioned = parse_qs(url.query).get("v", [None])[0] == etag
+                cache_control = (IMMUTABLE_CACHE_CONTROL if versioned
+                                 else REVALIDATE_CACHE_CONTROL)
+
+                if quoted_etag in self.headers.get("If-None-Match", ""):
+                    self.send_response(304)
+                    self.send_header("ETag", quoted_etag)
+                    self.send_header("Cache-Control", cache_control)
+                    self.end_headers()
+                    server._count("not_modified")
+                    return
+
+                byte_range = None
+                range_header = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if range_header and (not if_range or if_range == quoted_etag):
+                    try:
+                        byte_range = parse_range(range_header, len(data))
+                    except ValueError:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(data)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        server._count("")
+                        return
+
+                if byte_range:
+                    start, end = byte_range
+                    body = data[start:end + 1]
+                    self.send_response(206)
+                    self.send_header("Content-Range",
+                                     f"bytes {start}-{end}/{len(data)}")
+                else:
+                    body = data
+                    self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", quoted_etag)
+                self.send_header("Cache-Control", cache_control)
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+                server._count("partial" if byte_range else "",
+                              len(body) if send_body else 0)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def log_message(self, format, *args):
+                pass
+
+        return PreviewHandler
+
+    def url(self, base_url: str, voice_name: str, language: str,
+            data: Optional[bytes] = None) -> str:
+        """預覽音訊的完整網址；提供內容時附加版本參數，讓瀏覽器長期快取"""
+        url = f"{base_url.rstrip('/')}{preview_path(voice_name, language)}"
+        return f"{url}?v={make_etag(data)}" if data is not None else url
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "port": self.port,
+                "requests": self.requests,
+                "not_modified": self.not_modified,
+                "partial": self.partial,
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def configured_port() -> Optional[int]:
+    """環境變數 GEMINI_TTS_PREVIEW_PORT 設定的連接埠
+
+    未設定或設為 off 時返回 None（停用，使用內嵌音訊）；設為 0 時由系統指定連接埠
+    """
+    value = os.getenv("GEMINI_TTS_PREVIEW_PORT", "").strip().lower()
+    if value in ("", "off", "false", "no"):
+        return None
+    return int(value)
+
+
+def configured_host() -> str:
+    """環境變數 GEMINI_TTS_PREVIEW_HOST 設定的監聽位址（預設只監聽本機）"""
+    return os.getenv("GEMINI_TTS_PREVIEW_HOST", DEFAULT_HOST).strip() or DEFAULT_HOST
@@ -0,0 +1,44 @@
+"""
+語音預覽文本模組
+集中管理各語言的預覽文本與預覽合成工作，供網頁介面和預覽生成器共用
+"""
+
+import async_synthesis_engine
+import tts_synthesis
+
+DEFAULT_PREVIEW_MODEL = "gemini-2.5-flash-preview-tts"
+
+# 預覽文本（不在列表中的語言使用英文）
+PREVIEW_TEXTS = {
+    "zh-TW": "您好，我是 {voice}。這是我的聲音預覽，希望您喜歡。",
+    "zh-CN": "您好，我是 {voice}。这是我的声音预览，希望您喜欢。",
+    "en-US": "Hello, I am {voice}. This is a preview of my voice. I hope you like it.",
+    "ja-JP": "こんにちは、私は{voice}です。これは私の声のプレビューです。",
+    "ko-KR": "안녕하세요, 저는 {voice}입니다. 제 목소리 미리듣기입니다.",
+    "es-US": "Hola, soy {voice}. Esta es una vista previa de mi voz.",
+    "fr-FR": "Bonjour, je suis {voice}. Ceci est un aperçu de ma voix.",
+    "de-DE": "Hallo, ich bin {voice}. Dies ist eine Vorschau meiner Stimme.",
+}
+
+
+def get_preview_text(voice_name: str, language: str) -> str:
+    """取得指定語音和語言的預覽文本"""
+    template = PREVIEW_TEXTS.get(language, PREVIEW_TEXTS["en-US"])
+    return template.format(voice=voice_name)
+
+
+def build_preview_job(voice_name: str, language: str,
+                      model_name: str = DEFAULT_PREVIEW_MODEL
+                      ) -> async_synthesis_engine.SynthesisJob:
+    """建立語音預覽的合成工作
+
+    預覽已有獨立的檔案快取，因此不寫入合成快取。
+    工作的 key 為 (語音名稱, 語言代碼)。
+    """
+    return async_synthesis_engine.SynthesisJob(
+        model=model_name,
+        contents=get_preview_text(voice_name, language),
+        config=tts_synthesis.build_single_speaker_config(voice_name),
+        key=(voice_name, language),
+        use_cache=False
+    )
@@ -0,0 +1,158 @@
+"""
+效能分析模組
+以 cProfile 與 tracemalloc 記錄一次生成的 CPU 熱點與記憶體配置，
+將 pstats、tracemalloc 快照與文字摘要寫入 profiles 目錄，
+供命令列的 --profile 參數與網頁介面的 GEMINI_TTS_PROFILE 環境變數使用
+"""
+
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, Optional
+
+DEFAULT_PROFILE_DIR = os.getenv("GEMINI_TTS_PROFILE_DIR", "profiles")
+
+# 摘要中列出的熱點與配置位置數量
+DEFAULT_TOP = 15
+
+# 同一時間只能有一個 cProfile 在執行
+_active_lock = threading.Lock()
+
+
+@dataclass
+class ProfileReport:
+    """一次效能分析的輸出檔案與重點數據"""
+    label: str
+    stats_path: str = ""
+    snapshot_path: str = ""
+    summary_path: str = ""
+    wall_seconds: float = 0.0
+    peak_bytes: int = 0
+    summary: str = ""
+
+
+def _hot_spots(profiler: cProfile.Profile, sort_key: str, top: int) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.strip_dirs().sort_stats(sort_key).print_stats(top)
+    # 去掉 pstats 的標頭，只保留表格
+    text = stream.getvalue()
+    start = text.find("ncalls")
+    return text[start:].rstrip() if start >= 0 else text.rstrip()
+
+
+@contextlib.contextmanager
+def profile_run(label: str, output_dir: str = DEFAULT_PROFILE_DIR,
+                top: int = DEFAULT_TOP,
+                echo: bool = True) -> Iterator[Optional[ProfileReport]]:
+    """記錄區塊內的 CPU 與記憶體使用
+
+    只記錄呼叫端執行緒；合成引擎事件迴圈中的網路等待會顯示為
+    呼叫端等待 Future 的時間。已有其他分析進行中時（例如巢狀呼叫）不做任何事。
+
+    輸出檔案（前綴為 時間_標籤）：
+        .prof: pstats 資料，可用 `python -m pstats` 或 snakeviz 開啟
+        .tracemalloc: tracemalloc 快照，可用 tracemalloc.Snapshot.load 載入
+        .txt: 熱點與記憶體配置摘要
+
+    Args:
+        label: 檔名中的標籤
+        output_dir: 輸出目錄
+        top: 摘要中列出的項目數
+        echo: 是否將摘要輸出到標準輸出
+    """
+    if not _active_lock.acquire(blocking=False):
+        yield None
+        return
+
+    report = ProfileReport(label=label)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(25)
+    tracemalloc.reset_peak()
+
+    profiler = cProfile.Profile()
+    start_time = datetime.now()
+    profiler.enable()
+    try:
+        yield report
+    finally:
+        profiler.disable()
+        report.wall_seconds = (datetime.now() - start_time).total_seconds()
+        _, report.peak_bytes = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            _write_report(report, profiler, snapshot, start_time,
+                          output_dir, top)
+        except OSError as e:
+            print(f"無法寫入效能分析結果：{e}")
+        finally:
+            _active_lock.release()
+        if echo and report.summary:
+            print(report.summary)
+
+
+def _write_report(report: ProfileReport, profiler: cProfile.Profile,
+                  snapshot: tracemalloc.Snapshot, start_time: datetime,
+                  output_dir: str, top: int) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+    safe_label = re.sub(r"[^\w.-]+", "_", report.label)
+    prefix = os.path.join(
+        output_dir, f"{start_time.strftime('%Y%m%d_%H%M%S')}_{safe_label}"
+    )
+    report.stats_path = f"{prefix}.prof"
+    report.snapshot_path = f"{prefix}.tracemalloc"
+    report.summary_path = f"{prefix}.txt"
+
+    profiler.dump_stats(report.stats_path)
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    snapshot.dump(report.snapshot_path)
+
+    allocations = "\n".join(
+        f"  {stat.size / 1024:10.1f} KiB  {stat.count:7d} 次  {stat.traceback[0]}"
+        for stat in snapshot.statistics("lineno")[:top]
+    )
+    report.summary = "\n".join([
+        f"=== 效能分析：{report.label} ===",
+        f"耗時：{report.wall_seconds:.2f} 秒",
+        f"記憶體峰值：{report.peak_bytes / 1024 / 1024:.1f} MiB",
+        "",
+        f"--- 自身耗時最多的函數（前 {top} 名）---",
+        _hot_spots(profiler, "tottime", top),
+        "",
+        f"--- 累計耗時最多的函數（前 {top} 名）---",
+        _hot_spots(profiler, "cumulative", top),
+        "",
+        f"--- 結束時仍佔用記憶體的配置位置（前 {top} 名）---",
+        allocations,
+        "",
+        f"詳細資料：{report.stats_path}、{report.snapshot_path}",
+    ])
+    with open(report.summary_path, "w", encoding="utf-8") as f:
+        f.write(report.summary + "\n")
+
+
+def profile_from_env(label: str, scope: str = "generate"):
+    """依 GEMINI_TTS_PROFILE 環境變數決定是否分析
+
+    GEMINI_TTS_PROFILE=1（或 generate）分析每次生成；
+    GEMINI_TTS_PROFILE=all 另外分析網頁介面的每次重新執行（scope="rerun"）。
+    """
+    value = os.getenv("GEMINI_TTS_PROFILE", "").lower()
+    if scope == "rerun":
+        enabled = value == "all"
+    else:
+        enabled = value in ("1", "true", "yes", "generate", "all")
+    return profile_run(label) if enabled else contextlib.nullcontext()
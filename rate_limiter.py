@@ -0,0 +1,214 @@
+"""
+自適應速率限制模組
+以權杖桶控制每分鐘請求數並限制同時進行的請求數；
+遇到 429 / RESOURCE_EXHAUSTED 時依 AIMD 方式降低速率（同一波 429 只降一次），
+每一輪請求成功後再加法調升，讓吞吐量維持在配額上限附近
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+# 預設值（可由環境變數覆寫）
+DEFAULT_RPM = 60.0
+DEFAULT_MAX_RPM = 300.0
+DEFAULT_MIN_RPM = 1.0
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# 等待並行名額釋放時的輪詢間隔（秒）
+_SLOT_POLL_INTERVAL = 0.05
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """判斷例外是否為配額不足（HTTP 429 / RESOURCE_EXHAUSTED）"""
+    if getattr(error, "code", None) == 429:
+        return True
+    if getattr(error, "status", None) == "RESOURCE_EXHAUSTED":
+        return True
+    return "RESOURCE_EXHAUSTED" in str(error)
+
+
+class AdaptiveRateLimiter:
+    """AIMD 權杖桶速率限制器，可同時供執行緒與 asyncio 使用"""
+
+    def __init__(self, rpm: float = DEFAULT_RPM,
+                 max_rpm: float = DEFAULT_MAX_RPM,
+                 min_rpm: float = DEFAULT_MIN_RPM,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 increase_step: float = 2.0,
+                 decrease_factor: float = 0.5):
+        """
+        Args:
+            rpm: 初始每分鐘請求數
+            max_rpm: 調升的上限
+            min_rpm: 調降的下限
+            max_in_flight: 同時進行的請求數上限
+            increase_step: 每一輪（max_in_flight 個）成功請求後增加的每分鐘請求數（加法增加）
+            decrease_factor: 遇到 429 時的速率乘數（乘法減少，每次降速後取得名額的請求
+                             才會再觸發降速）
+        """
+        self.rpm = min(max(rpm, min_rpm), max_rpm)
+        self.max_rpm = max_rpm
+        self.min_rpm = min_rpm
+        self.max_in_flight = max_in_flight
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._in_flight = 0
+        # 降速的次數；名額記錄取得時的值，用來辨識降速前已送出的請求
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    @property
+    def _capacity(self) -> float:
+        # 桶容量約為 6 秒的請求量，並不超過並行上限，允許短暫的並行爆量
+        return max(1.0, min(float(self.max_in_flight), self.rpm / 10.0))
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self._capacity,
+                           self._tokens + elapsed * self.rpm / 60.0)
+
+    def _try_acquire(self) -> Tuple[float, int]:
+        """嘗試取得名額；成功返回 (0, 降速次數)，否則返回 (建議等待的秒數, 降速次數)"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now, self._epoch
+            if self._in_flight >= self.max_in_flight:
+                return _SLOT_POLL_INTERVAL, self._epoch
+
+            self._refill(now)
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) * 60.0 / self.rpm, self._epoch
+
+            self._tokens -= 1.0
+            self._in_flight += 1
+            self.requests += 1
+            return 0.0, self._epoch
+
+    def acquire(self) -> int:
+        """阻塞直到取得一個請求名額
+
+        Returns:
+            取得名額時的降速次數（傳給 release，讓降速前送出的請求不會重複降速）
+        """
+        start_time = time.monotonic()
+        while True:
+            wait, epoch = self._try_acquire()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        waited = time.monotonic() - start_time
+        with self._lock:
+            self.total_wait += waited
+        return epoch
+
+    async def acquire_async(self) -> int:
+        """acquire 的非同步版本，等待時不阻塞事件迴圈"""
+        start_time = time.monotonic()
+        while True:
+            wait, epoch = self._try_acquire()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        waited = time.monotonic() - start_time
+        with self._lock:
+            self.total_wait += waited
+        return epoch
+
+    def release(self, error: Optional[BaseException] = None,
+                epoch: Optional[int] = None) -> None:
+        """釋放名額並依結果調整速率
+
+        Args:
+            error: 請求失敗時的例外；429 會觸發降速，成功則逐步調升
+            epoch: acquire 返回的降速次數；之後已經降速過時，
+                   這個請求的 429 屬於同一波，不再降速（None 表示一律降速）
+        """
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+            if error is None:
+                # 每一輪 max_in_flight 個成功請求共增加 increase_step
+                self.rpm = min(self.max_rpm,
+                               self.rpm + self.increase_step / self.max_in_flight)
+            elif is_rate_limit_error(error):
+                self.throttled += 1
+                if epoch is not None and epoch != self._epoch:
+                    return
+                self._epoch += 1
+                self.rpm = max(self.min_rpm, self.rpm * self.decrease_factor)
+                # 清空權杖並暫停一個請求間隔，讓配額恢復
+                self._tokens = 0.0
+                self._blocked_until = time.monotonic() + 60.0 / self.rpm
+
+    @contextmanager
+    def slot(self):
+        """同步請求的名額（with 區塊結束時自動依結果調整速率）"""
+        epoch = self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            self.release(e, epoch)
+            raise
+        self.release(epoch=epoch)
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """非同步請求的名額"""
+        epoch = await self.acquire_async()
+        try:
+            yield
+        except BaseException as e:
+            self.release(e, epoch)
+            raise
+        self.release(epoch=epoch)
+
+    def stats(self) -> Dict[str, Any]:
+        """取得速率限制統計資料"""
+        with self._lock:
+            return {
+                "rpm": round(self.rpm, 2),
+                "max_rpm": self.max_rpm,
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "total_wait_seconds": round(self.total_wait, 3),
+            }
+
+
+_default_limiter: Optional[AdaptiveRateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def get_default_limiter() -> AdaptiveRateLimiter:
+    """取得行程共用的速率限制器
+
+    可用環境變數調整：
+        GEMINI_TTS_RPM: 初始每分鐘請求數
+        GEMINI_TTS_MAX_RPM: 每分鐘請求數上限（通常設為帳戶配額）
+        GEMINI_TTS_MAX_IN_FLIGHT: 同時進行的請求數上限
+    """
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = AdaptiveRateLimiter(
+                rpm=float(os.getenv("GEMINI_TTS_RPM", DEFAULT_RPM)),
+                max_rpm=float(os.getenv("GEMINI_TTS_MAX_RPM", DEFAULT_MAX_RPM)),
+                max_in_flight=int(os.getenv("GEMINI_TTS_MAX_IN_FLIGHT",
+                                            DEFAULT_MAX_IN_FLIGHT))
+            )
+        return _default_limiter
@@ -0,0 +1,258 @@
+"""
+重試與斷路器模組
+區分可重試與不可重試的錯誤，以帶抖動的指數退避重試暫時性失敗；
+後端持續失敗時由斷路器快速失敗，並記錄重試與斷路器的統計資料
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+# 可重試的 HTTP 狀態碼
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，請求被直接拒絕"""
+
+
+class RetryableError(Exception):
+    """可重試錯誤的基底類別"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """判斷錯誤是否為暫時性、值得重試的錯誤"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, RetryableError):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError,
+                              TimeoutError, asyncio.TimeoutError))
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """判斷錯誤是否代表後端故障（連線錯誤、逾時、5xx 或 429）
+
+    只有這類錯誤計入斷路器門檻；提示內容造成的錯誤（例如回應中沒有音訊、400）
+    每次都會以相同方式失敗，不代表後端無法使用，不應讓所有使用者的請求被拒絕。
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in (408, 429) or code >= 500
+    return isinstance(error, (httpx.TransportError, ConnectionError,
+                              TimeoutError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """連續失敗達門檻後開啟，冷卻後以半開狀態放行一個試探請求
+
+    經由 RetryPolicy 使用時，每個邏輯請求（含其所有重試）只檢查一次並記錄一次結果，
+    門檻代表連續失敗的請求數而非嘗試次數
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opens = 0
+        self.short_circuits = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """呼叫前檢查斷路器狀態
+
+        Raises:
+            CircuitOpenError: 斷路器開啟中
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.short_circuits += 1
+                    raise CircuitOpenError("Gemini API 暫時無法使用，請稍後再試")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                # 試探請求被取消時不會回報結果，逾時後允許新的試探
+                now = time.monotonic()
+                if (self._probe_in_flight and
+                        now - self._probe_started < self.reset_timeout):
+                    self.short_circuits += 1
+                    raise CircuitOpenError("Gemini API 暫時無法使用，請稍後再試")
+                self._probe_in_flight = True
+                self._probe_started = now
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: BaseException) -> None:
+        """記錄失敗；只有連線錯誤、逾時、5xx 與 429 才計入門檻（見 is_backend_failure）"""
+        with self._lock:
+            self._probe_in_flight = False
+            if not is_backend_failure(error):
+                if self.state == self.HALF_OPEN:
+                    self.state = self.CLOSED
+                return
+
+            self._failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self._failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "opens": self.opens,
+                "short_circuits": self.short_circuits,
+            }
+
+
+class RetryPolicy:
+    """帶完整抖動（full jitter）的指數退避重試策略"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0,
+                 max_delay: float = 30.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.give_ups = 0
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失敗後的等待秒數（attempt 從 1 開始）"""
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, cap)
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _should_retry(self, error: BaseException, attempt: int) -> bool:
+        if attempt < self.max_attempts and is_retryable(error):
+            self._count("retries")
+            return True
+        # 放棄時才向斷路器記錄一次失敗；重試中的嘗試不計入門檻
+        self._count("give_ups")
+        if self.breaker is not None:
+            self.breaker.record_failure(error)
+        return False
+
+    def call(self, func: Callable[[], T]) -> T:
+        """以重試策略執行同步函數
+
+        斷路器在第一次嘗試前檢查一次，結果在成功或放棄時記錄一次；
+        半開狀態的試探請求因此可以完成自己的重試
+        """
+        self._count("calls")
+        if self.breaker is not None:
+            self.breaker.before_call()
+        attempt = 0
+        while True:
+            attempt += 1
+            self._count("attempts")
+            try:
+                result = func()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    async def call_async(self, func: Callable[[], Awaitable[T]]) -> T:
+        """以重試策略執行非同步函數（func 每次呼叫都需返回新的 awaitable；斷路器處理同 call）"""
+        self._count("calls")
+        if self.breaker is not None:
+            self.breaker.before_call()
+        attempt = 0
+        while True:
+            attempt += 1
+            self._count("attempts")
+            try:
+                result = await func()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """取得重試與斷路器統計資料"""
+        with self._lock:
+            stats = {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "give_ups": self.give_ups,
+            }
+        if self.breaker is not None:
+            stats["breaker"] = self.breaker.stats()
+        return stats
+
+
+_default_policy: Optional[RetryPolicy] = None
+_default_lock = threading.Lock()
+
+
+def get_default_policy() -> RetryPolicy:
+    """取得行程共用的重試策略（含斷路器）
+
+    可用環境變數調整：
+        GEMINI_TTS_MAX_ATTEMPTS: 每個請求的最多嘗試次數
+        GEMINI_TTS_BREAKER_THRESHOLD: 斷路器開啟前連續失敗的請求數
+        GEMINI_TTS_BREAKER_RESET: 斷路器冷卻秒數
+    """
+    global _default_policy
+    with _default_lock:
+        if _default_policy is None:
+            _default_policy = RetryPolicy(
+                max_attempts=int(os.getenv("GEMINI_TTS_MAX_ATTEMPTS", "4")),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(
+                        os.getenv("GEMINI_TTS_BREAKER_THRESHOLD", "5")
+                    ),
+                    reset_timeout=float(
+                        os.getenv("GEMINI_TTS_BREAKER_RESET", "30")
+                    )
+                )
+            )
+        return _default_policy
@@ -0,0 +1,234 @@
+"""
+單次執行（single flight）模組
+合併同時進行的相同請求：第一個呼叫者實際執行，其餘呼叫者等待並共用同一個結果，
+讓多位使用者同時點擊同一個未快取的預覽時只發出一次 API 請求。
+另提供跨行程的檔案鎖（網頁介面與 generate_all_voice_previews.py 可能同時執行），
+以及先寫入暫存檔再改名的原子寫入
+"""
+
+import asyncio
+import contextlib
+import os
+import tempfile
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 沒有 fcntl，檔案鎖退化為只在行程內有效
+    fcntl = None
+
+
+class _Call:
+    """進行中的呼叫"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """以鍵合併同時進行的相同呼叫（執行緒安全）"""
+
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """執行 func 並返回結果；相同的鍵已在執行中時等待並共用其結果
+
+        執行者拋出的例外也會在每個等待者中拋出，下一次呼叫會重新執行。
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable,
+                       func: Callable[[], Awaitable[Any]]) -> Any:
+        """do 的非同步版本，合併同一個事件迴圈中的相同呼叫
+
+        等待者被取消時不會影響執行者；執行者被取消時等待者同樣收到 CancelledError。
+        """
+        loop = asyncio.get_running_loop()
+        # 不同事件迴圈的 Future 不能互相等待，因此以迴圈區分
+        key = (id(loop), key)
+        with self._lock:
+            self.calls += 1
+            future = self._async_calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._async_calls[key] = loop.create_future()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 沒有等待者時避免「例外未被取出」的警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._async_calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """取得合併統計資料"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "shared": self.shared,
+                "in_flight": len(self._calls) + len(self._async_calls),
+            }
+
+
+class FileLock:
+    """以 flock 實作的跨行程互斥鎖
+
+    鎖定 path 旁的隱藏鎖檔（.檔名.lock），而不是目標檔案本身，
+    目標檔案因此可以用 os.replace 原子替換。鎖檔不會被刪除，
+    刪除會讓等待中的行程鎖到已經不存在的檔案。
+    同一個行程的不同執行緒也會互斥（每次取得鎖都開啟新的檔案描述符）。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 要保護的檔案路徑
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        self.path = os.path.join(directory, f".{name}.lock")
+        self._fd: Optional[int] = None
+        # 沒有 fcntl 時至少在行程內互斥
+        self._thread_lock = _process_lock(self.path)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """取得鎖；blocking 為 False 且鎖已被佔用時返回 False"""
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        try:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        except BaseException:
+            os.close(fd)
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            # 關閉檔案描述符即釋放 flock
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+_process_locks: Dict[str, threading.Lock] = {}
+_process_locks_lock = threading.Lock()
+
+
+def _process_lock(lock_path: str) -> threading.Lock:
+    """同一個鎖檔在行程內共用的執行緒鎖"""
+    with _process_locks_lock:
+        return _process_locks.setdefault(lock_path, threading.Lock())
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: int = 0o644) -> Iterator[str]:
+    """原子寫入：產生同目錄的暫存檔路徑，區塊正常結束後以 os.replace 替換目標檔案
+
+    讀取端（或其他行程）不會看到寫到一半的檔案；區塊拋出例外時刪除暫存檔。
+
+    使用方式：
+        with atomic_write("out.wav") as temp_path:
+            write_wav_file(temp_path, pcm)
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # 以 . 開頭的暫存檔不會被當成預覽檔案掃描
+    suffix = os.path.splitext(name)[1]
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", suffix=suffix,
+                                     dir=directory)
+    os.close(fd)
+    try:
+        # mkstemp 建立的檔案僅限擁有者讀取，改為一般檔案的權限
+        os.chmod(temp_path, mode)
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+_default_flight: Optional[SingleFlight] = None
+_default_lock = threading.Lock()
+
+
+def get_default_flight() -> SingleFlight:
+    """取得行程共用的單次執行合併器"""
+    global _default_flight
+    with _default_lock:
+        if _default_flight is None:
+            _default_flight = SingleFlight()
+        return _default_flight
@@ -0,0 +1,289 @@
+"""
+語音合成快取模組
+以模型、提示和完整生成配置的雜湊值為鍵，將 PCM 資料儲存在磁碟上，
+支援容量與存活時間淘汰，並記錄命中/未命中次數
+"""
+
+import atexit
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+import single_flight
+
+# 預設快取設定（可由環境變數覆寫）
+DEFAULT_CACHE_DIR = ".tts_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+INDEX_FILENAME = "index.json"
+
+# 快取命中的存取時間最多累積多久才寫入索引（秒）
+ACCESS_FLUSH_SECONDS = 60.0
+
+
+def _config_to_dict(config: Any) -> Any:
+    """將 GenerateContentConfig（或字典）轉為可序列化的字典"""
+    if config is None:
+        return None
+    if hasattr(config, "model_dump"):
+        return config.model_dump(mode="json", exclude_none=True)
+    return config
+
+
+def make_cache_key(model: str, contents: Any, config: Any) -> str:
+    """計算合成請求的內容定址鍵
+
+    Args:
+        model: TTS 模型名稱
+        contents: 發送給 API 的提示內容
+        config: 生成配置
+
+    Returns:
+        SHA-256 十六進位字串
+    """
+    payload = {
+        "model": model,
+        "contents": contents,
+        "config": _config_to_dict(config),
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False,
+                           separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SynthesisCache:
+    """磁碟上的合成結果快取（LRU + 容量上限 + 存活時間）
+
+    網頁介面與命令列工具等多個行程可共用同一個快取目錄：
+    修改索引時在跨行程檔案鎖內與磁碟上的索引合併後再寫回，不會覆蓋其他行程的變更。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self._file_lock = single_flight.FileLock(self._index_path)
+        # 尚未寫入索引的最近存取時間
+        self._accessed: Dict[str, float] = {}
+        self._last_flush = time.time()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index: Dict[str, Dict[str, Any]] = {}
+        with self._file_lock:
+            self._index = self._load_index()
+            self._remove_orphans()
+            self._save_index()
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        """載入索引，並移除檔案已不存在的項目"""
+        return {
+            key: entry for key, entry in self._read_index().items()
+            if os.path.exists(self._entry_path(key))
+        }
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _remove_orphans(self) -> None:
+        """刪除不在索引中的 .pcm 檔案（例如被其他行程的舊版索引覆蓋掉的項目）"""
+        for name in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(name)
+            if ext == ".pcm" and not name.startswith(".") and key not in self._index:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _merge_index(self) -> None:
+        """以磁碟上的索引為準（包含其他行程的新增與刪除），再套用本行程的存取時間
+
+        呼叫端必須持有 self._lock 與 self._file_lock。
+        """
+        self._index = self._read_index()
+        for key, last_access in self._accessed.items():
+            entry = self._index.get(key)
+            if entry is not None and last_access > entry["last_access"]:
+                entry["last_access"] = last_access
+        self._accessed.clear()
+
+    def _save_index(self) -> None:
+        """以暫存檔加改名的方式寫入索引（呼叫端必須持有 self._file_lock）"""
+        with single_flight.atomic_write(self._index_path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._index, f)
+        self._last_flush = time.time()
+
+    @contextlib.contextmanager
+    def _update_index(self) -> Iterator[None]:
+        """在跨行程鎖內合併索引，區塊內修改後寫回（呼叫端必須持有 self._lock）"""
+        with self._file_lock:
+            self._merge_index()
+            yield
+            self._save_index()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pcm")
+
+    def _remove(self, key: str) -> None:
+        self._index.pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+        self.evictions += 1
+
+    def _evict(self) -> None:
+        """淘汰過期項目，再依最近存取時間淘汰直到符合容量上限"""
+        now = time.time()
+        for key, entry in list(self._index.items()):
+            if now - entry["created"] > self.max_age_seconds:
+                self._remove(key)
+
+        total = sum(entry["size"] for entry in self._index.values())
+        if total <= self.max_bytes:
+            return
+
+        for key in sorted(self._index,
+                          key=lambda k: self._index[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            total -= self._index[key]["size"]
+            self._remove(key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """讀取快取的 PCM 資料，未命中或已過期時返回 None"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None and os.path.exists(self._entry_path(key)):
+                # 其他行程寫入的項目：重新合併索引
+                with self._file_lock:
+                    self._merge_index()
+                entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if time.time() - entry["created"] > self.max_age_seconds:
+                with self._update_index():
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._entry_path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                with self._update_index():
+                    self._index.pop(key, None)
+                self.misses += 1
+                return None
+
+            now = time.time()
+            entry["last_access"] = now
+            self._accessed[key] = now
+            # 存取時間累積一段時間後才寫入，避免每次命中都重寫索引
+            if now - self._last_flush > ACCESS_FLUSH_SECONDS:
+                with self._update_index():
+                    pass
+            self.hits += 1
+            return data
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """取得快取項目的中繼資料（不影響命中統計）"""
+        with self._lock:
+            entry = self._index.get(key)
+            return dict(entry) if entry else None
+
+    def put(self, key: str, pcm_data: bytes,
+            mime_type: Optional[str] = None) -> None:
+        """寫入 PCM 資料並執行淘汰"""
+        if len(pcm_data) > self.max_bytes:
+            return
+
+        with self._lock, self._update_index():
+            with single_flight.atomic_write(self._entry_path(key)) as tmp_path:
+                with open(tmp_path, "wb") as f:
+                    f.write(pcm_data)
+
+            now = time.time()
+            self._index[key] = {
+                "size": len(pcm_data),
+                "created": now,
+                "last_access": now,
+                "mime_type": mime_type,
+            }
+            self._evict()
+
+    def flush(self) -> None:
+        """將尚未寫入的存取時間寫入索引"""
+        with self._lock:
+            if self._accessed:
+                with self._update_index():
+                    pass
+
+    def clear(self) -> None:
+        """清除所有快取項目"""
+        with self._lock, self._update_index():
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """取得快取統計資料"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": sum(e["size"] for e in self._index.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_default_cache: Optional[SynthesisCache] = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> SynthesisCache:
+    """取得行程共用的預設快取
+
+    可用環境變數調整：
+        GEMINI_TTS_CACHE_DIR: 快取目錄
+        GEMINI_TTS_CACHE_MAX_MB: 容量上限（MB）
+        GEMINI_TTS_CACHE_MAX_AGE_DAYS: 存活天數
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            max_mb = float(os.getenv("GEMINI_TTS_CACHE_MAX_MB",
+                                     DEFAULT_MAX_BYTES / (1024 * 1024)))
+            max_age_days = float(os.getenv(
+                "GEMINI_TTS_CACHE_MAX_AGE_DAYS",
+                DEFAULT_MAX_AGE_SECONDS / 86400
+            ))
+            _default_cache = SynthesisCache(
+                os.getenv("GEMINI_TTS_CACHE_DIR", DEFAULT_CACHE_DIR),
+                max_bytes=int(max_mb * 1024 * 1024),
+                max_age_seconds=max_age_days * 86400
+            )
+            # 結束前寫入尚未寫入的存取時間
+            atexit.register(_default_cache.flush)
+        return _default_cache
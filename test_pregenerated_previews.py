@@ -5,7 +5,8 @@
 """
 
 import os
-import wave
+import wav_writer
+import preview_index
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
@@ -21,11 +22,7 @@ TEST_LANGUAGES = ["zh-TW", "en-US"]
 def save_wave_file(filename: str, pcm_data: bytes, channels: int = 1,
                    rate: int = 24000, sample_width: int = 2):
     """儲存 PCM 資料為 WAV 檔案"""
-    with wave.open(filename, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(rate)
-        wf.writeframes(pcm_data)
+    wav_writer.write_wav_file(filename, pcm_data, channels, rate, sample_width)
 
 
 def generate_voice_preview(api_key: str, voice_name: str, language: str,
@@ -120,6 +117,10 @@ def main():
     print(f"生成失敗：{failed} 個檔案")
     print(f"預覽檔案儲存在：{os.path.abspath(preview_dir)}")
 
+    if generated:
+        packed = preview_index.rebuild_archive(preview_dir)
+        print(f"已重新打包預覽封裝檔（{packed} 個預覽）")
+
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,9 @@
+"""
+離線測試的共用設定
+測試只使用暫存目錄與本機的假客戶端，不需要 API 金鑰或網路連線
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+"""音訊後處理的測試"""
+
+import numpy as np
+
+import audio_postprocess
+
+RATE = 24000
+
+
+def _tone(seconds: float, silence: float) -> bytes:
+    """前後各帶 silence 秒靜音的正弦波 PCM"""
+    t = np.arange(int(RATE * seconds)) / RATE
+    tone = (np.sin(2 * np.pi * 440 * t) * 8000).astype("<i2")
+    pad = np.zeros(int(RATE * silence), dtype="<i2")
+    return np.concatenate([pad, tone, pad]).tobytes()
+
+
+def test_whole_clip_trims_both_edges():
+    config = audio_postprocess.PostProcessConfig(normalize="off", fade_ms=0)
+    pcm = _tone(1.0, 1.0)
+    out = audio_postprocess.process(pcm, RATE, config)
+    # 頭尾各保留 100 ms
+    assert len(out) // 2 == RATE + 2 * int(RATE * 0.1)
+
+
+def test_inner_chunk_keeps_pauses_and_is_not_faded():
+    config = audio_postprocess.PostProcessConfig(normalize="off", fade_ms=10)
+    pcm = _tone(1.0, 0.5)
+    out = audio_postprocess.process(pcm, RATE, config, head=False, tail=False)
+    assert out == pcm
+
+
+def test_first_chunk_trims_and_fades_only_the_head():
+    config = audio_postprocess.PostProcessConfig(normalize="off", fade_ms=10)
+    pcm = _tone(1.0, 0.5)
+    out = audio_postprocess.pcm_view(
+        audio_postprocess.process(pcm, RATE, config, head=True, tail=False)
+    )
+    # 開頭去除靜音並淡入，結尾的靜音原樣保留
+    assert len(out) == RATE + int(RATE * 0.1) + int(RATE * 0.5)
+    assert not out[-int(RATE * 0.5):].any()
+    # 淡入之後的內容與原始音訊相同（結尾沒有淡出）
+    fade = int(RATE * 0.01)
+    assert out[fade:].tobytes() == pcm[len(pcm) - (len(out) - fade) * 2:]
@@ -0,0 +1,74 @@
+"""batch_runner 模組的測試：以模擬後端執行批次，並從檢查點續傳"""
+
+import json
+
+import batch_runner
+import mock_backend
+import wav_writer
+
+MODEL = "gemini-2.5-flash-preview-tts"
+
+
+def _write_manifest(tmp_path, ids) -> str:
+    manifest = tmp_path / "manifest.jsonl"
+    with open(manifest, "w", encoding="utf-8") as f:
+        for job_id in ids:
+            f.write(json.dumps({
+                "id": job_id,
+                "text": f"第 {job_id} 段。",
+                "output": str(tmp_path / "out" / f"{job_id}.wav"),
+            }, ensure_ascii=False) + "\n")
+    return str(manifest)
+
+
+def test_resume_only_runs_unfinished_jobs(tmp_path):
+    manifest = _write_manifest(tmp_path, ["a", "b", "c"])
+    client = mock_backend.FakeGeminiClient()
+    saved = []
+
+    def failing_save(filename, pcm_data, rate):
+        if filename.endswith("b.wav"):
+            raise OSError("disk full")
+        saved.append(filename)
+        wav_writer.write_wav_file(filename, pcm_data, rate=rate)
+
+    stats = batch_runner.run_batch(client, manifest, failing_save, MODEL,
+                                   use_cache=False)
+    assert (stats["done"], stats["failed"], stats["skipped"]) == (2, 1, 0)
+
+    def save(filename, pcm_data, rate):
+        saved.append(filename)
+        wav_writer.write_wav_file(filename, pcm_data, rate=rate)
+
+    stats = batch_runner.run_batch(client, manifest, save, MODEL,
+                                   use_cache=False)
+    assert (stats["done"], stats["failed"], stats["skipped"]) == (1, 0, 2)
+    assert saved[-1].endswith("b.wav")
+    assert batch_runner.load_checkpoint(
+        batch_runner.default_checkpoint_path(manifest)
+    ) == {"a", "b", "c"}
+
+
+def test_postprocess_errors_are_job_failures(tmp_path):
+    manifest = _write_manifest(tmp_path, ["a", "b"])
+
+    def postprocess(pcm_data, rate):
+        if len(pcm_data) % 2:
+            return pcm_data
+        raise ValueError("bad audio")
+
+    stats = batch_runner.run_batch(
+        mock_backend.FakeGeminiClient(), manifest, wav_writer.write_wav_file,
+        MODEL, use_cache=False, postprocess=postprocess
+    )
+    assert (stats["done"], stats["failed"]) == (0, 2)
+    assert batch_runner.load_checkpoint(
+        batch_runner.default_checkpoint_path(manifest)
+    ) == set()
+
+
+def test_default_voice_is_used_for_entries_without_voice():
+    job = batch_runner.build_job({"id": "a", "text": "你好"}, MODEL,
+                                 default_voice="Puck")
+    voice = job.config.speech_config.voice_config.prebuilt_voice_config
+    assert voice.voice_name == "Puck"
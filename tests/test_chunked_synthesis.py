@@ -0,0 +1,66 @@
+"""長文本分段合成的測試"""
+
+import os
+
+import pytest
+
+import chunked_synthesis
+import mock_backend
+import rate_limiter
+import tts_synthesis
+
+MODEL = "gemini-2.5-flash-preview-tts"
+
+
+@pytest.fixture(autouse=True)
+def fast_limiter(monkeypatch):
+    """模擬後端沒有延遲，不需要依預設速率分散請求"""
+    monkeypatch.setattr(rate_limiter, "_default_limiter",
+                        rate_limiter.AdaptiveRateLimiter(rpm=6000, max_rpm=6000))
+
+
+def test_long_sentence_is_split_between_words():
+    sentence = "the quick brown fox jumps over the lazy dog " * 5
+    pieces = chunked_synthesis._split_long_sentence(sentence.strip(), 30)
+    assert all(len(piece) <= 30 for piece in pieces)
+    assert " ".join(pieces) == sentence.strip()
+    words = set(sentence.split())
+    assert all(set(piece.split()) <= words for piece in pieces)
+
+
+def test_sentence_without_break_points_is_cut_hard():
+    pieces = chunked_synthesis._split_long_sentence("字" * 25, 10)
+    assert pieces == ["字" * 10, "字" * 10, "字" * 5]
+
+
+def test_failed_run_leaves_no_partial_output(tmp_path):
+    client = mock_backend.FakeGeminiClient()
+    config = tts_synthesis.build_single_speaker_config("Kore")
+    output = tmp_path / "out.wav"
+
+    def postprocess(pcm, head=True, tail=True):
+        if tail:
+            raise RuntimeError("postprocess failed")
+        return pcm
+
+    with pytest.raises(RuntimeError):
+        chunked_synthesis.synthesize_chunked_to_file(
+            client, MODEL, "第一句。第二句。第三句。", config, str(output),
+            max_chars=4, use_cache=False, postprocess=postprocess
+        )
+    assert os.listdir(tmp_path) == []
+
+
+def test_successful_run_replaces_output(tmp_path):
+    client = mock_backend.FakeGeminiClient()
+    config = tts_synthesis.build_single_speaker_config("Kore")
+    output = tmp_path / "out.wav"
+    output.write_bytes(b"old")
+
+    stats = chunked_synthesis.synthesize_chunked_to_file(
+        client, MODEL, "第一句。第二句。第三句。", config, str(output),
+        max_chars=4, use_cache=False
+    )
+    assert os.listdir(tmp_path) == ["out.wav"]
+    assert output.read_bytes()[:4] == b"RIFF"
+    assert stats.audio_seconds > 0
@@ -0,0 +1,153 @@
+"""preview_index 模組的測試：啟動時建立的索引、封裝檔、查找與預覽生成"""
+
+import os
+import threading
+
+import preview_index
+import wav_writer
+
+PCM = b"\x00\x01" * 2400
+
+
+def _index(tmp_path) -> preview_index.PreviewIndex:
+    return preview_index.PreviewIndex(str(tmp_path / "previews"),
+                                      str(tmp_path / "cache"))
+
+
+def _write_preview(directory: str, voice: str, language: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, preview_index.preview_filename(voice, language))
+    wav_writer.write_wav_file(path, PCM)
+    return path
+
+
+def test_scan_indexes_preview_files(tmp_path):
+    index = _index(tmp_path)
+    path = _write_preview(index.preview_dir, "Kore", "zh-TW")
+    _write_preview(index.cache_dir, "Puck", "zh-TW")
+
+    assert index.scan() == 2
+    entry = index.get("Kore", "zh-TW")
+    assert entry.path == path and entry.pregenerated
+    assert entry.duration == 0.1
+    assert not index.get("Puck", "zh-TW").pregenerated
+    assert index.missing(["Kore", "Puck", "Charon"], "zh-TW") == ["Charon"]
+
+
+def test_pregenerated_preview_wins_over_generated(tmp_path):
+    index = _index(tmp_path)
+    _write_preview(index.cache_dir, "Kore", "en-US")
+    path = _write_preview(index.preview_dir, "Kore", "en-US")
+    index.scan()
+    assert index.get("Kore", "en-US").path == path
+
+
+def test_lookups_do_not_touch_the_filesystem(tmp_path):
+    index = _index(tmp_path)
+    path = _write_preview(index.preview_dir, "Kore", "ja-JP")
+    index.scan()
+    os.remove(path)
+    # 查找只使用記憶體中的索引
+    assert index.get("Kore", "ja-JP") is not None
+    assert index.stats()["lookups"] == 1
+
+
+def test_archive_entries_are_read_from_the_mapping(tmp_path):
+    index = _index(tmp_path)
+    _write_preview(index.preview_dir, "Kore", "zh-TW")
+    assert preview_index.rebuild_archive(index.preview_dir,
+                                         index.archive_path) == 1
+    index.scan()
+
+    entry = index.get("Kore", "zh-TW")
+    assert entry.path == index.archive_path
+    assert entry.offset is not None
+    assert bytes(index.read("Kore", "zh-TW")[:4]) == b"RIFF"
+
+
+def test_generate_preview_writes_and_indexes_it(tmp_path):
+    index = _index(tmp_path)
+    entry = preview_index.generate_preview(
+        index, "Kore", "zh-TW", lambda: PCM,
+        wav_writer.write_wav_file, pregenerated=True
+    )
+    assert entry is not None and entry.pregenerated
+    assert os.path.exists(entry.path)
+    assert index.get("Kore", "zh-TW") == entry
+    assert index.missing(["Kore", "Puck"], "zh-TW") == ["Puck"]
+
+
+def test_concurrent_requests_synthesize_once(tmp_path):
+    index = _index(tmp_path)
+    release = threading.Event()
+    calls = []
+    entries = []
+
+    def synthesize():
+        calls.append(1)
+        release.wait(5)
+        return PCM
+
+    def request():
+        entries.append(preview_index.generate_preview(
+            index, "Kore", "en-US", synthesize,
+            wav_writer.write_wav_file
+        ))
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({entry.path for entry in entries}) == 1
+
+
+def test_existing_file_is_reused(tmp_path):
+    index = _index(tmp_path)
+    path = _write_preview(index.preview_dir, "Kore", "ja-JP")
+
+    def synthesize():
+        raise AssertionError("已存在的預覽不應重新生成")
+
+    entry = preview_index.generate_preview(
+        index, "Kore", "ja-JP", synthesize,
+        wav_writer.write_wav_file
+    )
+    assert entry.path == path
+
+
+def test_failed_synthesis_leaves_no_file(tmp_path):
+    index = _index(tmp_path)
+    entry = preview_index.generate_preview(
+        index, "Kore", "ko-KR", lambda: None,
+        wav_writer.write_wav_file
+    )
+    assert entry is None
+    assert index.get("Kore", "ko-KR") is None
+    # 只留下鎖檔，沒有預覽檔案或暫存檔
+    assert [name for name in os.listdir(index.preview_dir)
+            if not name.endswith(".lock")] == []
+
+
+def test_click_and_background_generation_share_one_preview(tmp_path):
+    index = _index(tmp_path)
+    calls = []
+
+    def synthesize():
+        calls.append(1)
+        return PCM
+
+    clicked = preview_index.generate_preview(
+        index, "Puck", "zh-TW", synthesize, wav_writer.write_wav_file
+    )
+    # 背景生成服務（另一個行程也一樣）找到同一個檔案，不再呼叫 API
+    background = preview_index.generate_preview(
+        _index(tmp_path), "Puck", "zh-TW", synthesize,
+        wav_writer.write_wav_file, pregenerated=True
+    )
+    assert len(calls) == 1
+    assert background.path == clicked.path
+    assert os.path.dirname(clicked.path) == index.preview_dir
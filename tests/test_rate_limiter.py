@@ -0,0 +1,49 @@
+"""rate_limiter 模組的測試：AIMD 調整與並行上限"""
+
+from google.genai import errors
+
+import rate_limiter
+
+
+def _rate_limit_error() -> errors.APIError:
+    return errors.ClientError(429, {"error": {
+        "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "quota"}})
+
+
+def test_burst_of_rate_limits_decreases_once():
+    limiter = rate_limiter.AdaptiveRateLimiter(rpm=6000, max_rpm=6000,
+                                               max_in_flight=8)
+    epochs = [limiter.acquire() for _ in range(8)]
+    for epoch in epochs:
+        limiter.release(_rate_limit_error(), epoch)
+
+    assert limiter.rpm == 3000
+    assert limiter.stats()["throttled"] == 8
+
+
+def test_rate_limit_after_decrease_decreases_again():
+    limiter = rate_limiter.AdaptiveRateLimiter(rpm=6000, max_rpm=6000)
+    limiter.release(_rate_limit_error(), limiter.acquire())
+    # 降速後才取得名額的請求再遇到 429 時繼續降速
+    limiter.release(_rate_limit_error(), limiter.acquire())
+    assert limiter.rpm == 1500
+
+
+def test_successes_increase_by_one_step_per_round():
+    limiter = rate_limiter.AdaptiveRateLimiter(rpm=6000, max_rpm=12000,
+                                               max_in_flight=4,
+                                               increase_step=2.0)
+    for _ in range(4):
+        limiter.release(epoch=limiter.acquire())
+    assert limiter.rpm == 6002
+
+
+def test_in_flight_limit():
+    limiter = rate_limiter.AdaptiveRateLimiter(rpm=6000, max_rpm=6000,
+                                               max_in_flight=2)
+    limiter.acquire()
+    limiter.acquire()
+    wait, _ = limiter._try_acquire()
+    assert wait == rate_limiter._SLOT_POLL_INTERVAL
+    limiter.release()
+    assert limiter.stats()["in_flight"] == 1
@@ -0,0 +1,136 @@
+"""retry_policy 模組的測試：重試判斷與斷路器狀態轉換"""
+
+import pytest
+from google.genai import errors
+
+import retry_policy
+import tts_synthesis
+
+
+def _server_error(code: int = 503) -> errors.APIError:
+    return errors.ServerError(code, {"error": {
+        "code": code, "status": "UNAVAILABLE", "message": "overloaded"}})
+
+
+def _rate_limit_error() -> errors.APIError:
+    return errors.ClientError(429, {"error": {
+        "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "quota"}})
+
+
+def test_breaker_opens_after_consecutive_server_errors():
+    breaker = retry_policy.CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure(_server_error())
+    assert breaker.state == breaker.CLOSED
+
+    breaker.before_call()
+    breaker.record_failure(_server_error())
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(retry_policy.CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()["opens"] == 1
+
+
+def test_breaker_counts_rate_limits():
+    breaker = retry_policy.CircuitBreaker(failure_threshold=2)
+    breaker.record_failure(_rate_limit_error())
+    breaker.record_failure(_rate_limit_error())
+    assert breaker.state == breaker.OPEN
+
+
+def test_breaker_ignores_missing_audio():
+    breaker = retry_policy.CircuitBreaker(failure_threshold=2)
+    for _ in range(5):
+        breaker.before_call()
+        breaker.record_failure(tts_synthesis.NoAudioError("沒有音訊"))
+    assert breaker.state == breaker.CLOSED
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = retry_policy.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure(_server_error())
+    assert breaker.state == breaker.OPEN
+
+    # 冷卻結束後放行一個試探請求，失敗時重新開啟
+    breaker.before_call()
+    assert breaker.state == breaker.HALF_OPEN
+    breaker.record_failure(_server_error())
+    assert breaker.state == breaker.OPEN
+
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+
+
+def test_policy_retries_server_errors_until_success():
+    breaker = retry_policy.CircuitBreaker(failure_threshold=10)
+    policy = retry_policy.RetryPolicy(max_attempts=4, base_delay=0,
+                                      breaker=breaker)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _server_error()
+        return b"audio"
+
+    assert policy.call(flaky) == b"audio"
+    assert len(attempts) == 3
+    assert policy.stats()["retries"] == 2
+    assert breaker.state == breaker.CLOSED
+
+
+def test_policy_does_not_retry_missing_audio():
+    breaker = retry_policy.CircuitBreaker(failure_threshold=1)
+    policy = retry_policy.RetryPolicy(max_attempts=4, base_delay=0,
+                                      breaker=breaker)
+    attempts = []
+
+    def no_audio():
+        attempts.append(1)
+        raise tts_synthesis.NoAudioError("沒有音訊")
+
+    with pytest.raises(tts_synthesis.NoAudioError):
+        policy.call(no_audio)
+    assert len(attempts) == 1
+    assert breaker.state == breaker.CLOSED
+
+
+def test_retried_request_counts_as_one_breaker_failure():
+    breaker = retry_policy.CircuitBreaker(failure_threshold=2)
+    policy = retry_policy.RetryPolicy(max_attempts=3, base_delay=0,
+                                      breaker=breaker)
+
+    def failing():
+        raise _server_error()
+
+    with pytest.raises(Exception):
+        policy.call(failing)
+    assert policy.stats()["attempts"] == 3
+    assert breaker.state == breaker.CLOSED
+    assert breaker.stats()["consecutive_failures"] == 1
+
+    with pytest.raises(Exception):
+        policy.call(failing)
+    assert breaker.state == breaker.OPEN
+
+
+def test_half_open_probe_can_retry():
+    breaker = retry_policy.CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure(_server_error())
+    # 冷卻時間已過，下一個請求成為試探請求
+    breaker._opened_at -= 60
+    policy = retry_policy.RetryPolicy(max_attempts=3, base_delay=0,
+                                      breaker=breaker)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise _server_error()
+        return b"audio"
+
+    assert policy.call(flaky) == b"audio"
+    assert breaker.state == breaker.CLOSED
@@ -0,0 +1,165 @@
+"""single_flight 模組的測試：呼叫合併、檔案鎖與原子寫入"""
+
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+import single_flight
+
+THREADS = 8
+
+
+def _wait_for_calls(flight: single_flight.SingleFlight, count: int) -> None:
+    deadline = time.monotonic() + 5
+    while flight.stats()["calls"] < count:
+        assert time.monotonic() < deadline, "等待者沒有全部加入"
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_execute_once():
+    flight = single_flight.SingleFlight()
+    release = threading.Event()
+    executions = []
+    results = []
+
+    def work():
+        executions.append(1)
+        release.wait(5)
+        return "audio"
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", work)))
+               for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    _wait_for_calls(flight, THREADS)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(executions) == 1
+    assert results == ["audio"] * THREADS
+    assert flight.stats() == {"calls": THREADS, "executions": 1,
+                              "shared": THREADS - 1, "in_flight": 0}
+
+
+def test_leader_error_reaches_every_waiter():
+    flight = single_flight.SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def work():
+        release.wait(5)
+        raise ValueError("backend failed")
+
+    def call():
+        try:
+            flight.do("k", work)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    _wait_for_calls(flight, THREADS)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == THREADS
+    # 失敗不會被快取，下一次呼叫重新執行
+    assert flight.do("k", lambda: "retry") == "retry"
+
+
+def test_async_calls_execute_once():
+    flight = single_flight.SingleFlight()
+    executions = []
+
+    async def work():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        return "audio"
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("k", work)
+                                      for _ in range(THREADS)))
+
+    assert asyncio.run(main()) == ["audio"] * THREADS
+    assert len(executions) == 1
+
+
+def test_async_leader_error_reaches_every_waiter():
+    flight = single_flight.SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("backend failed")
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("k", work)
+                                      for _ in range(THREADS)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "preview.wav")
+    holder = single_flight.FileLock(path)
+    holder.acquire()
+    try:
+        assert not single_flight.FileLock(path).acquire(blocking=False)
+    finally:
+        holder.release()
+
+    other = single_flight.FileLock(path)
+    assert other.acquire(blocking=False)
+    other.release()
+
+
+def test_file_lock_serializes_threads(tmp_path):
+    path = str(tmp_path / "counter")
+    inside = []
+    overlaps = []
+
+    def work():
+        with single_flight.FileLock(path):
+            if inside:
+                overlaps.append(1)
+            inside.append(1)
+            time.sleep(0.005)
+            inside.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not overlaps
+
+
+def test_atomic_write_replaces_target(tmp_path):
+    path = tmp_path / "out.wav"
+    path.write_bytes(b"old")
+    with single_flight.atomic_write(str(path)) as temp_path:
+        assert temp_path != str(path)
+        with open(temp_path, "wb") as f:
+            f.write(b"new")
+        assert path.read_bytes() == b"old"
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["out.wav"]
+
+
+def test_atomic_write_keeps_target_on_error(tmp_path):
+    path = tmp_path / "out.wav"
+    path.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with single_flight.atomic_write(str(path)) as temp_path:
+            with open(temp_path, "wb") as f:
+                f.write(b"partial")
+            raise RuntimeError("encoder crashed")
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["out.wav"]
@@ -0,0 +1,76 @@
+"""synthesis_cache 模組的測試：淘汰、跨行程合併與孤立檔案清除"""
+
+import json
+import os
+import time
+
+import synthesis_cache
+
+
+def _pcm_files(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(".pcm"))
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = synthesis_cache.SynthesisCache(str(tmp_path))
+    assert cache.get("a") is None
+    cache.put("a", b"\x01\x02", "audio/L16;codec=pcm;rate=24000")
+    assert cache.get("a") == b"\x01\x02"
+    assert cache.get_entry("a")["mime_type"] == "audio/L16;codec=pcm;rate=24000"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = synthesis_cache.SynthesisCache(str(tmp_path), max_bytes=3000)
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 1000)
+        time.sleep(0.01)
+    cache.get("a")
+    cache.put("d", b"x" * 1000)
+
+    assert cache.get_entry("b") is None
+    assert _pcm_files(tmp_path) == ["a.pcm", "c.pcm", "d.pcm"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = synthesis_cache.SynthesisCache(str(tmp_path), max_age_seconds=0)
+    cache.put("a", b"x")
+    time.sleep(0.01)
+    assert cache.get("a") is None
+    assert _pcm_files(tmp_path) == []
+
+
+def test_processes_sharing_a_directory_keep_each_others_entries(tmp_path):
+    first = synthesis_cache.SynthesisCache(str(tmp_path))
+    second = synthesis_cache.SynthesisCache(str(tmp_path))
+    first.put("a", b"1")
+    second.put("b", b"2")
+
+    with open(tmp_path / synthesis_cache.INDEX_FILENAME, encoding="utf-8") as f:
+        assert sorted(json.load(f)) == ["a", "b"]
+    # 其他行程寫入的項目也能命中
+    assert first.get("b") == b"2"
+
+
+def test_orphaned_files_are_removed_on_load(tmp_path):
+    cache = synthesis_cache.SynthesisCache(str(tmp_path))
+    cache.put("a", b"1")
+    (tmp_path / "orphan.pcm").write_bytes(b"0" * 100)
+
+    reloaded = synthesis_cache.SynthesisCache(str(tmp_path))
+    assert _pcm_files(tmp_path) == ["a.pcm"]
+    assert reloaded.get("a") == b"1"
+
+
+def test_last_access_is_persisted(tmp_path):
+    cache = synthesis_cache.SynthesisCache(str(tmp_path))
+    cache.put("a", b"1")
+    created = cache.get_entry("a")["created"]
+    time.sleep(0.01)
+    cache.get("a")
+    cache.flush()
+
+    with open(tmp_path / synthesis_cache.INDEX_FILENAME, encoding="utf-8") as f:
+        assert json.load(f)["a"]["last_access"] > created
@@ -0,0 +1,20 @@
+"""合成效能指標的測試"""
+
+import tts_metrics
+
+
+def test_audio_seconds_use_the_reported_sample_rate():
+    registry = tts_metrics.MetricsRegistry()
+    registry.record("model-a", "Kore", "ok", 0.5, pcm_bytes=48000 * 2,
+                    sample_rate=48000)
+    registry.record("model-b", "Kore", "ok", 0.5, pcm_bytes=24000 * 2,
+                    sample_rate=24000)
+    assert registry.summary()["audio_seconds"] == 2.0
+
+
+def test_unknown_sample_rate_is_not_counted_as_audio():
+    registry = tts_metrics.MetricsRegistry()
+    registry.record("model-a", "Kore", "ok", 0.5, pcm_bytes=4800)
+    summary = registry.summary()
+    assert summary["pcm_bytes"] == 4800
+    assert summary["audio_seconds"] == 0.0
@@ -0,0 +1,310 @@
+"""
+合成效能指標模組
+記錄每次合成請求的延遲分佈、輸入字元數、輸出 PCM 位元組數、音訊長度、
+模型、語音與結果，並可輸出為 Prometheus 文字格式（檔案或 HTTP 端點）
+或以 Python API 取得摘要，作為容量規劃的依據
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# 延遲分佈的上界（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# 16-bit PCM 每個樣本的位元組數
+PCM_SAMPLE_WIDTH = 2
+
+# 寫入指標檔案的最短間隔（秒）
+_FILE_WRITE_INTERVAL = 5.0
+
+
+class Histogram:
+    """累積分佈的直方圖（Prometheus histogram 語意）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """以所在區間的上界估計分位數"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def cumulative_counts(self) -> List[int]:
+        result = []
+        cumulative = 0
+        for count in self.counts:
+            cumulative += count
+            result.append(cumulative)
+        return result
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...],
+            extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class MetricsRegistry:
+    """合成指標的集中記錄處"""
+
+    _SERIES_LABELS = ("model", "voice", "outcome")
+    _LATENCY_LABELS = ("model", "outcome")
+
+    def __init__(self, metrics_file: Optional[str] = None):
+        """
+        Args:
+            metrics_file: 定期寫入 Prometheus 文字格式的檔案路徑（None 表示不寫檔）
+        """
+        self.metrics_file = metrics_file
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._ttfa: Dict[Tuple[str], Histogram] = {}
+        self._last_file_write = 0.0
+
+    def record(self, model: str, voice: str, outcome: str, latency: float,
+               input_chars: int = 0, pcm_bytes: int = 0,
+               sample_rate: int = 0,
+               time_to_first_audio: Optional[float] = None) -> None:
+        """記錄一次合成請求
+
+        Args:
+            model: 模型名稱
+            voice: 語音名稱（多講者時以逗號連接）
+            outcome: 結果（ok、cached、shared、no_audio、rate_limited、timeout、
+                     circuit_open、cancelled、error）
+            latency: 端對端耗時（秒，含重試與等待）
+            input_chars: 輸入文字的字元數
+            pcm_bytes: 輸出 PCM 位元組數
+            sample_rate: 輸出音訊的取樣率，用於由 PCM 位元組數計算音訊長度
+                         （0 表示未知，不計入音訊長度）
+            time_to_first_audio: 串流合成的首段音訊延遲（秒）
+        """
+        with self._lock:
+            series = self._series.setdefault((model, voice, outcome), {
+                "requests": 0, "input_chars": 0, "pcm_bytes": 0,
+                "audio_seconds": 0.0, "latency_seconds": 0.0,
+            })
+            series["requests"] += 1
+            series["input_chars"] += input_chars
+            series["pcm_bytes"] += pcm_bytes
+            if sample_rate:
+                series["audio_seconds"] += pcm_bytes / (sample_rate * PCM_SAMPLE_WIDTH)
+            series["latency_seconds"] += latency
+
+            self._latency.setdefault((model, outcome), Histogram()).observe(latency)
+            if time_to_first_audio is not None:
+                self._ttfa.setdefault((model,), Histogram()).observe(
+                    time_to_first_audio
+                )
+
+        if self.metrics_file:
+            now = time.monotonic()
+            if now - self._last_file_write >= _FILE_WRITE_INTERVAL:
+                self._last_file_write = now
+                self.write_file(self.metrics_file)
+
+    def summary(self) -> Dict[str, Any]:
+        """取得指標摘要（Python API）
+
+        Returns:
+            包含總請求數、各結果的次數、延遲平均與分位數、
+            輸入字元數、音訊秒數與即時倍率的字典
+        """
+        with self._lock:
+            totals = {"requests": 0, "input_chars": 0, "pcm_bytes": 0,
+                      "audio_seconds": 0.0, "latency_seconds": 0.0}
+            outcomes: Dict[str, int] = {}
+            by_model: Dict[str, Dict[str, float]] = {}
+            api_audio = api_latency = 0.0
+            for (model, _voice, outcome), series in self._series.items():
+                for name in totals:
+                    totals[name] += series[name]
+                if outcome == "ok":
+                    api_audio += series["audio_seconds"]
+                    api_latency += series["latency_seconds"]
+                outcomes[outcome] = outcomes.get(outcome, 0) + series["requests"]
+                model_totals = by_model.setdefault(
+                    model, {"requests": 0, "audio_seconds": 0.0}
+                )
+                model_totals["requests"] += series["requests"]
+                model_totals["audio_seconds"] += series["audio_seconds"]
+
+            merged = Histogram()
+            for (model, outcome), histogram in self._latency.items():
+                if outcome == "ok":
+                    merged.counts = [a + b for a, b in
+                                     zip(merged.counts, histogram.counts)]
+                    merged.total += histogram.total
+                    merged.count += histogram.count
+            ttfa = Histogram()
+            for histogram in self._ttfa.values():
+                ttfa.counts = [a + b for a, b in zip(ttfa.counts, histogram.counts)]
+                ttfa.total += histogram.total
+                ttfa.count += histogram.count
+
+        uptime = time.time() - self.started_at
+        return {
+            "requests": totals["requests"],
+            "outcomes": outcomes,
+            "input_chars": totals["input_chars"],
+            "pcm_bytes": totals["pcm_bytes"],
+            "audio_seconds": round(totals["audio_seconds"], 3),
+            "latency_mean_seconds": (round(merged.total / merged.count, 3)
+                                     if merged.count else None),
+            "latency_p50_seconds": merged.quantile(0.5),
+            "latency_p95_seconds": merged.quantile(0.95),
+            "time_to_first_audio_mean_seconds": (round(ttfa.total / ttfa.count, 3)
+                                                 if ttfa.count else None),
+            # API 請求每秒耗時產生的音訊秒數（不含快取命中與並行效果）
+            "realtime_factor": (round(api_audio / api_latency, 2)
+                                if api_latency else None),
+            # 行程啟動以來每秒實際時間產生的音訊秒數（含並行效果）
+            "throughput_audio_seconds_per_second": (
+                round(totals["audio_seconds"] / uptime, 3) if uptime else None
+            ),
+            "by_model": by_model,
+        }
+
+    def render_prometheus(self) -> str:
+        """輸出 Prometheus 文字格式"""
+        lines = []
+        with self._lock:
+            counters = [
+                ("gemini_tts_requests_total", "合成請求數", "requests"),
+                ("gemini_tts_input_chars_total", "輸入字元數", "input_chars"),
+                ("gemini_tts_pcm_bytes_total", "輸出 PCM 位元組數", "pcm_bytes"),
+                ("gemini_tts_audio_seconds_total", "輸出音訊秒數", "audio_seconds"),
+            ]
+            for name, help_text, field in counters:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for key, series in sorted(self._series.items()):
+                    lines.append(f"{name}{_labels(self._SERIES_LABELS, key)} "
+                                 f"{series[field]}")
+
+            histograms = [
+                ("gemini_tts_request_latency_seconds", "端對端合成延遲（秒）",
+                 self._LATENCY_LABELS, self._latency),
+                ("gemini_tts_time_to_first_audio_seconds", "串流首段音訊延遲（秒）",
+                 ("model",), self._ttfa),
+            ]
+            for name, help_text, label_names, data in histograms:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(data.items()):
+                    bounds = list(histogram.buckets) + [float("inf")]
+                    for bound, count in zip(bounds, histogram.cumulative_counts()):
+                        le = f'le="{_format_bound(bound)}"'
+                        lines.append(f"{name}_bucket{_labels(label_names, key, le)} "
+                                     f"{count}")
+                    lines.append(f"{name}_sum{_labels(label_names, key)} "
+                                 f"{histogram.total}")
+                    lines.append(f"{name}_count{_labels(label_names, key)} "
+                                 f"{histogram.count}")
+
+        lines.append("# HELP gemini_tts_start_time_seconds 行程啟動時間")
+        lines.append("# TYPE gemini_tts_start_time_seconds gauge")
+        lines.append(f"gemini_tts_start_time_seconds {self.started_at}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path: str) -> None:
+        """以原子方式寫入 Prometheus 文字格式檔案（可供 node_exporter textfile 收集）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(temp_path, path)
+
+    def flush(self) -> None:
+        """立即寫入指標檔案（未設定 metrics_file 時不做任何事）"""
+        if self.metrics_file:
+            self.write_file(self.metrics_file)
+
+    def start_http_server(self, port: int,
+                          host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """在背景執行緒啟動 /metrics 端點"""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="tts-metrics",
+                         daemon=True).start()
+        return server
+
+
+_default_registry: Optional[MetricsRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_default_registry() -> MetricsRegistry:
+    """取得行程共用的指標記錄處
+
+    可用環境變數設定輸出方式：
+        GEMINI_TTS_METRICS_FILE: 定期寫入 Prometheus 文字格式的檔案路徑
+        GEMINI_TTS_METRICS_PORT: 在此連接埠提供 /metrics 端點
+    """
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = MetricsRegistry(
+                metrics_file=os.getenv("GEMINI_TTS_METRICS_FILE") or None
+            )
+            port = os.getenv("GEMINI_TTS_METRICS_PORT")
+            if port:
+                try:
+                    _default_registry.start_http_server(int(port))
+                except OSError as e:
+                    print(f"無法啟動指標端點（連接埠 {port}）：{e}")
+        return _default_registry
@@ -0,0 +1,448 @@
+"""
+語音合成核心模組
+統一呼叫 client.models.generate_content 並取出音訊資料，
+所有合成路徑（網頁介面、命令列、預覽生成）都經由這裡，
+並共用合成快取、速率限制、重試策略與效能指標；
+同時進行的相同請求合併為一次 API 請求（single_flight）
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.genai import types
+
+import rate_limiter
+import retry_policy
+import single_flight
+import synthesis_cache
+import tts_metrics
+
+
+# API 未標示取樣率時的預設值（Gemini TTS 輸出 24kHz 16-bit 單聲道 PCM）
+DEFAULT_SAMPLE_RATE = 24000
+
+# 各模型最近一次回應的音訊 MIME 類型（例如 audio/L16;codec=pcm;rate=24000）
+_output_formats: Dict[str, str] = {}
+
+
+class NoAudioError(RuntimeError):
+    """API 回應中沒有音訊資料
+
+    通常是講者名稱不符或文本格式不正確所致，重送相同的請求會得到相同的結果，
+    因此不重試，也不計入斷路器
+    """
+
+
+def extract_audio_part(response: Any) -> Optional[Any]:
+    """從 generate_content 回應中取出含 inline_data 的部分"""
+    if (response and response.candidates and
+            response.candidates[0].content and
+            response.candidates[0].content.parts):
+        part = response.candidates[0].content.parts[0]
+        if part.inline_data is not None and part.inline_data.data:
+            return part
+    return None
+
+
+def extract_audio(response: Any) -> Optional[bytes]:
+    """從 generate_content 回應中取出音訊資料
+
+    Returns:
+        音訊資料的 bytes，回應無效時返回 None
+    """
+    part = extract_audio_part(response)
+    return part.inline_data.data if part is not None else None
+
+
+def parse_sample_rate(mime_type: Optional[str],
+                      default: int = DEFAULT_SAMPLE_RATE) -> int:
+    """從 MIME 類型（例如 audio/L16;codec=pcm;rate=24000）取出取樣率"""
+    for param in (mime_type or "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "rate" and value.strip().isdigit():
+            return int(value)
+    return default
+
+
+def _remember_format(model: str, mime_type: Optional[str]) -> None:
+    if mime_type:
+        _output_formats[model] = mime_type
+
+
+def output_sample_rate(model: str) -> int:
+    """模型輸出音訊的取樣率
+
+    依最近一次回應（或快取項目）的 inline_data.mime_type 判斷，
+    尚未收到該模型的音訊時返回 DEFAULT_SAMPLE_RATE
+    """
+    return parse_sample_rate(_output_formats.get(model))
+
+
+def build_single_speaker_config(voice_name: str) -> types.GenerateContentConfig:
+    """建立單一講者的生成配置"""
+    return types.GenerateContentConfig(
+        response_modalities=["AUDIO"],
+        speech_config=types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                    voice_name=voice_name
+                )
+            )
+        )
+    )
+
+
+def build_multi_speaker_config(
+    speakers: List[Dict[str, str]]
+) -> types.GenerateContentConfig:
+    """建立多講者的生成配置
+
+    Args:
+        speakers: [{"name": 講者名稱, "voice": 語音名稱}, ...]
+    """
+    speaker_voice_configs = [
+        types.SpeakerVoiceConfig(
+            speaker=speaker["name"],
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                    voice_name=speaker["voice"]
+                )
+            )
+        )
+        for speaker in speakers
+    ]
+    return types.GenerateContentConfig(
+        response_modalities=["AUDIO"],
+        speech_config=types.SpeechConfig(
+            multi_speaker_voice_config=types.MultiSpeakerVoiceConfig(
+                speaker_voice_configs=speaker_voice_configs
+            )
+        )
+    )
+
+
+def config_voice_name(config: Any) -> str:
+    """取得生成配置中的語音名稱（多講者時以逗號連接）"""
+    speech = getattr(config, "speech_config", None)
+    if speech is None:
+        return ""
+    if speech.voice_config is not None:
+        return speech.voice_config.prebuilt_voice_config.voice_name or ""
+    if speech.multi_speaker_voice_config is not None:
+        return ",".join(
+            s.voice_config.prebuilt_voice_config.voice_name
+            for s in speech.multi_speaker_voice_config.speaker_voice_configs
+        )
+    return ""
+
+
+def _outcome_of(error: Optional[BaseException]) -> str:
+    """將合成結果歸類為指標的 outcome 標籤"""
+    if error is None:
+        return "ok"
+    if isinstance(error, NoAudioError):
+        return "no_audio"
+    if isinstance(error, retry_policy.CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if rate_limiter.is_rate_limit_error(error):
+        return "rate_limited"
+    return "error"
+
+
+def _record_metrics(model: str, contents: Any, config: Any, start_time: float,
+                    pcm_bytes: int = 0,
+                    error: Optional[BaseException] = None,
+                    cached: bool = False,
+                    shared: bool = False,
+                    time_to_first_audio: Optional[float] = None) -> None:
+    if cached:
+        outcome = "cached"
+    elif shared and error is None:
+        outcome = "shared"
+    else:
+        outcome = _outcome_of(error)
+    tts_metrics.get_default_registry().record(
+        model=model,
+        voice=config_voice_name(config),
+        outcome=outcome,
+        latency=time.perf_counter() - start_time,
+        input_chars=len(contents) if isinstance(contents, str) else 0,
+        pcm_bytes=pcm_bytes,
+        # 記錄時已收到音訊（或快取項目），取樣率依回應的 MIME 類型判斷
+        sample_rate=output_sample_rate(model),
+        time_to_first_audio=time_to_first_audio
+    )
+
+
+def _cache_lookup(model: str, contents: Any, config: Any,
+                  use_cache: bool) -> Tuple[Optional[str], Optional[bytes]]:
+    """查詢合成快取，返回 (快取鍵, 快取資料)"""
+    if not use_cache:
+        return None, None
+    key = synthesis_cache.make_cache_key(model, contents, config)
+    cache = synthesis_cache.get_default_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        entry = cache.get_entry(key)
+        _remember_format(model, entry and entry.get("mime_type"))
+    return key, cached
+
+
+def _recheck_cache(key: Optional[str]) -> Optional[bytes]:
+    """取得合併執行權後再查一次快取
+
+    前一個相同請求可能在本次查詢快取之後、取得執行權之前剛好完成並寫入快取。
+    先以不影響統計的 get_entry 確認，避免重複計入未命中。
+    """
+    if key is None:
+        return None
+    cache = synthesis_cache.get_default_cache()
+    if cache.get_entry(key) is None:
+        return None
+    return cache.get(key)
+
+
+def _audio_from_response(response: Any, model: str,
+                         cache_key: Optional[str]) -> bytes:
+    """取出回應中的音訊資料並記錄音訊格式，在需要時寫入快取"""
+    part = extract_audio_part(response)
+    if part is None:
+        raise NoAudioError("API 回應中沒有音訊資料")
+
+    audio_data = part.inline_data.data
+    _remember_format(model, part.inline_data.mime_type)
+    if cache_key is not None:
+        synthesis_cache.get_default_cache().put(
+            cache_key, audio_data, part.inline_data.mime_type
+        )
+    return audio_data
+
+
+def synthesize(client: Any, model: str, contents: Any, config: Any,
+               use_cache: bool = True) -> bytes:
+    """合成語音並返回 PCM 資料
+
+    暫時性錯誤會依重試策略重試；後端持續故障時斷路器會直接拒絕請求。
+    使用合成快取時，同時進行的相同請求只發出一次 API 請求，其餘呼叫者共用結果。
+
+    Args:
+        client: Gemini 客戶端
+        model: TTS 模型名稱
+        contents: 提示內容
+        config: GenerateContentConfig
+        use_cache: 是否使用合成快取
+
+    Returns:
+        PCM 音訊資料
+
+    Raises:
+        NoAudioError: API 回應中沒有音訊資料
+        retry_policy.CircuitOpenError: 斷路器開啟中
+    """
+    start_time = time.perf_counter()
+    key, cached = _cache_lookup(model, contents, config, use_cache)
+    if cached is not None:
+        _record_metrics(model, contents, config, start_time, len(cached),
+                        cached=True)
+        return cached
+
+    def attempt() -> bytes:
+        with rate_limiter.get_default_limiter().slot():
+            response = client.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config
+            )
+        return _audio_from_response(response, model, key)
+
+    leader = False
+    recached = False
+
+    def run() -> bytes:
+        nonlocal leader, recached
+        leader = True
+        cached = _recheck_cache(key)
+        if cached is not None:
+            recached = True
+            return cached
+        return retry_policy.get_default_policy().call(attempt)
+
+    try:
+        if key is None:
+            audio_data = run()
+        else:
+            audio_data = single_flight.get_default_flight().do(
+                ("synthesis", key), run
+            )
+    except Exception as e:
+        _record_metrics(model, contents, config, start_time, error=e)
+        raise
+    _record_metrics(model, contents, config, start_time, len(audio_data),
+                    cached=recached, shared=not leader)
+    return audio_data
+
+
+async def synthesize_async(client: Any, model: str, contents: Any,
+                           config: Any, use_cache: bool = True) -> bytes:
+    """synthesize 的非同步版本，使用 client.aio.models.generate_content"""
+    start_time = time.perf_counter()
+    key, cached = _cache_lookup(model, contents, config, use_cache)
+    if cached is not None:
+        _record_metrics(model, contents, config, start_time, len(cached),
+                        cached=True)
+        return cached
+
+    async def attempt() -> bytes:
+        async with rate_limiter.get_default_limiter().async_slot():
+            response = await client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config
+            )
+        return _audio_from_response(response, model, key)
+
+    leader = False
+    recached = False
+
+    async def run() -> bytes:
+        nonlocal leader, recached
+        leader = True
+        cached = _recheck_cache(key)
+        if cached is not None:
+            recached = True
+            return cached
+        return await retry_policy.get_default_policy().call_async(attempt)
+
+    try:
+        if key is None:
+            audio_data = await run()
+        else:
+            audio_data = await single_flight.get_default_flight().do_async(
+                ("synthesis", key), run
+            )
+    except (Exception, asyncio.CancelledError) as e:
+        # 引擎逾時會取消這個協程，同樣記錄下來
+        _record_metrics(model, contents, config, start_time, error=e)
+        raise
+    _record_metrics(model, contents, config, start_time, len(audio_data),
+                    cached=recached, shared=not leader)
+    return audio_data
+
+
+@dataclass
+class StreamStats:
+    """串流合成的統計資料"""
+    time_to_first_audio: Optional[float] = None
+    total_seconds: float = 0.0
+    chunks: int = 0
+    bytes: int = 0
+    cached: bool = False
+
+
+class _PartialStreamError(Exception):
+    """已交付部分音訊後發生的錯誤（不可重試）"""
+
+    def __init__(self, error: BaseException):
+        super().__init__(str(error))
+        self.error = error
+
+
+def synthesize_stream(client: Any, model: str, contents: Any, config: Any,
+                      on_chunk: Callable[[bytes], None],
+                      use_cache: bool = True) -> StreamStats:
+    """以 generate_content_stream 串流合成語音
+
+    每收到一段 PCM 資料就呼叫 on_chunk，讓呼叫端可以邊收邊寫檔或顯示進度。
+    尚未收到任何音訊前發生的暫時性錯誤會依重試策略重試；
+    已交付部分音訊後的錯誤則直接拋出，避免重複輸出。
+
+    Args:
+        client: Gemini 客戶端
+        model: TTS 模型名稱
+        contents: 提示內容
+        config: GenerateContentConfig
+        on_chunk: 收到 PCM 資料時的回呼
+        use_cache: 是否使用合成快取（命中時一次交付完整資料）
+
+    Returns:
+        StreamStats，包含首段音訊延遲（time_to_first_audio）
+
+    Raises:
+        NoAudioError: 串流結束時仍沒有任何音訊資料
+        retry_policy.CircuitOpenError: 斷路器開啟中
+    """
+    start_time = time.perf_counter()
+    stats = StreamStats()
+
+    key, cached = _cache_lookup(model, contents, config, use_cache)
+    if cached is not None:
+        on_chunk(cached)
+        stats.time_to_first_audio = time.perf_counter() - start_time
+        stats.total_seconds = stats.time_to_first_audio
+        stats.chunks = 1
+        stats.bytes = len(cached)
+        stats.cached = True
+        _record_metrics(model, contents, config, start_time, len(cached),
+                        cached=True,
+                        time_to_first_audio=stats.time_to_first_audio)
+        return stats
+
+    received: List[bytes] = []
+    mime_type = None
+
+    def attempt() -> None:
+        nonlocal mime_type
+        try:
+            with rate_limiter.get_default_limiter().slot():
+                for response in client.models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=config
+                ):
+                    part = extract_audio_part(response)
+                    if part is None:
+                        continue
+                    chunk = part.inline_data.data
+                    if mime_type is None:
+                        mime_type = part.inline_data.mime_type
+                        _remember_format(model, mime_type)
+                    if stats.time_to_first_audio is None:
+                        stats.time_to_first_audio = (
+                            time.perf_counter() - start_time
+                        )
+                    on_chunk(chunk)
+                    stats.chunks += 1
+                    stats.bytes += len(chunk)
+                    if key is not None:
+                        received.append(chunk)
+        except Exception as e:
+            if stats.chunks:
+                raise _PartialStreamError(e) from e
+            raise
+        if not stats.chunks:
+            raise NoAudioError("API 回應中沒有音訊資料")
+
+    try:
+        retry_policy.get_default_policy().call(attempt)
+    except _PartialStreamError as e:
+        _record_metrics(model, contents, config, start_time, error=e.error,
+                        time_to_first_audio=stats.time_to_first_audio)
+        raise e.error from None
+    except Exception as e:
+        _record_metrics(model, contents, config, start_time, error=e)
+        raise
+
+    if key is not None:
+        synthesis_cache.get_default_cache().put(
+            key, b"".join(received), mime_type
+        )
+    stats.total_seconds = time.perf_counter() - start_time
+    _record_metrics(model, contents, config, start_time, stats.bytes,
+                    time_to_first_audio=stats.time_to_first_audio)
+    return stats
@@ -4,8 +4,177 @@
 """
 
 import streamlit as st
+import base64
+import functools
 import os
-from typing import List, Callable, Dict, Tuple
+import wave
+from typing import List, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import background_preview_generator
+import preview_cache
+import preview_index
+import preview_encoding
+import preview_server
+
+# 預先提取時包含選擇的語音在選單中前後各幾個語音
+PREFETCH_NEIGHBOURS = 2
+
+
+def _load_preview(index: preview_index.PreviewIndex,
+                  cache: preview_cache.PreviewCache,
+                  voice_name: str, language: str) -> Optional[bytes]:
+    """從預覽快取或預覽索引讀取預覽音訊（精簡編碼），索引中沒有時返回 None
+
+    快取以索引項目為鍵，封裝檔重建或預覽重新生成後自然改用新的內容。
+    不使用 Streamlit 的工作階段狀態，因此也可以在預覽伺服器的執行緒中呼叫。
+    """
+    entry = index.get(voice_name, language)
+    if entry is None:
+        return None
+
+    audio_data = cache.get(entry)
+    if audio_data is not None:
+        return audio_data
+
+    data = index.read_entry(entry)
+    if data is None:
+        return None
+    if entry.offset is None:
+        # 個別檔案為原始 WAV，放入快取前先轉為精簡編碼
+        try:
+            audio_data = preview_encoding.encode_wav(bytes(data))
+        except (wave.Error, EOFError, ValueError):
+            audio_data = bytes(data)
+    else:
+        # 封裝檔已是精簡編碼；st.audio 只接受 bytes，只在放入快取時複製一次
+        audio_data = bytes(data)
+    cache.put(entry, audio_data)
+    return audio_data
+
+
+def _read_indexed_preview(voice_name: str, language: str) -> Optional[bytes]:
+    """讀取預覽音訊（先查伺服器共用的預覽快取），索引中沒有時返回 None"""
+    return _load_preview(preview_index.get_preview_index(),
+                         preview_cache.get_preview_cache(),
+                         voice_name, language)
+
+
+@st.cache_resource(show_spinner=False)
+def get_preview_server() -> Optional[preview_server.PreviewServer]:
+    """啟動伺服器共用的預覽音訊伺服器，未啟用或無法啟動時返回 None"""
+    port = preview_server.configured_port()
+    if port is None:
+        return None
+    loader = functools.partial(_load_preview,
+                               preview_index.get_preview_index(),
+                               preview_cache.get_preview_cache())
+    try:
+        return preview_server.PreviewServer(loader, port,
+                                            preview_server.configured_host())
+    except OSError as e:
+        print(f"無法啟動預覽伺服器（連接埠 {port}），改為內嵌音訊：{e}")
+        return None
+
+
+def _request_headers() -> Dict[str, str]:
+    try:
+        return dict(st.context.headers)
+    except Exception:
+        # 舊版 Streamlit 沒有 st.context
+        return {}
+
+
+def _preview_base_url(server: preview_server.PreviewServer) -> Optional[str]:
+    """瀏覽器連到預覽伺服器的網址，無法確定瀏覽器連得到時返回 None
+
+    經由反向代理或 HTTPS 提供服務時，以環境變數 GEMINI_TTS_PREVIEW_BASE_URL 指定對外網址；
+    未指定時使用網頁的主機名稱加上連接埠，但伺服器只監聽本機位址時
+    只有在本機開啟網頁才連得到。HTTPS 網頁會阻擋 http 的音訊（混合內容）。
+    """
+    headers = _request_headers()
+    base_url = os.getenv("GEMINI_TTS_PREVIEW_BASE_URL")
+    if not base_url:
+        host = urlsplit(f"//{headers.get('Host', '')}").hostname or "localhost"
+        if (server.host in preview_server.LOOPBACK_HOSTS
+                and host not in preview_server.LOOPBACK_HOSTS):
+            return None
+        base_url = f"http://{host}:{server.port}"
+    origin = headers.get("Origin", "")
+    if origin.startswith("https:") and not base_url.startswith("https:"):
+        return None
+    return base_url
+
+
+def _preview_source(voice_name: str, language: str, audio_data: bytes) -> str:
+    """預覽音訊的來源：預覽伺服器的網址（帶版本參數）
+
+    伺服器未啟用或瀏覽器連不到時為內嵌的 data URI
+    """
+    server = get_preview_server()
+    base_url = _preview_base_url(server) if server is not None else None
+    if base_url is None:
+        return _inline_source(audio_data)
+    return server.url(base_url, voice_name, language, audio_data)
+
+
+def _inline_source(audio_data: bytes) -> str:
+    """以 base64 內嵌音訊的 data URI"""
+    return f"data:audio/wav;base64,{base64.b64encode(audio_data).decode()}"
+
+
+def _generate_preview(voice_name: str, language: str, api_key: str,
+                      model_name: str, generate_func: Callable,
+                      save_func: Callable) -> Optional[bytes]:
+    """即時生成預覽並加入預覽索引，返回精簡編碼的音訊（失敗時返回 None）
+
+    多位使用者同時點擊同一個尚未生成的預覽時只發出一次 API 請求，
+    其餘的點擊等待並共用同一個結果。預覽寫入與背景生成服務相同的預覽目錄，
+    不會寫入目前的工作目錄。
+    """
+    index = preview_index.get_preview_index()
+    # 生成期間背景預覽生成服務不開始新的工作
+    with background_preview_generator.get_preview_generator().foreground():
+        entry = preview_index.generate_preview(
+            index, voice_name, language,
+            lambda: generate_func(api_key, voice_name, language, model_name),
+            save_func, pregenerated=True
+        )
+    if entry is None:
+        return None
+    return _read_indexed_preview(voice_name, language)
+
+
+def _prefetch_candidates(voice_options: List[str], voice_name: str,
+                         neighbours: int = PREFETCH_NEIGHBOURS) -> List[str]:
+    """最可能被點擊的語音：目前選擇的語音，以及選單中前後相鄰的語音（由近到遠）"""
+    position = voice_options.index(voice_name)
+    candidates = [voice_name]
+    for distance in range(1, neighbours + 1):
+        for i in (position + distance, position - distance):
+            if 0 <= i < len(voice_options):
+                candidates.append(voice_options[i])
+    return candidates
+
+
+def _prefetch_previews(voice_options: List[str], voice_name: str,
+                       language: str, api_key: str, model_name: str,
+                       save_func: Callable, key_suffix: str) -> None:
+    """請背景預覽生成服務優先生成最可能被點擊的預覽
+
+    只在選擇的語音或語言改變時提交；已存在的預覽不會重新生成。
+    """
+    if not api_key:
+        return
+    state_key = f"preview_prefetch_{key_suffix}"
+    if st.session_state.get(state_key) == (voice_name, language):
+        return
+    st.session_state[state_key] = (voice_name, language)
+
+    candidates = _prefetch_candidates(voice_options, voice_name)
+    background_preview_generator.get_preview_generator().request(
+        voice_options, [language], api_key, model_name, save_func,
+        prefetch=[(voice, language) for voice in candidates]
+    )
 
 
 def _play_preview_with_placeholder(
@@ -21,54 +190,46 @@ def _play_preview_with_placeholder(
     # 創建一個 placeholder 用於音訊播放器
     audio_placeholder = st.empty()
     
-    # 檢查預先生成的檔案
-    preview_dir = "voice_previews"
-    pregenerated_file = f"{preview_dir}/preview_{voice_name}_{language}.wav"
-    
-    # 優先使用預先生成的檔案
-    if os.path.exists(pregenerated_file):
-        # 直接播放預先生成的檔案
-        with open(pregenerated_file, 'rb') as f:
-            audio_data = f.read()
-        audio_placeholder.audio(audio_data, format='audio/wav')
-        return
-    
-    # 如果沒有預先生成的檔案，則使用原有的快取機制
-    preview_key = f"{voice_name}_{language}"
-    cache_file = f"preview_{preview_key}.wav"
-    
-    # 檢查記憶體快取
-    if 'voice_previews' not in st.session_state:
-        st.session_state.voice_previews = {}
-    
-    # 如果已有快取，直接播放
-    if preview_key in st.session_state.voice_previews:
+    # 從共用快取或預覽索引查找（預先生成的檔案優先）
+    audio_data = _read_indexed_preview(voice_name, language)
+    if audio_data:
         audio_placeholder.audio(
-            st.session_state.voice_previews[preview_key],
+            _preview_source(voice_name, language, audio_data),
             format='audio/wav'
         )
         return
     
-    # 檢查檔案快取
-    if os.path.exists(cache_file):
-        with open(cache_file, 'rb') as f:
-            audio_data = f.read()
-        st.session_state.voice_previews[preview_key] = audio_data
-        audio_placeholder.audio(audio_data, format='audio/wav')
-        return
-    
-    # 生成預覽（不顯示任何提示）
-    audio_data = generate_func(
-        api_key, voice_name, language, model_name
+    # 生成預覽（不顯示任何提示），儲存到檔案並更新索引與快取
+    audio_data = _generate_preview(
+        voice_name, language, api_key, model_name, generate_func, save_func
     )
     
     if audio_data:
-        # 儲存到檔案
-        save_func(cache_file, audio_data)
-        # 儲存到記憶體快取
-        st.session_state.voice_previews[preview_key] = audio_data
         # 在 placeholder 中播放音訊
-        audio_placeholder.audio(audio_data, format='audio/wav')
+        audio_placeholder.audio(
+            _preview_source(voice_name, language, audio_data),
+            format='audio/wav'
+        )
+
+
+def _autoplay_html(audio_key: str, source: str) -> str:
+    """建立自動播放預覽的 HTML（source 為網址或 data URI）"""
+    # 使用 HTML audio 元素並自動播放
+    return f"""
+    <audio id="{audio_key}" autoplay>
+        <source src="{source}" 
+                type="audio/wav">
+    </audio>
+    <script>
+        // 確保音訊播放
+        var audio = document.getElementById('{audio_key}');
+        if (audio) {{
+            audio.play().catch(function(error) {{
+                console.log('自動播放失敗:', error);
+            }});
+        }}
+    </script>
+    """
 
 
 def voice_selector_with_preview(
@@ -111,6 +272,10 @@ def voice_selector_with_preview(
             key=f"voice_select_{key_suffix}"
         )
     
+    # 在背景預先生成目前選擇的語音與相鄰語音的預覽，點擊時不需等待
+    _prefetch_previews(voice_options, voice_name, language, api_key,
+                       model_name, save_func, key_suffix)
+    
     with col2:
         # 使用更小的按鈕
         st.markdown("<div style='margin-top: 28px;'></div>",
@@ -121,62 +286,26 @@ def voice_selector_with_preview(
         audio_key = f"audio_{key_suffix}"
         
         if st.button("▶️", key=button_key, help=f"預覽 {voice_name} 的聲音"):
-            # 檢查預先生成的檔案
-            preview_dir = "voice_previews"
-            pregenerated_file = (
-                f"{preview_dir}/preview_{voice_name}_{language}.wav"
-            )
+            # 從共用快取或預覽索引查找（預先生成的檔案優先）
+            audio_data = _read_indexed_preview(voice_name, language)
             
-            audio_data = None
-            
-            # 優先使用預先生成的檔案
-            if os.path.exists(pregenerated_file):
-                with open(pregenerated_file, 'rb') as f:
-                    audio_data = f.read()
-            else:
-                # 如果沒有預先生成的檔案，則使用原有的快取機制
-                preview_key = f"{voice_name}_{language}"
-                cache_file = f"preview_{preview_key}.wav"
-                
-                # 檢查檔案快取
-                if os.path.exists(cache_file):
-                    with open(cache_file, 'rb') as f:
-                        audio_data = f.read()
-                else:
-                    # 需要生成預覽
-                    with st.spinner("生成中..."):
-                        audio_data = generate_func(
-                            api_key, voice_name, language, model_name
-                        )
-                        
-                        if audio_data:
-                            # 儲存到檔案
-                            save_func(cache_file, audio_data)
-                        else:
-                            st.error("生成預覽失敗")
+            if audio_data is None:
+                # 需要生成預覽
+                with st.spinner("生成中..."):
+                    # 儲存到檔案並更新索引與快取，以精簡編碼傳送到瀏覽器
+                    audio_data = _generate_preview(
+                        voice_name, language, api_key, model_name,
+                        generate_func, save_func
+                    )
+                    
+                    if not audio_data:
+                        st.error("生成預覽失敗")
             
             # 如果有音訊數據，使用 HTML 和 JavaScript 自動播放
             if audio_data:
-                import base64
-                audio_base64 = base64.b64encode(audio_data).decode()
-                
-                # 使用 HTML audio 元素並自動播放
-                audio_html = f"""
-                <audio id="{audio_key}" autoplay>
-                    <source src="data:audio/wav;base64,{audio_base64}" 
-                            type="audio/wav">
-                </audio>
-                <script>
-                    // 確保音訊播放
-                    var audio = document.getElementById('{audio_key}');
-                    if (audio) {{
-                        audio.play().catch(function(error) {{
-                            console.log('自動播放失敗:', error);
-                        }});
-                    }}
-                </script>
-                """
-                st.markdown(audio_html, unsafe_allow_html=True)
+                source = _preview_source(voice_name, language, audio_data)
+                st.markdown(_autoplay_html(audio_key, source),
+                            unsafe_allow_html=True)
     
     return voice_name
 
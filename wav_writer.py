@@ -0,0 +1,192 @@
+"""
+WAV 串流寫入模組
+以附加音框的方式逐段寫入 WAV 檔案：開檔時先寫入暫定的標頭，
+每累積一定位元組數就更新標頭並 fsync，關閉時修正 RIFF / data 大小；
+程式中斷留下的不完整檔案可用 recover_wav 修復為有效的 WAV 檔
+"""
+
+import os
+import struct
+from typing import BinaryIO, Optional
+
+# 標準 PCM WAV 標頭長度與各大小欄位的位置
+HEADER_SIZE = 44
+_RIFF_SIZE_OFFSET = 4
+_DATA_SIZE_OFFSET = 40
+
+# 預設每寫入 1 MB 同步一次到磁碟
+DEFAULT_SYNC_BYTES = 1024 * 1024
+
+
+def _build_header(channels: int, rate: int, sample_width: int,
+                  data_size: int) -> bytes:
+    block_align = channels * sample_width
+    return b"".join([
+        b"RIFF", struct.pack("<I", 36 + data_size), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, 1, channels, rate,
+                             rate * block_align, block_align,
+                             sample_width * 8),
+        b"data", struct.pack("<I", data_size),
+    ])
+
+
+class WavWriter:
+    """可逐段附加 PCM 音框的 WAV 寫入器
+
+    使用方式：
+        with WavWriter("out.wav") as writer:
+            for chunk in chunks:
+                writer.append_frames(chunk)
+    """
+
+    def __init__(self, filename: str, channels: int = 1, rate: int = 24000,
+                 sample_width: int = 2,
+                 sync_bytes: Optional[int] = DEFAULT_SYNC_BYTES):
+        """
+        Args:
+            filename: 輸出檔案路徑
+            channels: 聲道數
+            rate: 採樣率
+            sample_width: 每個樣本的位元組數
+            sync_bytes: 每累積多少位元組就更新標頭並 fsync（None 表示只在關閉時同步）
+        """
+        self.filename = filename
+        self.channels = channels
+        self.rate = rate
+        self.sample_width = sample_width
+        self.block_align = channels * sample_width
+        self.sync_bytes = sync_bytes
+        self.bytes_written = 0
+
+        self._file: Optional[BinaryIO] = open(filename, "wb")
+        self._pending = b""
+        self._unsynced = 0
+        self._file.write(_build_header(channels, rate, sample_width, 0))
+
+    @property
+    def frames_written(self) -> int:
+        return self.bytes_written // self.block_align
+
+    @property
+    def duration(self) -> float:
+        """已寫入的音訊長度（秒）"""
+        return self.frames_written / self.rate
+
+    def append_frames(self, data: bytes) -> None:
+        """附加 PCM 資料；不足一個音框的尾端會保留到下一次寫入"""
+        if self._file is None:
+            raise ValueError("WAV 檔案已關閉")
+        if self._pending:
+            data = self._pending + data
+        usable = len(data) - len(data) % self.block_align
+        self._pending = data[usable:]
+        if not usable:
+            return
+
+        self._file.write(data[:usable] if self._pending else data)
+        self.bytes_written += usable
+        self._unsynced += usable
+        if self.sync_bytes is not None and self._unsynced >= self.sync_bytes:
+            self.sync()
+
+    def _patch_sizes(self) -> None:
+        self._file.seek(_RIFF_SIZE_OFFSET)
+        self._file.write(struct.pack("<I", 36 + self.bytes_written))
+        self._file.seek(_DATA_SIZE_OFFSET)
+        self._file.write(struct.pack("<I", self.bytes_written))
+        self._file.seek(0, os.SEEK_END)
+
+    def sync(self) -> None:
+        """更新標頭中的大小並同步到磁碟，讓目前為止的內容成為有效的 WAV 檔"""
+        if self._file is None:
+            return
+        self._patch_sizes()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        """修正標頭並關閉檔案（不足一個音框的尾端會被捨棄）"""
+        if self._file is None:
+            return
+        try:
+            self.sync()
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "WavWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def write_wav_file(filename: str, pcm_data: bytes, channels: int = 1,
+                   rate: int = 24000, sample_width: int = 2) -> None:
+    """將完整的 PCM 資料寫成 WAV 檔案"""
+    with WavWriter(filename, channels, rate, sample_width,
+                   sync_bytes=None) as writer:
+        writer.append_frames(pcm_data)
+
+
+def recover_wav(filename: str) -> int:
+    """修復中斷寫入的 WAV 檔案
+
+    依實際檔案大小重新計算 RIFF / data 大小，並截掉不完整的音框。
+
+    Returns:
+        修復後的音框數
+
+    Raises:
+        ValueError: 檔案不是 PCM WAV 格式
+    """
+    with open(filename, "r+b") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"不是有效的 WAV 檔案：{filename}")
+
+        block_align = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"WAV 檔案缺少 data 區塊：{filename}")
+            chunk_id, chunk_size = chunk_header[:4], struct.unpack(
+                "<I", chunk_header[4:])[0]
+            if chunk_id == b"data":
+                break
+            chunk_data = f.read(chunk_size + chunk_size % 2)
+            if chunk_id == b"fmt ":
+                block_align = struct.unpack("<H", chunk_data[12:14])[0]
+
+        if not block_align:
+            raise ValueError(f"WAV 檔案缺少 fmt 區塊：{filename}")
+
+        data_offset = f.tell()
+        file_size = os.fstat(f.fileno()).st_size
+        data_size = file_size - data_offset
+        data_size -= data_size % block_align
+
+        f.truncate(data_offset + data_size)
+        f.seek(data_offset - 4)
+        f.write(struct.pack("<I", data_size))
+        f.seek(_RIFF_SIZE_OFFSET)
+        f.write(struct.pack("<I", data_offset + data_size - 8))
+        f.flush()
+        os.fsync(f.fileno())
+
+    return data_size // block_align
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法：python wav_writer.py <中斷的 WAV 檔案> [...]")
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        try:
+            frames = recover_wav(path)
+            print(f"✅ 已修復 {path}：{frames} 個音框")
+        except (OSError, ValueError) as e:
+            print(f"❌ 無法修復 {path}：{e}")